@@ -1,16 +1,30 @@
+import asyncio
 import logging
 import os
+import signal
+from collections import Counter
 
 from telegram import Update
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
+    Job,
     CommandHandler,
     CallbackQueryHandler,
 )
 
 from src.config.config import ConfigurationProvider
+from src.config.messaging_config import MessagingConfig
+from src.config.instrumentation_config import InstrumentationConfig
+from src.config.update_config import UpdateConfig
+from src.config.webhook_config import WebhookConfig
 from src.handlers.error_handler import error_handler
-from src.repository.initialize import initialize_database
+from src.repository.cached_user_repository import CachedUserRepository
+from src.repository.initialize import (
+    create_repository_executor,
+    initialize_database,
+    initialize_state_database,
+)
 from src.handlers.record_handlers import (
     record_handler,
     button,
@@ -19,8 +33,16 @@ from src.handlers.record_handlers import (
 )
 from src.handlers.user_handlers import create_user, toggle_auto_baseline
 from src.handlers.graphing import graph_handler
+from src.handlers.metrics_handlers import precompute_keyboards
+from src.instrumentation import REGISTRY, instrument_handler, instrument_job_queue
+from src.message_dispatcher import MessageDispatcher
 from src.notifier import Notifier
+from src.rate_limiter import RateLimiter
+from src.service.graph_service import GraphService
 from src.service.user_service import UserService
+from src.state import InMemoryStateStore, StateStore, initialize_state_stores
+from src.update_processor import PerUserUpdateProcessor
+from src.webhook_server import MetricsServer, WebhookServer
 
 TOKEN = os.environ.get("TELEGRAM_TOKEN")
 logging.basicConfig(
@@ -35,33 +57,199 @@ class MoodTrackerApplication:
     Contains and managed the Telegram Application as well as a Notifier.
     """
 
-    def __init__(self, api_token):
-        self.application = ApplicationBuilder().token(api_token).build()
+    def __init__(
+        self,
+        api_token,
+        messaging: MessagingConfig = MessagingConfig(),
+        webhook: WebhookConfig = WebhookConfig(),
+        updates: UpdateConfig = UpdateConfig(),
+        instrumentation: InstrumentationConfig = InstrumentationConfig(),
+    ):
+        self.webhook = webhook
+        self.metrics_server = (
+            MetricsServer(instrumentation) if instrumentation.enabled else None
+        )
+        self.update_processor = PerUserUpdateProcessor(updates.concurrent_updates)
+        self.application = (
+            ApplicationBuilder()
+            .token(api_token)
+            .concurrent_updates(self.update_processor)
+            .post_init(self.start_metrics_server)
+            .post_stop(self.stop_metrics_server)
+            .build()
+        )
         self.initialize_handlers()
-        self.initialize_notifier()
+        self.initialize_notifier(messaging)
 
-    def initialize_notifier(self):
-        notifier = Notifier(self.application.job_queue)
-        notifier.register()
+    def initialize_notifier(self, messaging: MessagingConfig):
+        message_dispatcher = MessageDispatcher(
+            rate_limiter=RateLimiter(
+                messaging.messages_per_second,
+                messaging.per_chat_interval_seconds,
+                messaging.per_chat_burst,
+            ),
+            workers=messaging.max_concurrent_sends,
+            bulk_workers=messaging.max_concurrent_bulk_sends,
+            max_attempts=messaging.max_attempts,
+            backoff_seconds=messaging.backoff_seconds,
+            max_backoff_seconds=messaging.max_backoff_seconds,
+        ).register()
+        self.notifier = Notifier(
+            self.application.job_queue, message_dispatcher=message_dispatcher
+        ).register()
+        self.message_dispatcher = message_dispatcher
+        instrument_job_queue(self.application.job_queue)
 
     def initialize_handlers(self):
         """
         App entrypoint. Defines handlers, schedules reminders.
         :return:
         """
-        self.application.add_handler(CommandHandler("start", create_user))
-        self.application.add_handler(CommandHandler("graph", graph_handler))
-        self.application.add_handler(CommandHandler("record", record_handler))
-        self.application.add_handler(CommandHandler("baseline", baseline_handler))
+        commands = {
+            "start": create_user,
+            "graph": graph_handler,
+            "record": record_handler,
+            "baseline": baseline_handler,
+            "auto_baseline": toggle_auto_baseline,
+            "offset": offset_handler,
+        }
+        # handlers are instrumented, so that their latency is exposed as metrics
+        for command, callback in commands.items():
+            self.application.add_handler(
+                CommandHandler(command, instrument_handler(command, callback))
+            )
+        self.application.add_error_handler(error_handler)
         self.application.add_handler(
-            CommandHandler("auto_baseline", toggle_auto_baseline)
+            CallbackQueryHandler(instrument_handler("button", button))
         )
-        self.application.add_handler(CommandHandler("offset", offset_handler))
-        self.application.add_error_handler(error_handler)
-        self.application.add_handler(CallbackQueryHandler(button))
+
+    def register_metrics(
+        self, state_stores: dict[str, StateStore], caches: dict[str, object]
+    ):
+        """
+        Exposes the state of the application as metrics, which are collected whenever they are scraped.
+        :param state_stores: conversation state stores by name, e.g. temp_records. Only the entries of in-memory stores
+        are counted, since counting the entries of a database would query it on every scrape.
+        :param caches: objects with hit and miss statistics by name, e.g. the graph cache.
+        """
+        dispatcher = self.message_dispatcher
+        REGISTRY.counter_callback(
+            "mood_tracker_messages_sent_total",
+            "Number of messages sent to Telegram.",
+            lambda: dispatcher.sent,
+        )
+        REGISTRY.counter_callback(
+            "mood_tracker_messages_failed_total",
+            "Number of messages that could not be sent within the maximum number of attempts.",
+            lambda: dispatcher.failed,
+        )
+        REGISTRY.counter_callback(
+            "mood_tracker_message_retries_total",
+            "Number of retried attempts to send a message, e.g. after a timeout or flood control.",
+            lambda: dispatcher.retries,
+        )
+        REGISTRY.gauge_callback(
+            "mood_tracker_message_queue_depth",
+            "Number of messages waiting to be sent, per lane.",
+            lambda: [
+                ({"lane": "interactive"}, dispatcher.interactive.queue.qsize()),
+                ({"lane": "bulk"}, dispatcher.bulk.queue.qsize()),
+            ],
+        )
+        REGISTRY.gauge_callback(
+            "mood_tracker_scheduled_jobs",
+            "Number of scheduled jobs, per kind of job.",
+            lambda: count_jobs(self.notifier.jobs),
+        )
+        REGISTRY.gauge_callback(
+            "mood_tracker_job_subscriptions",
+            "Number of users subscribed to a time slot, per kind of job.",
+            lambda: [
+                (
+                    {"job": "reminders"},
+                    sum(map(len, self.notifier.notification_slots.values())),
+                ),
+                (
+                    {"job": "baselines"},
+                    sum(map(len, self.notifier.auto_baseline_slots.values())),
+                ),
+            ],
+        )
+        REGISTRY.gauge_callback(
+            "mood_tracker_users_with_pending_updates",
+            "Number of users whose updates are being processed or waiting to be processed.",
+            lambda: len(self.update_processor.locks),
+        )
+        memory_stores = {
+            name: store
+            for name, store in state_stores.items()
+            if isinstance(store, InMemoryStateStore)
+        }
+        REGISTRY.gauge_callback(
+            "mood_tracker_state_entries",
+            "Number of users with conversation state, per in-memory state store.",
+            lambda: [
+                ({"store": name}, len(store)) for name, store in memory_stores.items()
+            ],
+        )
+        for statistic in ("hits", "misses"):
+            REGISTRY.counter_callback(
+                f"mood_tracker_cache_{statistic}_total",
+                f"Number of cache {statistic}, per cache.",
+                lambda statistic=statistic: [
+                    ({"cache": name}, cache.statistics()[statistic])
+                    for name, cache in caches.items()
+                ],
+            )
+
+    async def start_metrics_server(self, _: Application):
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+
+    async def stop_metrics_server(self, _: Application):
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
 
     def run(self):
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if self.webhook.enabled:
+            # the job queue is bound to this loop, so the webhook has to run on it, just like run_polling does
+            asyncio.get_event_loop().run_until_complete(self.run_webhook())
+        else:
+            self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+    async def run_webhook(self):
+        """
+        Registers the webhook with Telegram and serves it until SIGINT or SIGTERM is received.
+        """
+        server = WebhookServer(self.application, self.webhook)
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for stop_signal in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(stop_signal, stopped.set)
+        async with self.application:
+            await self.application.bot.set_webhook(
+                self.webhook.webhook_url,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=self.webhook.max_connections,
+                secret_token=self.webhook.secret_token,
+            )
+            await self.application.start()
+            await server.start()
+            await self.start_metrics_server(self.application)
+            try:
+                await stopped.wait()
+            finally:
+                await self.stop_metrics_server(self.application)
+                await server.stop()
+                await self.application.stop()
+
+
+def count_jobs(jobs: dict[str, Job]) -> list[tuple[dict[str, str], int]]:
+    """
+    Counts jobs by kind, e.g. reminders or baselines, since their names include the time of day.
+    """
+    kinds = Counter(name.split("_")[0] for name in jobs)
+    return [({"job": kind}, count) for kind, count in kinds.items()]
 
 
 def initialize_application() -> MoodTrackerApplication:
@@ -74,14 +262,35 @@ def initialize_application() -> MoodTrackerApplication:
     # Load and register configuration object
     config_path = os.environ.get("CONFIG_PATH", "config.yaml")
     configuration = ConfigurationProvider(config_path).get_configuration().register()
-    initialize_database(configuration)
+    # the repositories and the state stores share the threads for their blocking database calls
+    executor = create_repository_executor(configuration.database.thread_pool_size)
+    user_repository, _ = initialize_database(configuration, executor)
+    application_state, temp_records = initialize_state_stores(
+        configuration.state, initialize_state_database(configuration), executor
+    )
+    precompute_keyboards(configuration.get_metrics())
 
-    application = MoodTrackerApplication(TOKEN)
+    application = MoodTrackerApplication(
+        TOKEN,
+        configuration.messaging,
+        configuration.webhook,
+        configuration.updates,
+        configuration.instrumentation,
+    )
 
     # The Notifier, which is required by the UserService, is now initialized
     user_service = UserService().register()
-    user_service.schedule_auto_baselines()
-    user_service.schedule_notifications()
+    user_service.schedule_jobs()
+
+    graph_service = GraphService().register()
+
+    caches = {"graphs": graph_service.cache}
+    if isinstance(user_repository, CachedUserRepository):
+        caches["users"] = user_repository
+    application.register_metrics(
+        {"application_state": application_state, "temp_records": temp_records},
+        caches,
+    )
 
     return application
 
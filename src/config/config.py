@@ -8,6 +8,13 @@ from pyautowire import Injectable
 from src.config.auto_baseline import AutoBaselineConfig
 from src.config.config_metric import ConfigMetric
 from src.config.db_config import DatabaseConfig
+from src.config.graphing_config import GraphingConfig
+from src.config.messaging_config import MessagingConfig
+from src.config.instrumentation_config import InstrumentationConfig
+from src.config.recording_config import RecordingConfig
+from src.config.state_config import StateConfig
+from src.config.update_config import UpdateConfig
+from src.config.webhook_config import WebhookConfig
 
 from src.model.metric import Metric
 from src.model.notification import Notification
@@ -18,6 +25,15 @@ class Configuration(BaseModel, Injectable):
     notifications: list[Notification] = []
     auto_baseline: AutoBaselineConfig = Field(default_factory=AutoBaselineConfig)
     database: DatabaseConfig = Field(default_factory=DatabaseConfig)
+    graphing: GraphingConfig = Field(default_factory=GraphingConfig)
+    messaging: MessagingConfig = Field(default_factory=MessagingConfig)
+    state: StateConfig = Field(default_factory=StateConfig)
+    recording: RecordingConfig = Field(default_factory=RecordingConfig)
+    webhook: WebhookConfig = Field(default_factory=WebhookConfig)
+    updates: UpdateConfig = Field(default_factory=UpdateConfig)
+    instrumentation: InstrumentationConfig = Field(
+        default_factory=InstrumentationConfig
+    )
 
     def get_metrics(self) -> list[Metric]:
         return [Metric(**metric.model_dump()) for metric in self.metrics]
@@ -33,6 +49,11 @@ class Configuration(BaseModel, Injectable):
             # check that baselines are defined for all metrics
             for metric in self.metrics:
                 assert metric.baseline is not None
+        if (
+            self.state.backend in ["mongodb", "dynamodb"]
+            and self.state.backend != self.database.type
+        ):
+            raise ValueError("State can only be stored in the configured database")
 
 
 class ConfigurationProvider:
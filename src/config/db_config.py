@@ -1,11 +1,24 @@
 from typing import Any
 
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
+
+
+class UserCacheConfig(BaseModel):
+    """
+    Configuration for the in-process cache in front of the user repository.
+    """
+
+    enabled: bool = True
+    max_size: int = 1024
+    ttl_seconds: int = 300
 
 
 class DatabaseConfig(BaseModel):
     type: str = "mongodb"
     aws_region: str | None = None
+    # number of threads on which blocking database calls are run
+    thread_pool_size: int = 8
+    user_cache: UserCacheConfig = Field(default_factory=UserCacheConfig)
 
     @field_validator("type")
     @classmethod
@@ -0,0 +1,28 @@
+from pydantic import BaseModel, field_validator
+
+
+class GraphingConfig(BaseModel):
+    """
+    Configuration for rendering graphs.
+    """
+
+    # number of processes that render graphs in parallel
+    process_pool_size: int = 2
+    # maximum number of rendered graphs that are kept in memory
+    cache_size: int = 256
+    image_format: str = "png"
+    dpi: int = 100
+
+    @field_validator("process_pool_size")
+    @classmethod
+    def validate_process_pool_size(cls, value: int):
+        if value < 1:
+            raise ValueError("Process pool size must be at least 1")
+        return value
+
+    @field_validator("image_format")
+    @classmethod
+    def validate_image_format(cls, value: str):
+        if value not in ["png", "jpg", "jpeg", "webp"]:
+            raise ValueError("Image format must be one of png, jpg, jpeg or webp")
+        return value
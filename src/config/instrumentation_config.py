@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+
+
+class InstrumentationConfig(BaseModel):
+    """
+    Configuration for exposing metrics in the Prometheus text format on a local HTTP endpoint.
+    """
+
+    enabled: bool = False
+    listen: str = "0.0.0.0"
+    port: int = 9090
+    path: str = "/metrics"
@@ -0,0 +1,38 @@
+from pydantic import BaseModel, field_validator
+
+
+class MessagingConfig(BaseModel):
+    """
+    Configuration for sending messages to many users at once, e.g. reminders.
+    The defaults stay below Telegram's limits of roughly 30 messages per second overall
+    and one message per second per chat.
+    """
+
+    messages_per_second: float = 25
+    per_chat_interval_seconds: float = 1.0
+    # number of messages to a chat that are sent without waiting for the per-chat interval
+    per_chat_burst: int = 3
+    # number of replies to users that are sent concurrently
+    max_concurrent_sends: int = 16
+    # number of messages of scheduled jobs, e.g. reminders, that are sent concurrently. Replies wait for at most
+    # this many of them, so it is kept small
+    max_concurrent_bulk_sends: int = 4
+    # failed sends are retried with exponential backoff and jitter, starting at backoff_seconds
+    max_attempts: int = 3
+    backoff_seconds: float = 1.0
+    max_backoff_seconds: float = 30.0
+
+    @field_validator(
+        "messages_per_second",
+        "max_concurrent_sends",
+        "max_concurrent_bulk_sends",
+        "max_attempts",
+        "per_chat_burst",
+    )
+    @classmethod
+    def validate_positive(cls, value: float):
+        if value <= 0:
+            raise ValueError(
+                "Messaging rate, concurrency and attempts must be positive"
+            )
+        return value
@@ -0,0 +1,21 @@
+from pydantic import BaseModel, field_validator
+
+
+class RecordingConfig(BaseModel):
+    """
+    Configuration for the /record dialog.
+    """
+
+    # messages: every metric is prompted in a new message
+    # compact: the record is entered in a single message, which is edited in place as metrics are answered
+    mode: str = "messages"
+
+    @field_validator("mode")
+    @classmethod
+    def validate_mode(cls, value: str):
+        if value not in ["messages", "compact"]:
+            raise ValueError("Recording mode must be either messages or compact")
+        return value
+
+    def is_compact(self) -> bool:
+        return self.mode == "compact"
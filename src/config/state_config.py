@@ -0,0 +1,32 @@
+from pydantic import BaseModel, field_validator
+
+
+class StateConfig(BaseModel):
+    """
+    Configuration for the conversation state, i.e. which users are recording or graphing
+    and their unfinished records.
+    """
+
+    # memory: state is local to the process; sqlite: state is shared by all processes on one host using the same file;
+    # mongodb or dynamodb: state is shared by all replicas and stored in the configured database
+    backend: str = "memory"
+    # maximum number of users with conversation state in memory
+    max_size: int = 10_000
+    ttl_seconds: int = 300
+    sqlite_path: str = "state.db"
+
+    @field_validator("backend")
+    @classmethod
+    def validate_backend(cls, value: str):
+        if value not in ["memory", "sqlite", "mongodb", "dynamodb"]:
+            raise ValueError(
+                "State backend must be either memory, sqlite, mongodb or dynamodb"
+            )
+        return value
+
+    @field_validator("max_size", "ttl_seconds")
+    @classmethod
+    def validate_positive(cls, value: int):
+        if value < 1:
+            raise ValueError("State size and TTL must be at least 1")
+        return value
@@ -0,0 +1,18 @@
+from pydantic import BaseModel, field_validator
+
+
+class UpdateConfig(BaseModel):
+    """
+    Configuration for processing incoming updates.
+    Updates of different users are processed concurrently, updates of the same user in the order they were received.
+    """
+
+    # maximum number of updates processed concurrently across all users
+    concurrent_updates: int = 16
+
+    @field_validator("concurrent_updates")
+    @classmethod
+    def validate_concurrent_updates(cls, value: int):
+        if value < 1:
+            raise ValueError("Concurrent updates must be at least 1")
+        return value
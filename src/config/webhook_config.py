@@ -0,0 +1,33 @@
+from typing import Any
+
+from pydantic import BaseModel, field_validator
+
+
+class WebhookConfig(BaseModel):
+    """
+    Configuration for receiving updates via webhook instead of polling.
+    Telegram posts updates to webhook_url, which has to be forwarded (e.g. by a load balancer)
+    to the local HTTP server listening on listen:port/url_path.
+    """
+
+    enabled: bool = False
+    # public HTTPS URL under which Telegram reaches the webhook, e.g. https://example.com/webhook
+    webhook_url: str | None = None
+    listen: str = "0.0.0.0"
+    port: int = 8080
+    url_path: str = "webhook"
+    # Telegram sends this token in every request, so that posts by anyone else are rejected
+    secret_token: str | None = None
+    # maximum number of connections Telegram opens to deliver updates
+    max_connections: int = 40
+
+    @field_validator("max_connections")
+    @classmethod
+    def validate_max_connections(cls, value: int):
+        if not 1 <= value <= 100:
+            raise ValueError("Webhook max_connections must be between 1 and 100")
+        return value
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.enabled and not self.webhook_url:
+            raise ValueError("A webhook_url is required when the webhook is enabled")
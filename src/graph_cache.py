@@ -0,0 +1,119 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from src.model.daily_rollup import DailyRollup
+from src.model.metric import Metric
+
+"""
+Cache for rendered graphs.
+Graphs are keyed on the user, the month and the user's metric configuration. Every entry additionally stores a
+fingerprint of the underlying records, so that a graph is only served from the cache if its data has not changed
+since it was rendered. Closed past months therefore never have to be rendered twice.
+"""
+
+
+@dataclass(frozen=True)
+class GraphKey:
+    user_id: int
+    year: int
+    month: int
+    metrics_hash: str
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    record_count: int
+    latest_timestamp: str
+
+
+@dataclass
+class CachedGraph:
+    fingerprint: Fingerprint
+    graph: bytes
+
+
+def hash_metrics(metrics: list[Metric]) -> str:
+    """
+    :return: a short hash of a metric configuration, which changes whenever any metric definition changes.
+    """
+    serialized = json.dumps([metric.model_dump() for metric in metrics])
+    return hashlib.sha256(serialized.encode()).hexdigest()[:12]
+
+
+def fingerprint_rollups(
+    rollups: list[DailyRollup],
+) -> dict[tuple[int, int], Fingerprint]:
+    """
+    Calculates a fingerprint of the records per month from their daily rollups.
+    The record count and the latest timestamp change whenever a record is added to a month. Records are not
+    updated in place, but a record replaced by another one with the same timestamp, e.g. by a bulk write,
+    leaves the fingerprint unchanged, so the graph rendered from the replaced record is served until it is evicted.
+    :param rollups: daily rollups spanning one or more months.
+    :return: fingerprints keyed on (year, month); months without records are omitted.
+    """
+    counts = {}
+    latest = {}
+    for rollup in rollups:
+        month = (rollup.date.year, rollup.date.month)
+        counts[month] = counts.get(month, 0) + rollup.record_count
+        if month not in latest or rollup.latest_timestamp > latest[month]:
+            latest[month] = rollup.latest_timestamp
+    return {
+        month: Fingerprint(counts[month], latest[month].isoformat()) for month in counts
+    }
+
+
+class GraphCache:
+    """
+    In-memory LRU cache of rendered graphs. Memory usage is bounded by evicting the least recently used graphs.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[GraphKey, CachedGraph] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: GraphKey, fingerprint: Fingerprint) -> bytes | None:
+        """
+        Retrieves a graph if it has been rendered from the same records.
+        :param key: the user, month and metric configuration of the graph.
+        :param fingerprint: fingerprint of the records the graph should be rendered from.
+        :return: the cached graph, or None if it has to be rendered.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.fingerprint == fingerprint:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry.graph
+            self.misses += 1
+            return None
+
+    def put(self, key: GraphKey, fingerprint: Fingerprint, graph: bytes) -> None:
+        """
+        Adds a rendered graph to the cache, evicting the least recently used graphs if the cache is full.
+        """
+        with self.lock:
+            self.entries[key] = CachedGraph(fingerprint, graph)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def statistics(self) -> dict:
+        """
+        :return: hit and miss counters, the hit rate, the current number of cached graphs and their total size.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.entries),
+                "size_bytes": sum(len(entry.graph) for entry in self.entries.values()),
+            }
@@ -3,20 +3,33 @@ import datetime
 from pyautowire import autowire
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 
-from src.repository.user_repository import UserRepository
-from src.state import State, APPLICATION_STATE
-from src.visualise import visualize, Month
+from src.handlers.util import send, send_photo
+from src.repository.async_repository import AsyncUserRepository
+from src.service.graph_service import GraphService
+from src.state import AsyncStateStore, State
+from src.visualise import Month
+
+# the keyboard is immutable, so it is shared by all /graph prompts
+GRAPHING_KEYBOARD = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("Last month", callback_data="1")],
+        [InlineKeyboardButton("Last three months", callback_data="3")],
+        [InlineKeyboardButton("All time", callback_data="12")],
+    ]
+)
 
 
-@autowire("user_repository")
+@autowire("async_user_repository", "graph_service")
 async def handle_graph_specification(
-    update, user_repository: UserRepository
-) -> list[str]:
+    update, async_user_repository: AsyncUserRepository, graph_service: GraphService
+) -> list[bytes]:
     """
     Button handler to determine the timeframe for the graph.
-    :param user_repository: autowired.
+    Graphs are sent to the user as soon as they have been rendered.
+    :param async_user_repository: autowired.
+    :param graph_service: autowired.
     :param update: button press.
-    :return: None
+    :return: the graphs that were sent to the user.
     """
     # await timeframe specification
     query = update.callback_query
@@ -29,18 +42,14 @@ async def handle_graph_specification(
     months = get_month_tuples_for_time_range(time_range)
 
     # Get user data to access their metrics configuration
-    user = user_repository.find_user(update.effective_user.id)
+    user = await async_user_repository.find_user(update.effective_user.id)
 
-    paths = []
+    graphs = []
     # create graphs for all months
-    for month in months:
-        path = visualize(user, month)
-        paths.append(path)
-        if path:
-            await update.effective_user.get_bot().send_photo(
-                update.effective_user.id, open(path, "rb")
-            )
-    return paths
+    async for graph in graph_service.render(user, months):
+        graphs.append(graph)
+        await send_photo(update, graph)
+    return graphs
 
 
 def get_month_tuples_for_time_range(
@@ -69,21 +78,17 @@ def get_month_tuples_for_time_range(
     return months
 
 
-async def graph_handler(update: Update, context) -> None:
+@autowire("async_application_state")
+async def graph_handler(
+    update: Update, context, async_application_state: AsyncStateStore
+) -> None:
     await handle_graphing_dialog(update, context)
-    APPLICATION_STATE[update.effective_user.id] = State.GRAPHING
+    await async_application_state.set(update.effective_user.id, State.GRAPHING)
 
 
 async def handle_graphing_dialog(update: Update, _) -> None:
-    bot = update.effective_user.get_bot()
-    keyboard = [
-        [InlineKeyboardButton("Last month", callback_data="1")],
-        [InlineKeyboardButton("Last three months", callback_data="3")],
-        [InlineKeyboardButton("All time", callback_data="12")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await bot.send_message(
-        chat_id=update.effective_user.id,
-        text="How many months would you like me to graph?",
-        reply_markup=reply_markup,
+    await send(
+        update,
+        "How many months would you like me to graph?",
+        reply_markup=GRAPHING_KEYBOARD,
     )
@@ -1,7 +1,13 @@
+from functools import lru_cache
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 
+from src.handlers.util import edit, send
 from src.model.metric import Metric
 
+# number of distinct metric definitions for which keyboards are kept
+KEYBOARD_CACHE_SIZE = 1024
+
 
 async def prompt_user_for_metric(update: Update, metric: Metric) -> None:
     """
@@ -10,19 +16,49 @@ async def prompt_user_for_metric(update: Update, metric: Metric) -> None:
     :param metric: Metric object
     :return:
     """
-    bot = update.effective_user.get_bot()
+    await send(update, metric.user_prompt, reply_markup=metric_keyboard(metric))
+
+
+async def edit_prompt_for_metric(update: Update, metric: Metric) -> None:
+    """
+    Replaces the prompt whose button was pressed with the prompt for the next metric,
+    so that a record is entered in a single message.
+    :param update: Telegram Update object of the button press
+    :param metric: Metric object
+    :return:
+    """
+    await edit(update, metric.user_prompt, reply_markup=metric_keyboard(metric))
+
+
+def metric_keyboard(metric: Metric) -> InlineKeyboardMarkup:
+    """
+    Returns the keyboard for a metric. Keyboards are immutable, so the same keyboard is shared by all prompts
+    for metrics with the same name and values, e.g. the default metrics of all users.
+    :param metric: Metric object
+    :return: the cached keyboard.
+    """
+    return build_metric_keyboard(metric.name, tuple(metric.values.items()))
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def build_metric_keyboard(
+    name: str, values: tuple[tuple[str, int], ...]
+) -> InlineKeyboardMarkup:
     keyboard = [
         [
             InlineKeyboardButton(
                 key.capitalize().replace("_", " "),
-                callback_data=f"{metric.name}:{value}",
+                callback_data=f"{name}:{value}",
             )
         ]
-        for key, value in metric.values.items()
+        for key, value in values
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await bot.send_message(
-        chat_id=update.effective_user.id,
-        text=metric.user_prompt,
-        reply_markup=reply_markup,
-    )
+    return InlineKeyboardMarkup(keyboard)
+
+
+def precompute_keyboards(metrics: list[Metric]) -> None:
+    """
+    Builds the keyboards of the configured default metrics ahead of the first prompt.
+    """
+    for metric in metrics:
+        metric_keyboard(metric)
@@ -1,72 +1,86 @@
 import datetime
 import logging
 
-from expiringdict import ExpiringDict
 from telegram import Update
 
 from src.model.user import User
-from src.repository.record_repository import RecordRepository
 from pyautowire import autowire
 from src.handlers.graphing import handle_graph_specification
-from src.handlers.metrics_handlers import prompt_user_for_metric
-from src.handlers.util import send, handle_no_known_state
+from src.config.config import Configuration
+from src.handlers.metrics_handlers import (
+    edit_prompt_for_metric,
+    prompt_user_for_metric,
+)
+from src.handlers.util import edit, send, handle_no_known_state
 from src.model.record import TempRecord
-from src.repository.user_repository import UserRepository
-from src.state import State, APPLICATION_STATE
+from src.repository.async_repository import AsyncUserRepository, AsyncRecordRepository
+from src.state import AsyncStateStore, State
 
 """
-The temp_records data structures holds unfinished records for up to five minutes while users are creating them.
+The temp_records state store holds unfinished records for up to five minutes while users are creating them.
 This is a key-value data structure, with the keys being the user id and the value being exactly one temporary record.
 """
-temp_records = ExpiringDict(max_len=100, max_age_seconds=300)
 
+RECORD_COMPLETED_MESSAGE = "Record completed. Thank you!"
 
-def get_temp_record(user_id: int) -> TempRecord | None:
+
+@autowire("async_temp_records")
+async def get_temp_record(
+    user_id: int, async_temp_records: AsyncStateStore
+) -> TempRecord | None:
     """
     Utility method to make typing easier when accessing the temp_records structure
     :param user_id: user_id for which to retrieve temporary record
     :return: TempRecord if available, else None
     """
-    return temp_records.get(user_id)
+    return await async_temp_records.get(user_id)
 
 
-@autowire("user_repository")
-def create_temporary_record(user_id: int, user_repository: UserRepository):
+@autowire("async_user_repository", "async_temp_records", "async_application_state")
+async def create_temporary_record(
+    user_id: int,
+    async_user_repository: AsyncUserRepository,
+    async_temp_records: AsyncStateStore,
+    async_application_state: AsyncStateStore,
+):
     """
     Creates a new record for the user with the given user_id.
     Additionally, updates the state map to move through the questions easier.
-    :param user_repository: autowired.
+    :param async_user_repository: autowired.
     :param user_id:
     """
     # Create temporary record from user configuration
     # todo handle find_user() == None?
-    logging.info("Using user repository to find user: %s", user_repository)
-    metrics = user_repository.find_user(user_id).metrics
+    metrics = (await async_user_repository.find_user(user_id)).metrics
     record = TempRecord(metrics)
 
     logging.info(f"Creating temporary record for user {user_id}: {record}")
-    # Store temporary record in the record ExpiringDict
-    temp_records[user_id] = record
-    APPLICATION_STATE[user_id] = State.RECORDING
+    # Store temporary record in the state store
+    await async_temp_records.set(user_id, record)
+    await async_application_state.set(user_id, State.RECORDING)
 
 
-async def record_handler(update: Update, _) -> None:
+@autowire("configuration")
+async def record_handler(update: Update, _, configuration: Configuration) -> None:
     """
     Handles /record.
     Handles the recording process for the user. If /record is processed, it will start the recording process.
     Otherwise, it will send out metric user prompts. The responses to those prompts are then handled by dedicated
     button handlers, which ultimately redirect back to this function after handling their own logic.
+    :param configuration: autowired.
     """
     user_id = update.effective_user.id
     # if no record exists in the temporary records
-    if not temp_records.get(user_id):
-        await send(update, text="Creating a new record for you ...")
-        create_temporary_record(user_id)
+    temp_record = await get_temp_record(user_id)
+    if not temp_record:
+        # in compact mode, the prompt of the first metric is the only new message of the dialog
+        if not configuration.recording.is_compact():
+            await send(update, text="Creating a new record for you ...")
+        await create_temporary_record(user_id)
         # Recurse to start the record entry process
         await record_handler(update, None)
     else:
         # find the first metric for which the record value is still None
-        temp_record = get_temp_record(user_id)
         next_unanswered_metric = temp_record.next_unanswered_metric()
 
         logging.info(f"collecting information on metric {next_unanswered_metric}")
@@ -74,14 +88,15 @@ async def record_handler(update: Update, _) -> None:
         await prompt_user_for_metric(update, next_unanswered_metric)
 
 
-async def button(update: Update, _) -> None:
+@autowire("async_application_state")
+async def button(update: Update, _, async_application_state: AsyncStateStore) -> None:
     """
     General button handler.
     Disambiguates between different states and forwards the query to the appropriate handler.
     :param update: Button press.
     """
     user = update.effective_user.id
-    user_state = APPLICATION_STATE.get(user)
+    user_state = await async_application_state.get(user)
     if user_state is State.GRAPHING:
         await handle_graph_specification(update)
     if user_state is State.RECORDING:
@@ -90,7 +105,10 @@ async def button(update: Update, _) -> None:
         await handle_no_known_state(update)
 
 
-async def handle_record_entry(update: Update) -> None:
+@autowire("async_temp_records", "configuration")
+async def handle_record_entry(
+    update: Update, async_temp_records: AsyncStateStore, configuration: Configuration
+) -> None:
     """
     When a button update is received while the user is recording a record, this function is called.
     It represents the entering of a piece of record data, e.g. mood or sleep.
@@ -101,6 +119,7 @@ async def handle_record_entry(update: Update) -> None:
     This mechanism of figuring out which metric has been answered is a bit convoluted, but ultimately the only way
     to do it if you want to be able to handle duplicate inputs for any given metrics.
     :param update: Telegram update object
+    :param configuration: autowired.
     :return:
     """
     # retrieve query prompt and answer
@@ -109,7 +128,7 @@ async def handle_record_entry(update: Update) -> None:
     await query.answer()
 
     # retrieve current record
-    user_record = get_temp_record(user_id)
+    user_record = await get_temp_record(user_id)
     if not user_record:
         logging.error(f"User {user_id} does not have a temporary record")
         return await handle_no_known_state(update)
@@ -118,18 +137,26 @@ async def handle_record_entry(update: Update) -> None:
     metric, value = parse_query_data(query.data)
     logging.info(f"User {user_id} answered {metric} with {query.data}")
     user_record.update_data(metric, value)
-    temp_records[user_id] = user_record
+    await async_temp_records.set(user_id, user_record)
 
+    # in compact mode, the answered prompt is edited in place instead of sending a new message
+    compact = configuration.recording.is_compact()
     # check if record is complete
     if user_record.is_complete():
-        store_record(user_id, user_record)
-        await send(update, text="Record completed. Thank you!")
+        await store_record(user_id, user_record)
+        if compact:
+            await edit(update, text=RECORD_COMPLETED_MESSAGE)
+        else:
+            await send(update, text=RECORD_COMPLETED_MESSAGE)
     # send out next metric prompt
     else:
         logging.info(
             f"Record for user {user_id} is not complete yet: {user_record.data}"
         )
-        await record_handler(update, None)
+        if compact:
+            await edit_prompt_for_metric(update, user_record.next_unanswered_metric())
+        else:
+            await record_handler(update, None)
 
 
 def parse_query_data(query_data: str) -> tuple[str, int]:
@@ -146,27 +173,36 @@ def parse_query_data(query_data: str) -> tuple[str, int]:
     return metric, value
 
 
-@autowire("record_repository")
-def store_record(
-    user_id: int, user_record: TempRecord, record_repository: RecordRepository
+@autowire("async_record_repository", "async_temp_records")
+async def store_record(
+    user_id: int,
+    user_record: TempRecord,
+    async_record_repository: AsyncRecordRepository,
+    async_temp_records: AsyncStateStore,
 ):
     """
     Stores a temporary record in the database.
-    :param record_repository: autowired.
+    :param async_record_repository: autowired.
     :param user_id: user to whom the record belongs
     :param user_record: the temporary record being saved
     :return:
     """
     logging.info(f"Persisting record for user {user_id}: {user_record}")
-    record_repository.create_record(
+    await async_record_repository.create_record(
         user_id,
         user_record.data,
         user_record.timestamp.isoformat(),
     )
-    del temp_records[user_id]
+    await async_temp_records.delete(user_id)
 
 
-async def offset_handler(update: Update, context) -> None:
+@autowire("async_temp_records", "async_application_state")
+async def offset_handler(
+    update: Update,
+    context,
+    async_temp_records: AsyncStateStore,
+    async_application_state: AsyncStateStore,
+) -> None:
     """
     Handles the /offset command.
     :param update: Telegram update object
@@ -179,11 +215,8 @@ async def offset_handler(update: Update, context) -> None:
     )
     success_message = "The timestamp of your record has been updated to {}."
     invalid_args_message = "Please provide an offset in days like this: /offset 1"
-    user_state = APPLICATION_STATE.get(update.effective_user.id)
-    if (
-        user_state is not None
-        and APPLICATION_STATE[update.effective_user.id] == State.RECORDING
-    ):
+    user_state = await async_application_state.get(update.effective_user.id)
+    if user_state is not None and user_state == State.RECORDING:
         if len(context.args) != 1:
             await send(update, text=invalid_args_message)
         offset = int(context.args[0])
@@ -191,9 +224,9 @@ async def offset_handler(update: Update, context) -> None:
 
         # overwrite temp record; it's assumed the record exists since the user state is RECORDING
         # state inconsistencies are not accounted for here
-        record = temp_records[user_id]
+        record = await get_temp_record(user_id)
         record.timestamp = modify_timestamp(record.timestamp, offset)
-        temp_records[user_id] = record
+        await async_temp_records.set(user_id, record)
         logging.info(f"Updated timestamp for user {user_id} to {record.timestamp}")
         # so i got kind of lazy on this one. splitting an iso-formatted timestamp just returns the date section.
         await send(
@@ -204,11 +237,11 @@ async def offset_handler(update: Update, context) -> None:
         await send(update, text=incorrect_state_message)
 
 
-@autowire("user_repository")
+@autowire("async_user_repository")
 async def baseline_handler(
     update: Update,
     _,
-    user_repository: UserRepository,
+    async_user_repository: AsyncUserRepository,
 ):
     """
     Handler for the /baseline command.
@@ -216,7 +249,7 @@ async def baseline_handler(
     this command will create a record consisting of those values.
     :return:
     """
-    user = user_repository.find_user(update.effective_user.id)
+    user = await async_user_repository.find_user(update.effective_user.id)
     if user.has_baselines_defined():
         record = await create_baseline_record(user)
         await send(update, text=create_baseline_success_message(record))
@@ -227,11 +260,13 @@ async def baseline_handler(
         await send(update, text="You have not defined baselines for all metrics yet.")
 
 
-@autowire("record_repository")
-async def create_baseline_record(user: User, record_repository: RecordRepository):
+@autowire("async_record_repository")
+async def create_baseline_record(
+    user: User, async_record_repository: AsyncRecordRepository
+):
     record = {metric.name: int(metric.baseline) for metric in user.metrics}
     logging.info(f"Creating baseline record for user {user.user_id}: {record}")
-    record_repository.create_record(
+    await async_record_repository.create_record(
         user.user_id,
         record,
         datetime.datetime.now().isoformat(),
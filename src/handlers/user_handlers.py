@@ -20,8 +20,8 @@ async def create_user(update: Update, _, user_service: UserService) -> User:
     """
     # Handle registration
     user_id = update.effective_user.id
-    if not user_service.find_user(user_id):
-        user = user_service.create_user(user_id)
+    if not await user_service.find_user(user_id):
+        user = await user_service.create_user(user_id)
         await send(update, text=introduction_text(user))
         return user
     # User already exists
@@ -37,9 +37,9 @@ async def create_user(update: Update, _, user_service: UserService) -> User:
 @autowire("user_service")
 async def toggle_auto_baseline(update: Update, _, user_service: UserService) -> None:
     user_id = update.effective_user.id
-    user = user_service.find_user(user_id)
+    user = await user_service.find_user(user_id)
     # if baseline is not already enabled and the user has the necessary configuration
-    result = user_service.toggle_auto_baseline(user)
+    result = await user_service.toggle_auto_baseline(user)
     if result:
         await send(
             update,
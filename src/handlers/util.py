@@ -1,24 +1,72 @@
 import logging
 
-from telegram import Update
-from telegram.error import TimedOut
-from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
+from pyautowire import autowire
+from telegram import InlineKeyboardMarkup, Update
 
+from src.message_dispatcher import MessageDispatcher
 
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_fixed(1),
-    retry=retry_if_exception_type((TimeoutError, TimedOut)),
-)
-async def send(update: Update, text: str):
+
+@autowire("message_dispatcher")
+async def send(
+    update: Update,
+    text: str,
+    message_dispatcher: MessageDispatcher,
+    reply_markup: InlineKeyboardMarkup | None = None,
+):
     """
     Sends a message to the chat. Shorthand utility to keep the code clean.
+    Messages are sent through the message dispatcher, which rate-limits and retries them.
     :param update: Update from the Telegram bot.
     :param text: The message to send.
+    :param reply_markup: The keyboard of the message, if any.
     """
     logging.info(f"Sending message to {update.effective_user.id}: {text}")
-    await update.effective_user.get_bot().send_message(
-        chat_id=update.effective_user.id, text=text
+    await message_dispatcher.send(
+        update.effective_user.get_bot(),
+        update.effective_user.id,
+        text,
+        reply_markup=reply_markup,
+    )
+
+
+@autowire("message_dispatcher")
+async def send_photo(
+    update: Update, photo: bytes, message_dispatcher: MessageDispatcher
+):
+    """
+    Sends a photo to the chat through the message dispatcher, which rate-limits and retries it.
+    :param update: Update from the Telegram bot.
+    :param photo: The encoded image.
+    """
+    logging.info(f"Sending photo to {update.effective_user.id}")
+    await message_dispatcher.send_photo(
+        update.effective_user.get_bot(), update.effective_user.id, photo
+    )
+
+
+@autowire("message_dispatcher")
+async def edit(
+    update: Update,
+    text: str,
+    message_dispatcher: MessageDispatcher,
+    reply_markup: InlineKeyboardMarkup | None = None,
+):
+    """
+    Edits the message whose button was pressed, instead of sending a new message.
+    :param update: Button press from the Telegram bot.
+    :param text: The new text of the message.
+    :param reply_markup: The new keyboard of the message. If None, the keyboard is removed.
+    """
+    message = update.callback_query.message
+    logging.info(
+        f"Editing message {message.message_id} of {update.effective_user.id}: {text}"
+    )
+    await message_dispatcher.edit(
+        update.effective_user.get_bot(),
+        update.effective_user.id,
+        message.message_id,
+        text,
+        reply_markup=reply_markup,
     )
 
 
@@ -0,0 +1,349 @@
+import bisect
+import datetime
+import functools
+import inspect
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from apscheduler.events import EVENT_JOB_SUBMITTED, JobSubmissionEvent
+from apscheduler.schedulers.base import BaseScheduler
+from telegram.ext import JobQueue
+
+"""
+Metrics in the Prometheus text exposition format.
+Metrics are defined once at module level and updated wherever the measured code runs. Values that are already
+tracked elsewhere, e.g. the statistics of the message dispatcher, are collected from callbacks when scraped,
+so that they are not counted twice.
+"""
+
+# buckets in seconds, from fast cache hits to slow graph renders
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+Labels = tuple[str, ...]
+Sample = tuple[dict[str, str], float]
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            f'{name}="{escape_label_value(str(value))}"'
+            for name, value in labels.items()
+        )
+        + "}"
+    )
+
+
+class Metric(ABC):
+    type: str
+
+    def __init__(self, name: str, documentation: str, label_names: Labels = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+
+    def label_values(self, labels: dict[str, str]) -> Labels:
+        if set(labels) != set(self.label_names):
+            raise ValueError(
+                f"Metric {self.name} expects labels {self.label_names}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    @abstractmethod
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        """
+        :return: name, labels and value of each sample of the metric.
+        """
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines.extend(
+            f"{name}{format_labels(labels)} {format_value(value)}"
+            for name, labels, value in self.samples()
+        )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Labels = ()):
+        super().__init__(name, documentation, label_names)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+        for key, value in values:
+            yield self.name, dict(zip(self.label_names, key)), value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Labels = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: count per bucket (the last bucket is +Inf), sum of observations
+        self.values: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self.label_values(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = self.values[key]
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        """
+        Observes the duration of the block, including blocks that raise.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self.lock:
+            values = [
+                (key, list(counts), total[0])
+                for key, (counts, total) in self.values.items()
+            ]
+        for key, counts, total in values:
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {
+                    **labels,
+                    "le": format_value(bound),
+                }, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class CallbackMetric(Metric):
+    """
+    Metric whose samples are collected from a callback when scraped.
+    The callback returns either a single value or a list of label/value samples.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        type: str,
+        callback: Callable[[], float | list[Sample]],
+    ):
+        super().__init__(name, documentation)
+        self.type = type
+        self.callback = callback
+
+    def samples(self):
+        result = self.callback()
+        if isinstance(result, (int, float)):
+            yield self.name, {}, result
+            return
+        for labels, value in result:
+            yield self.name, labels, value
+
+
+class MetricsRegistry:
+    """
+    Holds all metrics and renders them in the text exposition format.
+    A failing callback only omits its own metric from the scrape.
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self.lock:
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Labels = ()):
+        return self.register(Counter(name, documentation, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Labels = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def gauge_callback(
+        self, name: str, documentation: str, callback: Callable[[], float | list]
+    ):
+        return self.register(CallbackMetric(name, documentation, "gauge", callback))
+
+    def counter_callback(
+        self, name: str, documentation: str, callback: Callable[[], float | list]
+    ):
+        return self.register(CallbackMetric(name, documentation, "counter", callback))
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        rendered = []
+        for metric in metrics:
+            try:
+                rendered.append(metric.render())
+            except Exception:
+                logging.exception(f"Failed to collect metric {metric.name}")
+        return "\n".join(rendered) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HANDLER_DURATION = REGISTRY.histogram(
+    "mood_tracker_handler_duration_seconds",
+    "Time spent handling an update, per handler.",
+    ("handler",),
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    "mood_tracker_handler_errors_total",
+    "Number of updates whose handler raised an exception, per handler.",
+    ("handler",),
+)
+REPOSITORY_DURATION = REGISTRY.histogram(
+    "mood_tracker_repository_duration_seconds",
+    "Duration of database round trips, per repository and method.",
+    ("repository", "method"),
+)
+JOB_LAG = REGISTRY.histogram(
+    "mood_tracker_job_lag_seconds",
+    "Delay between the scheduled and the actual start of a job, per kind of job.",
+    ("job",),
+)
+
+
+def instrument_handler(name: str, callback: Callable) -> Callable:
+    """
+    Wraps a handler callback, so that its duration and errors are measured.
+    :param name: The name of the handler, e.g. the command.
+    :param callback: The handler callback.
+    :return: The wrapped callback.
+    """
+
+    @functools.wraps(callback)
+    async def instrumented(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - start, handler=name)
+
+    return instrumented
+
+
+def instrument_repository(cls: type) -> type:
+    """
+    Class decorator that observes the duration of every public method of a repository, i.e. of its database
+    round trips. Generators are not timed, since they return before any data has been read.
+    """
+    # methods of the repository and its base repositories, but not e.g. Injectable.register
+    names = {
+        name
+        for klass in cls.__mro__
+        if klass.__module__.startswith("src.repository")
+        for name in vars(klass)
+    }
+    for name in names:
+        attribute = inspect.getattr_static(cls, name)
+        if (
+            name.startswith("_")
+            or not inspect.isfunction(attribute)
+            or inspect.isgeneratorfunction(attribute)
+        ):
+            continue
+        setattr(cls, name, timed_method(cls.__name__, attribute))
+    return cls
+
+
+def timed_method(repository: str, method: Callable) -> Callable:
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+        with REPOSITORY_DURATION.time(repository=repository, method=method.__name__):
+            return method(*args, **kwargs)
+
+    return timed
+
+
+def instrument_job_queue(job_queue: JobQueue) -> None:
+    """
+    Observes the delay of every job run of the job queue, i.e. how late the scheduler submitted it.
+    """
+    scheduler = job_queue.scheduler
+    scheduler.add_listener(
+        functools.partial(observe_job_lag, scheduler), EVENT_JOB_SUBMITTED
+    )
+
+
+def observe_job_lag(scheduler: BaseScheduler, event: JobSubmissionEvent) -> None:
+    """
+    Jobs are labelled by kind, e.g. reminders or baselines, since their names include the time of day.
+    """
+    job = scheduler.get_job(event.job_id)
+    if job is None or not event.scheduled_run_times:
+        return
+    scheduled = event.scheduled_run_times[0]
+    lag = datetime.datetime.now(scheduled.tzinfo) - scheduled
+    JOB_LAG.observe(max(lag.total_seconds(), 0.0), job=job.name.split("_")[0])
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from pyautowire import Injectable
+from telegram import Bot, Message
+from telegram.error import RetryAfter, TimedOut
+from tenacity import (
+    AsyncRetrying,
+    RetryCallState,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
+
+from src.rate_limiter import RateLimiter
+
+"""
+Central queue for outgoing Telegram messages.
+All messages go through the same rate limiter, so that bursts (e.g. thousands of reminders at the same minute)
+are delivered as fast as Telegram allows, but not faster.
+Replies to users and bulk messages of scheduled jobs are queued in separate lanes, so that replies are never
+queued behind a burst of reminders.
+"""
+
+
+@dataclass
+class OutgoingMessage:
+    bot: Bot
+    chat_id: int
+    # None for messages without text, e.g. photos
+    text: str | None
+    kwargs: dict[str, Any]
+    future: asyncio.Future = field(repr=False)
+    # Bot method used to deliver the message, e.g. edit_message_text to update a message in place
+    method: str = "send_message"
+
+
+@dataclass
+class Lane:
+    """
+    Queue of messages with a bounded number of workers of its own.
+    """
+
+    workers: int
+    queue: asyncio.Queue = field(default_factory=asyncio.Queue)
+    tasks: set[asyncio.Task] = field(default_factory=set)
+
+
+class MessageDispatcher(Injectable):
+    """
+    Sends messages from two lanes, each with a bounded number of workers.
+    Interactive messages, i.e. replies and edits in response to a user, are sent by the workers of the interactive
+    lane. Bulk messages of scheduled jobs, e.g. reminders, are sent by the few workers of the bulk lane. Since the
+    rate limiter hands out tokens in order of request, an interactive message waits for at most one token per bulk
+    worker, however many bulk messages are queued.
+    Timeouts are retried with exponential backoff and jitter. If Telegram responds with RetryAfter,
+    sending is paused for all chats for as long as requested before the message is retried.
+    Workers are started on demand and exit once their queue is empty, so no tasks outlive the event loop.
+    """
+
+    # window over which the throughput is calculated
+    THROUGHPUT_WINDOW_SECONDS = 10
+
+    def __init__(
+        self,
+        rate_limiter: RateLimiter | None = None,
+        workers: int = 16,
+        bulk_workers: int = 4,
+        max_attempts: int = 3,
+        backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 30.0,
+    ):
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.interactive = Lane(workers)
+        self.bulk = Lane(bulk_workers)
+        self.max_attempts = max_attempts
+        self.backoff = wait_exponential_jitter(
+            initial=backoff_seconds, max=max_backoff_seconds, jitter=backoff_seconds
+        )
+        self.sent_timestamps: deque[float] = deque()
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+    async def send(self, bot: Bot, chat_id: int, text: str, **kwargs) -> Message:
+        """
+        Queues an interactive message, e.g. a reply to a user, and waits until it has been sent.
+        :param bot: The bot sending the message.
+        :param chat_id: The chat to send the message to.
+        :param text: The message to send.
+        :param kwargs: Further arguments for Bot.send_message, e.g. a reply markup.
+        :return: The sent message.
+        :raises RetryError: if the message could not be sent within the maximum number of attempts.
+        """
+        return await self.enqueue(
+            self.interactive, bot, chat_id, text, kwargs, "send_message"
+        )
+
+    async def send_photo(
+        self, bot: Bot, chat_id: int, photo: bytes, **kwargs
+    ) -> Message:
+        """
+        Queues a photo as an interactive message, e.g. a rendered graph, and waits until it has been sent.
+        :param photo: The encoded image.
+        :param kwargs: Further arguments for Bot.send_photo, e.g. a caption.
+        :return: The sent message.
+        :raises RetryError: if the photo could not be sent within the maximum number of attempts.
+        """
+        return await self.enqueue(
+            self.interactive,
+            bot,
+            chat_id,
+            None,
+            {"photo": photo, **kwargs},
+            "send_photo",
+        )
+
+    async def send_bulk(self, bot: Bot, chat_id: int, text: str, **kwargs) -> Message:
+        """
+        Queues a message of a scheduled job, e.g. a reminder, behind all interactive messages
+        and waits until it has been sent.
+        """
+        return await self.enqueue(self.bulk, bot, chat_id, text, kwargs, "send_message")
+
+    async def enqueue(
+        self,
+        lane: Lane,
+        bot: Bot,
+        chat_id: int,
+        text: str | None,
+        kwargs: dict[str, Any],
+        method: str,
+    ):
+        future = asyncio.get_running_loop().create_future()
+        lane.queue.put_nowait(
+            OutgoingMessage(bot, chat_id, text, kwargs, future, method)
+        )
+        if len(lane.tasks) < lane.workers:
+            task = asyncio.create_task(self.work(lane))
+            lane.tasks.add(task)
+            task.add_done_callback(lane.tasks.discard)
+        return await future
+
+    async def edit(
+        self, bot: Bot, chat_id: int, message_id: int, text: str, **kwargs
+    ) -> Message | bool:
+        """
+        Queues an edit of a previously sent message and waits until it has been applied.
+        Edits count towards the same limits as new messages.
+        :param message_id: The message to edit.
+        :param kwargs: Further arguments for Bot.edit_message_text, e.g. a reply markup.
+        :return: The edited message.
+        :raises RetryError: if the message could not be edited within the maximum number of attempts.
+        """
+        return await self.enqueue(
+            self.interactive,
+            bot,
+            chat_id,
+            text,
+            {"message_id": message_id, **kwargs},
+            "edit_message_text",
+        )
+
+    async def work(self, lane: Lane):
+        queue = lane.queue
+        while True:
+            try:
+                message = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                # the worker leaves the lane before it returns rather than in its done callback, which only runs
+                # later: a message queued in between would otherwise find the lane full and never be sent
+                lane.tasks.discard(asyncio.current_task())
+                return
+            try:
+                result = await self.deliver(message)
+                self.record_sent()
+                if not message.future.done():
+                    message.future.set_result(result)
+            except Exception as exception:
+                self.failed += 1
+                if not message.future.done():
+                    message.future.set_exception(exception)
+            finally:
+                queue.task_done()
+
+    async def deliver(self, message: OutgoingMessage) -> Message:
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=self.wait,
+            retry=retry_if_exception_type((TimeoutError, TimedOut, RetryAfter)),
+        ):
+            with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    self.retries += 1
+                await self.rate_limiter.acquire(message.chat_id)
+                deliver = getattr(message.bot, message.method)
+                if message.text is None:
+                    return await deliver(chat_id=message.chat_id, **message.kwargs)
+                return await deliver(
+                    chat_id=message.chat_id, text=message.text, **message.kwargs
+                )
+
+    def wait(self, retry_state: RetryCallState) -> float:
+        exception = retry_state.outcome.exception()
+        if isinstance(exception, RetryAfter):
+            retry_after = float(exception.retry_after)
+            logging.warning(f"Flood control exceeded, pausing for {retry_after}s")
+            self.rate_limiter.pause(retry_after)
+            return retry_after
+        return self.backoff(retry_state)
+
+    def record_sent(self):
+        now = time.monotonic()
+        self.sent += 1
+        self.sent_timestamps.append(now)
+        while self.sent_timestamps[0] < now - self.THROUGHPUT_WINDOW_SECONDS:
+            self.sent_timestamps.popleft()
+
+    def statistics(self) -> dict[str, float]:
+        now = time.monotonic()
+        recently_sent = sum(
+            1
+            for timestamp in self.sent_timestamps
+            if timestamp >= now - self.THROUGHPUT_WINDOW_SECONDS
+        )
+        return {
+            "queue_depth": self.interactive.queue.qsize(),
+            "bulk_queue_depth": self.bulk.queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "messages_per_second": recently_sent / self.THROUGHPUT_WINDOW_SECONDS,
+        }
@@ -0,0 +1,95 @@
+import datetime
+from typing import Iterable
+
+from pydantic import BaseModel
+
+from src.model.record import Record
+
+
+class MetricRollup(BaseModel):
+    """
+    Aggregate of a single metric over all records of a day.
+    """
+
+    sum: int
+    count: int
+    min: int
+    max: int
+
+    def mean(self) -> float:
+        return self.sum / self.count
+
+    def add(self, value: int) -> None:
+        self.sum += value
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+
+class DailyRollup(BaseModel):
+    """
+    Pre-aggregated records of a user for a single day.
+    Rollups are updated whenever a record is created, so that graphs and statistics
+    can be calculated from at most one row per day instead of every raw record.
+    """
+
+    user_id: int
+    date: datetime.date
+    record_count: int
+    latest_timestamp: datetime.datetime
+    metrics: dict[str, MetricRollup]
+
+    def add(self, record: Record) -> None:
+        self.record_count += 1
+        self.latest_timestamp = max(self.latest_timestamp, record.timestamp)
+        for metric_name, value in record.data.items():
+            if metric_name in self.metrics:
+                self.metrics[metric_name].add(value)
+            else:
+                self.metrics[metric_name] = MetricRollup(
+                    sum=value, count=1, min=value, max=value
+                )
+
+    def serialize(self):
+        return {
+            "user_id": self.user_id,
+            "date": self.date.isoformat(),
+            "record_count": self.record_count,
+            "latest_timestamp": self.latest_timestamp.isoformat(),
+            "metrics": {
+                metric_name: metric.model_dump()
+                for metric_name, metric in self.metrics.items()
+            },
+        }
+
+
+def aggregate_daily_rollups(records: Iterable[Record]) -> list[DailyRollup]:
+    """
+    Aggregates records into daily rollups, e.g. to backfill rollups for existing records.
+    :param records: records of one or more users.
+    :return: one rollup per user and day with records, in ascending order of users and dates.
+    """
+    rollups: dict[tuple[int, datetime.date], DailyRollup] = {}
+    for record in records:
+        add_to_daily_rollups(rollups, record)
+    return [rollups[key] for key in sorted(rollups)]
+
+
+def add_to_daily_rollups(
+    rollups: dict[tuple[int, datetime.date], DailyRollup], record: Record
+) -> None:
+    """
+    Adds a record to the rollup of its user and day, creating the rollup if necessary.
+    :param rollups: rollups keyed on (user_id, date).
+    :param record: record to add.
+    """
+    key = (record.user_id, record.timestamp.date())
+    if key not in rollups:
+        rollups[key] = DailyRollup(
+            user_id=record.user_id,
+            date=record.timestamp.date(),
+            record_count=0,
+            latest_timestamp=record.timestamp,
+            metrics={},
+        )
+    rollups[key].add(record)
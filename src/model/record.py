@@ -1,3 +1,6 @@
+import json
+from array import array
+from collections import OrderedDict
 from datetime import datetime
 
 from pydantic import BaseModel
@@ -25,32 +28,103 @@ class Record(BaseModel):
         return f"user_id: {self.user_id}, data: {self.data}, timestamp: {self.timestamp.isoformat()}"
 
 
+class MetricDefinitions:
+    """
+    Immutable metric definitions of a user, with an index from metric name to position.
+    Definitions are shared by all temporary records with the same metrics instead of being copied into each of them.
+    """
+
+    __slots__ = ("metrics", "positions")
+
+    # number of distinct metric configurations that are kept for sharing
+    CACHE_SIZE = 1024
+    cache: OrderedDict[str, "MetricDefinitions"] = OrderedDict()
+
+    def __init__(self, metrics: list[Metric]):
+        self.metrics: tuple[Metric, ...] = tuple(metrics)
+        self.positions: dict[str, int] = {
+            metric.name: position for position, metric in enumerate(self.metrics)
+        }
+
+    @classmethod
+    def of(cls, metrics: list[Metric]) -> "MetricDefinitions":
+        """
+        :return: the shared definitions for the metrics, creating them if no record with these metrics exists.
+        """
+        key = json.dumps([metric.model_dump() for metric in metrics])
+        definitions = cls.cache.get(key)
+        if definitions is None:
+            definitions = cls.cache[key] = cls(
+                [metric.model_copy(deep=True) for metric in metrics]
+            )
+            if len(cls.cache) > cls.CACHE_SIZE:
+                cls.cache.popitem(last=False)
+        else:
+            cls.cache.move_to_end(key)
+        return definitions
+
+    def __len__(self) -> int:
+        return len(self.metrics)
+
+
 class TempRecord:
     """
-    Record that is being kept in the in-memory ExpiringDict while being completed.
+    Record that is being kept in the conversation state store while being completed.
     Differs from the database Record in that it holds data on the Metrics that are being gathered.
+    Values are stored in an array in the order of the metrics, along with a flag per metric whether it has been
+    answered and a cursor to the first unanswered metric, so that every answer is handled in constant time.
     """
 
-    metrics: list[Metric]
-    timestamp: datetime
-    data: dict[str, int | None]
+    __slots__ = ("definitions", "values", "answered", "cursor", "timestamp")
 
-    def __init__(self, metrics: list[Metric]):
-        self.metrics = metrics
-        self.data = {metric.name: None for metric in self.metrics}
+    def __init__(self, metrics: list[Metric] | MetricDefinitions):
+        if not isinstance(metrics, MetricDefinitions):
+            metrics = MetricDefinitions.of(metrics)
+        self.definitions = metrics
+        self.values = array("q", bytes(8 * len(metrics)))
+        self.answered = bytearray(len(metrics))
+        self.cursor = 0
         self.timestamp = datetime.now()
 
     def __str__(self):
         return f"data: {self.data}, timestamp: {self.timestamp.isoformat()}"
 
+    @property
+    def metrics(self) -> tuple[Metric, ...]:
+        return self.definitions.metrics
+
+    @property
+    def data(self) -> dict[str, int | None]:
+        return {
+            metric.name: self.values[position] if self.answered[position] else None
+            for position, metric in enumerate(self.definitions.metrics)
+        }
+
+    @data.setter
+    def data(self, data: dict[str, int | None]):
+        for position, metric in enumerate(self.definitions.metrics):
+            value = data.get(metric.name)
+            self.answered[position] = value is not None
+            self.values[position] = value or 0
+        self.cursor = 0
+        self.advance_cursor()
+
     def update_data(self, metric_name: str, value: int):
-        if metric_name in self.data:
-            self.data[metric_name] = value
-        else:
+        position = self.definitions.positions.get(metric_name)
+        if position is None:
             raise ValueError(f"Metric {metric_name} not found in record data.")
+        self.values[position] = value
+        self.answered[position] = True
+        self.advance_cursor()
+
+    def advance_cursor(self):
+        while self.cursor < len(self.answered) and self.answered[self.cursor]:
+            self.cursor += 1
 
     def next_unanswered_metric(self) -> Metric:
-        return next(metric for metric in self.metrics if self.data[metric.name] is None)
+        if self.is_complete():
+            raise StopIteration("All metrics have been answered.")
+        return self.definitions.metrics[self.cursor]
 
     def is_complete(self) -> bool:
-        return all(value is not None for value in self.data.values())
+        return self.cursor == len(self.answered)
@@ -70,3 +70,23 @@ class User(BaseModel):
             ],
             auto_baseline_config=configuration.get_auto_baseline_config().model_dump(),
         )
+
+
+class UserSchedule(BaseModel):
+    """
+    Projection of a user onto the fields needed to schedule their jobs.
+    Used on startup, so that the metrics of every user do not have to be retrieved and parsed.
+    """
+
+    user_id: int
+    notifications: list[Notification] = []
+    auto_baseline_config: AutoBaselineConfig = AutoBaselineConfig()
+
+    def get_notifications(self) -> list[Notification]:
+        return self.notifications
+
+    def has_auto_baseline_enabled(self) -> bool:
+        return self.auto_baseline_config.enabled
+
+    def get_auto_baseline_time(self) -> datetime.time:
+        return self.auto_baseline_config.time
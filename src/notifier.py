@@ -1,129 +1,275 @@
+import asyncio
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import datetime
-from functools import partial
 
-from telegram.error import TimedOut
-from telegram.ext import CallbackContext, JobQueue
+from telegram import Bot
+from telegram.ext import CallbackContext, Job, JobQueue
 
 from pyautowire import Injectable, autowire
-from tenacity import stop_after_attempt, wait_fixed, retry_if_exception_type, retry
 
 from src.model.notification import Notification
 from src.model.record import Record
-from src.model.user import User
-from src.handlers.record_handlers import create_baseline_record
-from src.repository.record_repository import RecordRepository
+from src.model.user import User, UserSchedule
+from src.message_dispatcher import MessageDispatcher
+from src.repository.async_repository import AsyncRecordRepository, AsyncUserRepository
+
+
+DEFAULT_REMINDER_TEXT = "Hi! It's time to record your mood :)"
+BASELINE_CONFIRMATION_TEXT = "A baseline record has been created for you."
 
 
 @dataclass
 class Notifier(Injectable):
-    job_queue: JobQueue
+    """
+    Schedules reminders and auto-baselines.
+    Scheduled jobs are indexed by name, so that they can be found and removed without scanning every job
+    in the job queue.
+    Reminders and auto-baselines are bucketed by time: there is one job per distinct time, which handles
+    all users subscribed to that time slot at once.
+    """
 
-    async def reminder(self, context: CallbackContext, user_id: int, text: str = None):
-        """Send the reminder message."""
-        if not text:
-            text = "Hi! It's time to record your mood :)"
-        await self.send_from_context(context, user_id, text)
+    # number of messages of a job that are queued at once
+    SEND_BATCH_SIZE = 100
 
-    @staticmethod
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_fixed(1),
-        retry=retry_if_exception_type((TimeoutError, TimedOut)),
-    )
-    async def send_from_context(context: CallbackContext, user_id: int, text: str):
-        """Send a message to a user from a context."""
-        await context.bot.send_message(user_id, text=text)
+    job_queue: JobQueue
+    message_dispatcher: MessageDispatcher = field(default_factory=MessageDispatcher)
+    jobs: dict[str, Job] = field(default_factory=dict)
+    # reminder texts of subscribed users per time slot job
+    notification_slots: dict[str, dict[int, str]] = field(default_factory=dict)
+    # users with auto-baseline enabled per time slot job
+    auto_baseline_slots: dict[str, set[int]] = field(default_factory=dict)
 
-    @staticmethod
-    @autowire("record_repository")
-    async def auto_baseline(
-        context: CallbackContext, user: User, record_repository: RecordRepository
-    ):
-        """Create baseline record for user at scheduled time."""
-        latest_user_record = record_repository.get_latest_record_for_user(user.user_id)
-        if (
-            latest_user_record is None
-            or not latest_user_record.timestamp.day == datetime.datetime.now().day
-        ):
-            await create_baseline_record(user)
-            await context.bot.send_message(
-                user.user_id, text="A baseline record has been created for you."
-            )
-        else:
-            logging.info(
-                f"Record already exists for user {user.user_id} today. Not creating a new one."
+    async def send_reminders(self, context: CallbackContext):
+        """
+        Send the reminders of all users subscribed to the time slot of the job.
+        A failed reminder is logged and does not affect the reminders of other users.
+        """
+        reminders = [
+            (user_id, text or DEFAULT_REMINDER_TEXT)
+            for user_id, text in self.notification_slots.get(
+                context.job.name, {}
+            ).items()
+        ]
+        logging.info(f"Sending {len(reminders)} reminders for {context.job.name}")
+        sent = await self.send_in_batches(context.bot, reminders, "reminder")
+        logging.info(
+            f"Sent {sent} of {len(reminders)} reminders for {context.job.name}"
+        )
+
+    async def send_in_batches(
+        self, bot: Bot, messages: list[tuple[int, str]], kind: str
+    ) -> int:
+        """
+        Sends messages of a job batch by batch through the bulk lane of the message dispatcher. Only one batch
+        is queued at a time, so that the dispatcher is never flooded with the messages of a whole time slot at once.
+        A failed message is logged and does not affect the other messages.
+        :param bot: The bot sending the messages.
+        :param messages: The user IDs and texts of the messages.
+        :param kind: The kind of the messages, for logging.
+        :return: The number of sent messages.
+        """
+        sent = 0
+        for start in range(0, len(messages), self.SEND_BATCH_SIZE):
+            batch = messages[start : start + self.SEND_BATCH_SIZE]
+            results = await asyncio.gather(
+                *(
+                    self.message_dispatcher.send_bulk(bot, user_id, text)
+                    for user_id, text in batch
+                ),
+                return_exceptions=True,
             )
+            for (user_id, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logging.error(
+                        f"Failed to send {kind} to user {user_id}: {result!r}"
+                    )
+                else:
+                    sent += 1
+        return sent
 
-    @staticmethod
-    def is_from_today(record: Record) -> bool:
-        return record.timestamp.date() == datetime.datetime.now().date()
+    async def run_auto_baselines(self, context: CallbackContext):
+        """
+        Create baseline records for all users subscribed to the auto-baseline time slot of the job.
+        """
+        user_ids = list(self.auto_baseline_slots.get(context.job.name, ()))
+        logging.info(f"Running auto-baseline for {len(user_ids)} users")
+        await self.create_baselines(context.bot, user_ids)
+
+    @autowire("async_user_repository", "async_record_repository")
+    async def create_baselines(
+        self,
+        bot: Bot,
+        user_ids: list[int],
+        async_user_repository: AsyncUserRepository,
+        async_record_repository: AsyncRecordRepository,
+    ) -> list[Record]:
+        """
+        Create baseline records for all users who have not created a record today.
+        Instead of two round trips per user, the latest records of today are retrieved for all users at once,
+        the missing baseline records are written in bulk and the confirmations go through the message dispatcher.
+        Users are retrieved when the job runs, so that the baselines are always up to date.
+        :param bot: The bot sending the confirmations.
+        :param user_ids: The users to create baseline records for.
+        :return: The created baseline records.
+        """
+        now = datetime.datetime.now()
+        latest_timestamps = await async_record_repository.find_latest_record_timestamps(
+            user_ids, now.date()
+        )
+        missing = [user_id for user_id in user_ids if user_id not in latest_timestamps]
+        logging.info(
+            f"{len(latest_timestamps)} of {len(user_ids)} users already have a record today"
+        )
+        if not missing:
+            return []
+        records = []
+        for user in await async_user_repository.find_users(missing):
+            if not user.has_baselines_defined():
+                logging.warning(
+                    f"Baselines not defined for all metrics for user {user.user_id}. Skipping auto-baseline."
+                )
+                continue
+            data = {metric.name: int(metric.baseline) for metric in user.metrics}
+            records.append(Record(user_id=user.user_id, data=data, timestamp=now))
+        if not records:
+            return []
+        result = await async_record_repository.create_records_bulk(records)
+        logging.info(
+            f"Created {result.records} baseline records in {result.seconds:.2f}s"
+        )
+        await self.send_in_batches(
+            bot,
+            [(record.user_id, BASELINE_CONFIRMATION_TEXT) for record in records],
+            "baseline confirmation",
+        )
+        return records
 
     def create_notification(self, user_id: int, notification: Notification) -> str:
         """
-        Sets a notification for a user.
+        Subscribes a user to the time slot of a notification.
+        The job of the time slot is only scheduled for its first subscriber.
         :param user_id: The user's Telegram ID.
         :param notification: The notification to set.
-        :return: The name of the job.
+        :return: The name of the job of the time slot.
         """
         logging.info(
             f"Setting up notification at {notification.time} for user {user_id}"
         )
-        reminder_partial = partial(
-            self.reminder, user_id=user_id, text=notification.text
-        )
-        reminder_partial.__name__ = f"reminder_{user_id}_{notification.time}"
-        job = self.job_queue.run_daily(
-            reminder_partial,
-            days=(0, 1, 2, 3, 4, 5, 6),
-            chat_id=user_id,
-            time=notification.time,
-        )
-        return job.name
+        job_name = self.notification_job_name(notification.time)
+        if job_name not in self.notification_slots:
+            job = self.job_queue.run_daily(
+                self.send_reminders,
+                days=(0, 1, 2, 3, 4, 5, 6),
+                time=notification.time,
+                name=job_name,
+            )
+            self.register_job(job)
+            self.notification_slots[job_name] = {}
+        self.notification_slots[job_name][user_id] = notification.text
+        return job_name
+
+    @staticmethod
+    def notification_job_name(time: datetime.time) -> str:
+        return f"reminders_{time.isoformat()}"
 
-    def create_auto_baseline(self, user: User):
+    def create_auto_baseline(self, user: User | UserSchedule) -> str:
         """
-        Create baseline record for user at scheduled time.
-        :param user: The user to create a baseline for.
+        Subscribes a user to the time slot of their auto-baseline time.
+        The job of the time slot is only scheduled for its first subscriber.
+        :param user: The user to create a baseline for. Only the user ID is kept in the job.
+        :return: The name of the job of the time slot.
         """
         logging.info(f"Creating auto-baseline for user {user.user_id}")
-        baseline_partial = partial(self.auto_baseline, user=user)
-        baseline_partial.__name__ = f"baseline_{user.user_id}"
-        self.job_queue.run_daily(
-            baseline_partial,
-            days=(0, 1, 2, 3, 4, 5, 6),
-            chat_id=user.user_id,
-            time=user.get_auto_baseline_time(),
-        )
+        # a user has at most one auto-baseline time
+        self.unsubscribe(self.auto_baseline_slots, user.user_id)
+        time = user.get_auto_baseline_time()
+        job_name = self.auto_baseline_job_name(time)
+        if job_name not in self.auto_baseline_slots:
+            job = self.job_queue.run_daily(
+                self.run_auto_baselines,
+                days=(0, 1, 2, 3, 4, 5, 6),
+                time=time,
+                name=job_name,
+            )
+            self.register_job(job)
+            self.auto_baseline_slots[job_name] = set()
+        self.auto_baseline_slots[job_name].add(user.user_id)
+        return job_name
 
-    def remove_auto_baseline(self, user: User):
+    def remove_auto_baseline(self, user: User | UserSchedule):
         """
-        Remove the auto-baseline job for the user.
+        Remove the auto-baseline for the user.
         :param user: The user to remove the auto-baseline for.
         """
         logging.info(f"Removing auto-baseline for user {user.user_id}")
-        baseline_job_name = f"baseline_{user.user_id}"
-        self.remove_job(baseline_job_name)
+        self.unsubscribe(self.auto_baseline_slots, user.user_id)
+
+    @staticmethod
+    def auto_baseline_job_name(time: datetime.time) -> str:
+        return f"baselines_{time.isoformat()}"
+
+    def remove_jobs_for_user(self, user_id: int) -> int:
+        """
+        Unsubscribes a user from all reminders and auto-baselines, e.g. when the user is deleted.
+        :param user_id: The user's Telegram ID.
+        :return: The number of time slots the user was subscribed to.
+        """
+        logging.info(f"Removing all jobs for user {user_id}")
+        return self.unsubscribe(self.notification_slots, user_id) + self.unsubscribe(
+            self.auto_baseline_slots, user_id
+        )
+
+    def unsubscribe(self, slots: dict[str, dict | set], user_id: int) -> int:
+        """
+        Unsubscribes a user from all time slots. The job of a time slot is removed along with its last subscriber.
+        :param slots: The time slots, i.e. notification_slots or auto_baseline_slots.
+        :param user_id: The user's Telegram ID.
+        :return: The number of time slots the user was subscribed to.
+        """
+        subscriptions = 0
+        for job_name, subscribers in list(slots.items()):
+            if user_id not in subscribers:
+                continue
+            if isinstance(subscribers, dict):
+                del subscribers[user_id]
+            else:
+                subscribers.discard(user_id)
+            subscriptions += 1
+            if not subscribers:
+                self.remove_job(job_name)
+        return subscriptions
+
+    def register_job(self, job: Job):
+        """
+        Add a scheduled job to the index.
+        Job names are unique per notifier: a job that replaces an existing job with the same name
+        causes the existing job to be removed, as it could no longer be found otherwise.
+        :param job: The scheduled job.
+        """
+        previous_job = self.jobs.get(job.name)
+        if previous_job is not None and previous_job is not job:
+            previous_job.schedule_removal()
+            logging.info(f"Replaced job {job.name} in job queue")
+        self.jobs[job.name] = job
 
-    def find_job(self, name: str):
+    def find_job(self, name: str) -> Job | None:
         """
         Find a job by name.
         :param name: The name of the job to find
         :return: The job if found, None otherwise.
         """
-        for job in self.job_queue.jobs():
-            if job.name == name:
-                return job
-        return None
+        return self.jobs.get(name)
 
     def remove_job(self, job_name: str):
         """
         Remove a job by name.
         :param job_name: The name of the job to remove.
         """
-        for job in self.job_queue.jobs():
-            if job.name == job_name:
-                job.schedule_removal()
-                logging.info(f"Removed job {job_name} from job queue")
-                break
+        self.notification_slots.pop(job_name, None)
+        self.auto_baseline_slots.pop(job_name, None)
+        job = self.jobs.pop(job_name, None)
+        if job is None:
+            return
+        job.schedule_removal()
+        logging.info(f"Removed job {job_name} from job queue")
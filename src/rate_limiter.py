@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+"""
+Rate limiting for outgoing Telegram messages.
+Telegram rejects bots that send more than roughly 30 messages per second overall
+or more than one message per second to the same chat over longer periods; short bursts to a chat are tolerated.
+"""
+
+
+class RateLimiter:
+    """
+    Limits the global send rate with a token bucket and enforces a minimum interval between
+    messages to the same chat. The bucket holds at most one second worth of tokens,
+    so bursts never exceed the configured rate.
+    Up to per_chat_burst messages to a chat are sent without waiting for the interval, e.g. a reply followed by
+    the first prompt of a record, or the graphs of several months. Further messages to the chat are spaced.
+    Tokens are reserved before waiting: a negative balance is the number of messages queued up for a token,
+    which keeps senders in order without a lock.
+    """
+
+    # number of chats after which chats without pending messages are forgotten
+    PRUNE_THRESHOLD = 10_000
+
+    def __init__(
+        self,
+        messages_per_second: float = 25,
+        per_chat_interval_seconds: float = 1.0,
+        per_chat_burst: int = 3,
+    ):
+        self.messages_per_second = messages_per_second
+        self.per_chat_interval_seconds = per_chat_interval_seconds
+        self.per_chat_burst = per_chat_burst
+        self.capacity = max(1.0, messages_per_second)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        # time at which all messages reserved for a chat would have been sent one interval apart
+        self.next_allowed: dict[int, float] = {}
+
+    async def acquire(self, chat_id: int) -> None:
+        """
+        Waits until a message may be sent to the chat.
+        :param chat_id: The chat the message is sent to.
+        """
+        await self.acquire_chat(chat_id)
+        now = time.monotonic()
+        self.refill(now)
+        self.tokens -= 1
+        delay = max(0.0, self.updated - now) + max(0.0, -self.tokens) / (
+            self.messages_per_second
+        )
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def acquire_chat(self, chat_id: int) -> None:
+        # the slot is reserved before sleeping, so concurrent senders to the same chat queue up behind each other
+        now = time.monotonic()
+        next_allowed = max(now, self.next_allowed.get(chat_id, now))
+        self.next_allowed[chat_id] = next_allowed + self.per_chat_interval_seconds
+        # the burst is sent ahead of the schedule, so only messages beyond it wait
+        allowed = (
+            next_allowed - (self.per_chat_burst - 1) * self.per_chat_interval_seconds
+        )
+        if len(self.next_allowed) > self.PRUNE_THRESHOLD:
+            self.prune(now)
+        if allowed > now:
+            await asyncio.sleep(allowed - now)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stops handing out tokens for the given time, e.g. when Telegram responds with RetryAfter.
+        Tokens do not accumulate during the pause, so sending resumes at the configured rate rather than in a burst.
+        :param seconds: The duration of the pause.
+        """
+        now = time.monotonic()
+        self.refill(now)
+        self.tokens = min(self.tokens, 0.0)
+        self.updated = max(self.updated, now + seconds)
+
+    def refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated) * self.messages_per_second,
+            )
+            self.updated = now
+
+    def prune(self, now: float) -> None:
+        self.next_allowed = {
+            chat_id: allowed
+            for chat_id, allowed in self.next_allowed.items()
+            if allowed > now
+        }
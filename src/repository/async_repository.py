@@ -0,0 +1,109 @@
+import asyncio
+import datetime
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, Callable
+
+from pyautowire import Injectable
+
+from src.model.daily_rollup import DailyRollup
+from src.model.record import Record
+from src.model.user import User
+from src.repository.record_repository import RecordRepository, BulkWriteResult
+from src.repository.user_repository import UserRepository
+
+
+class AsyncRepository:
+    """
+    Runs the blocking pymongo and boto3 calls of a synchronous repository on an executor,
+    so that a slow database round trip does not block the event loop that processes all other updates.
+    The synchronous repositories are thus called from several threads at once; pymongo clients are thread-safe,
+    and the DynamoDB repositories use a Table resource per thread.
+    """
+
+    executor: Executor
+
+    def __init__(self, executor: Executor):
+        self.executor = executor
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+
+class AsyncUserRepository(AsyncRepository, Injectable):
+    user_repository: UserRepository
+
+    def __init__(self, user_repository: UserRepository, executor: Executor):
+        super().__init__(executor)
+        self.user_repository = user_repository
+
+    async def find_user(self, user_id: int) -> User | None:
+        return await self.run(self.user_repository.find_user, user_id)
+
+    async def create_user(self, user_id: int) -> User:
+        return await self.run(self.user_repository.create_user, user_id)
+
+    async def update_user(self, user: User) -> None:
+        await self.run(self.user_repository.update_user, user)
+
+    async def find_all_users(self) -> list[User]:
+        return await self.run(self.user_repository.find_all_users)
+
+    async def find_users(self, user_ids: list[int]) -> list[User]:
+        return await self.run(self.user_repository.find_users, user_ids)
+
+
+class AsyncRecordRepository(AsyncRepository, Injectable):
+    record_repository: RecordRepository
+
+    def __init__(self, record_repository: RecordRepository, executor: Executor):
+        super().__init__(executor)
+        self.record_repository = record_repository
+
+    async def get_latest_record_for_user(self, user_id: int) -> Record | None:
+        return await self.run(
+            self.record_repository.get_latest_record_for_user, user_id
+        )
+
+    async def get_latest_records_for_user(
+        self, user_id: int, limit: int
+    ) -> list[Record]:
+        return await self.run(
+            self.record_repository.get_latest_records_for_user, user_id, limit
+        )
+
+    async def create_record(self, user_id: int, record_data: dict, timestamp: str):
+        await self.run(
+            self.record_repository.create_record, user_id, record_data, timestamp
+        )
+
+    async def save_record(self, record: Record):
+        await self.run(self.record_repository.save_record, record)
+
+    async def create_records_bulk(self, records: list[Record]) -> BulkWriteResult:
+        return await self.run(self.record_repository.create_records_bulk, records)
+
+    async def find_records_for_user(self, user_id: int) -> list[Record]:
+        return await self.run(self.record_repository.find_records_for_user, user_id)
+
+    async def find_records_for_time_range(
+        self, user_id: int, beginning: datetime.datetime, end: datetime.datetime
+    ) -> list[Record]:
+        return await self.run(
+            self.record_repository.find_records_for_time_range, user_id, beginning, end
+        )
+
+    async def find_latest_record_timestamps(
+        self, user_ids: list[int], date: datetime.date
+    ) -> dict[int, datetime.datetime]:
+        return await self.run(
+            self.record_repository.find_latest_record_timestamps, user_ids, date
+        )
+
+    async def find_daily_rollups(
+        self, user_id: int, beginning: datetime.date, end: datetime.date
+    ) -> list[DailyRollup]:
+        return await self.run(
+            self.record_repository.find_daily_rollups, user_id, beginning, end
+        )
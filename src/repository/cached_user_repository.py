@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterator
+
+from src.model.user import User, UserSchedule
+from src.repository.user_repository import UserRepository
+
+
+class CachedUserRepository(UserRepository):
+    """
+    Read-through cache in front of another UserRepository.
+    Users are looked up on every button press, but their configuration rarely changes, so find_user() results are
+    held in a size-bounded LRU cache with a TTL. Writes go through to the underlying repository and invalidate the
+    cached entry. The cache is local to the process; other processes writing to the same database
+    are only picked up once the TTL expires.
+    Every invalidation increments the generation of the user. Users are only cached if their generation did not
+    change while they were retrieved, so that a lookup concurrent to an update cannot cache the outdated user.
+    """
+
+    def __init__(
+        self,
+        user_repository: UserRepository,
+        max_size: int = 1024,
+        ttl_seconds: float = 300,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.user_repository = user_repository
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.cache: OrderedDict[int, tuple[float, User]] = OrderedDict()
+        self.generations: dict[int, int] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        logging.info(
+            f"CachedUserRepository initialized for {user_repository.__class__.__name__} "
+            f"with max_size={max_size}, ttl_seconds={ttl_seconds}."
+        )
+
+    def find_user(self, user_id: int) -> User | None:
+        with self.lock:
+            entry = self.cache.get(user_id)
+            if entry is not None and entry[0] > self.clock():
+                self.cache.move_to_end(user_id)
+                self.hits += 1
+                # Users are mutable, so callers receive a copy that they can modify without affecting the cache
+                return entry[1].model_copy(deep=True)
+            self.misses += 1
+            generation = self.generations.get(user_id, 0)
+        user = self.user_repository.find_user(user_id)
+        if user is not None:
+            self.put(user, generation)
+        return user
+
+    def create_user(self, user_id: int, **kwargs) -> User:
+        user = self.user_repository.create_user(user_id, **kwargs)
+        self.invalidate(user_id)
+        return user
+
+    def update_user(self, user: User) -> None:
+        self.user_repository.update_user(user)
+        self.invalidate(user.user_id)
+
+    def find_all_users(self) -> list[User]:
+        return self.user_repository.find_all_users()
+
+    def find_users(self, user_ids: list[int]) -> list[User]:
+        """
+        Serves cached users from the cache and retrieves all others from the underlying repository at once.
+        """
+        users = []
+        missing = {}
+        now = self.clock()
+        with self.lock:
+            for user_id in user_ids:
+                entry = self.cache.get(user_id)
+                if entry is not None and entry[0] > now:
+                    self.cache.move_to_end(user_id)
+                    self.hits += 1
+                    users.append(entry[1].model_copy(deep=True))
+                else:
+                    self.misses += 1
+                    missing[user_id] = self.generations.get(user_id, 0)
+        if missing:
+            for user in self.user_repository.find_users(list(missing)):
+                self.put(user, missing[user.user_id])
+                users.append(user)
+        return users
+
+    def iter_user_schedules(self, batch_size: int = 500) -> Iterator[UserSchedule]:
+        return self.user_repository.iter_user_schedules(batch_size)
+
+    def put(self, user: User, generation: int) -> None:
+        """
+        Caches the user, unless they were invalidated since the given generation was read.
+        """
+        with self.lock:
+            if self.generations.get(user.user_id, 0) != generation:
+                return
+            self.cache[user.user_id] = (
+                self.clock() + self.ttl_seconds,
+                user.model_copy(deep=True),
+            )
+            self.cache.move_to_end(user.user_id)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self.lock:
+            self.cache.pop(user_id, None)
+            self.generations[user_id] = self.generations.get(user_id, 0) + 1
+
+    def statistics(self) -> dict:
+        """
+        :return: hit and miss counters, the hit rate and the current number of cached users.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.cache),
+            }
@@ -0,0 +1,24 @@
+from typing import Iterator
+
+# maximum number of keys of a single BatchGetItem request
+BATCH_GET_LIMIT = 100
+
+
+def batch_get_items(table, keys: list[dict], **arguments) -> Iterator[dict]:
+    """
+    Retrieves items by their keys with as few BatchGetItem requests as possible.
+    Keys that DynamoDB leaves unprocessed, e.g. due to throttling, are requested again.
+    :param table: the boto3 Table resource to read from.
+    :param keys: primary keys of the items to retrieve.
+    :param arguments: further arguments for the table in the request, e.g. a ProjectionExpression.
+    :return: iterator over the retrieved items, in no particular order. Missing items are omitted.
+    """
+    client = table.meta.client
+    for start in range(0, len(keys), BATCH_GET_LIMIT):
+        request = {
+            table.name: {"Keys": keys[start : start + BATCH_GET_LIMIT], **arguments}
+        }
+        while request:
+            response = client.batch_get_item(RequestItems=request)
+            yield from response["Responses"].get(table.name, [])
+            request = response.get("UnprocessedKeys")
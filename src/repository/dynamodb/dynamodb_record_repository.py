@@ -1,19 +1,43 @@
 import datetime
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
 
 import boto3
 from boto3.dynamodb.conditions import Key
 
+from src.model.daily_rollup import DailyRollup, MetricRollup
 from src.model.record import Record
+from src.repository.dynamodb.batch_get import batch_get_items
+from src.repository.dynamodb.tables import ThreadLocalTables
+from src.instrumentation import instrument_repository
 from src.repository.record_repository import RecordRepository
 
 
+# number of threads that merge daily rollups in parallel
+MERGE_WORKERS = 8
+RECORD_TABLE = "record"
+ROLLUP_TABLE = "daily_rollup"
+
+
+@instrument_repository
 class DynamoDBRecordRepository(RecordRepository):
     def __init__(self, dynamodb: boto3.resource):
-        self.table = dynamodb.Table("record")
+        self.tables = ThreadLocalTables(dynamodb)
+        # the low-level client is thread-safe and shared by all threads
+        self.client = dynamodb.meta.client
         self.table.load()
+        self.rollups.load()
         logging.info("DynamoDBRecordRepository initialized.")
 
+    @property
+    def table(self):
+        return self.tables.table(RECORD_TABLE)
+
+    @property
+    def rollups(self):
+        return self.tables.table(ROLLUP_TABLE)
+
     def get_latest_record_for_user(self, user_id: int) -> Record | None:
         result = self.get_latest_records_for_user(user_id, 1)
         if result:
@@ -33,33 +57,300 @@ class DynamoDBRecordRepository(RecordRepository):
         return []
 
     def create_record(self, user_id: int, record_data: dict, timestamp: str):
-        self.table.put_item(
-            Item={"user_id": user_id, "data": record_data, "timestamp": timestamp}
-        )
+        if self.put_record(
+            {"user_id": user_id, "data": record_data, "timestamp": timestamp}
+        ):
+            self.update_daily_rollup(
+                user_id, record_data, datetime.datetime.fromisoformat(timestamp)
+            )
+
+    def put_record(self, item: dict) -> bool:
+        """
+        Puts a record unless a record with the same key already exists, e.g. because a write that timed out
+        after succeeding is retried. Overwriting it would count the record in its daily rollup twice.
+        :return: whether the record was written.
+        """
+        table = self.table
+        try:
+            table.put_item(
+                Item=item, ConditionExpression="attribute_not_exists(user_id)"
+            )
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            logging.warning(
+                f"Record of user {item['user_id']} at {item['timestamp']} already exists, it is not written again"
+            )
+            return False
+        return True
 
     def find_records_for_user(self, user_id: int) -> list[Record]:
-        return [
-            self.parse_record(r)
-            for r in list(
-                self.table.query(KeyConditionExpression=Key("user_id").eq(user_id))[
-                    "Items"
-                ]
+        return list(self.iter_records(user_id))
+
+    def iter_records(
+        self,
+        user_id: int,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+        batch_size: int = 100,
+        projection: list[str] | None = None,
+    ) -> Iterator[Record]:
+        """
+        Streams the records of a user page by page.
+        :param projection: optional list of attributes to retrieve, e.g. ["user_id", "timestamp", "data.mood"].
+        """
+        key_condition = Key("user_id").eq(user_id)
+        if start is not None and end is not None:
+            key_condition &= Key("timestamp").between(
+                start.isoformat(), end.isoformat()
             )
-        ]
+        elif start is not None:
+            key_condition &= Key("timestamp").gte(start.isoformat())
+        elif end is not None:
+            key_condition &= Key("timestamp").lte(end.isoformat())
+        for item in self.query_all(
+            KeyConditionExpression=key_condition,
+            Limit=batch_size,
+            **self.projection_arguments(projection),
+        ):
+            yield self.parse_record(item)
 
     def save_record(self, record: Record):
-        self.table.put_item(Item=record.serialize())
+        if self.put_record(record.serialize()):
+            self.update_daily_rollup(record.user_id, record.data, record.timestamp)
 
     def find_records_for_time_range(
-        self, user_id: int, beginning: datetime.datetime, end: datetime.datetime
+        self,
+        user_id: int,
+        beginning: datetime.datetime,
+        end: datetime.datetime,
+        projection: list[str] | None = None,
     ) -> list[Record]:
-        return [
-            self.parse_record(r)
-            for r in self.table.scan(
-                FilterExpression=Key("user_id").eq(user_id)
-                & Key("timestamp").between(beginning.isoformat(), end.isoformat())
-            )["Items"]
-        ]
+        """
+        Retrieves all records of a user within a time range.
+        Uses a key-conditioned query on the user_id partition key and the timestamp sort key,
+        so that only the user's records within the time range are read.
+        :param user_id: user for whom to retrieve records.
+        :param beginning: start of the time range (inclusive).
+        :param end: end of the time range (inclusive).
+        :param projection: optional list of attributes to retrieve, e.g. ["user_id", "timestamp", "data.mood"].
+        :return: list of records within the time range.
+        """
+        logging.info(
+            f"Retrieving data for between {beginning} and {end} for user {user_id}"
+        )
+        return list(self.iter_records(user_id, beginning, end, projection=projection))
+
+    def find_existing_record_keys(self, records: list[Record]) -> set[tuple[int, str]]:
+        items = batch_get_items(
+            self.table,
+            [
+                {"user_id": record.user_id, "timestamp": record.timestamp.isoformat()}
+                for record in records
+            ],
+            ProjectionExpression="user_id, #timestamp",
+            ExpressionAttributeNames={"#timestamp": "timestamp"},
+        )
+        return {(int(item["user_id"]), item["timestamp"]) for item in items}
+
+    def insert_records(self, records: list[Record]):
+        # The batch writer sends up to 25 items per BatchWriteItem request and
+        # resubmits any UnprocessedItems that DynamoDB returns when it throttles a request.
+        with self.table.batch_writer(
+            overwrite_by_pkeys=["user_id", "timestamp"]
+        ) as batch:
+            for record in records:
+                batch.put_item(Item=record.serialize())
+
+    def merge_daily_rollups(self, rollups: list[DailyRollup]):
+        """
+        Sums and counts are incremented atomically with ADD, which also creates the rollup if it does not exist.
+        DynamoDB has no atomic minimum or maximum, so those are initialized with if_not_exists and then
+        lowered or raised with conditional updates, which only happen if the rollup actually sets a new extreme.
+        DynamoDB cannot batch updates, so multiple rollups are merged by a small pool of threads instead of one by one.
+        """
+        if len(rollups) <= 1:
+            for rollup in rollups:
+                self.merge_daily_rollup(rollup)
+            return
+        with ThreadPoolExecutor(
+            max_workers=MERGE_WORKERS, thread_name_prefix="rollup"
+        ) as executor:
+            # consume the results, so that exceptions of the workers are raised
+            list(executor.map(self.merge_daily_rollup, rollups))
+
+    def merge_daily_rollup(self, rollup: DailyRollup):
+        """
+        Merges a single rollup. Uses the low-level client, which unlike the Table resource is thread-safe,
+        so that the short-lived rollup workers do not create resources of their own.
+        """
+        key = {"user_id": rollup.user_id, "date": rollup.date.isoformat()}
+        names = {"#record_count": "record_count", "#latest": "latest_timestamp"}
+        values = {
+            ":record_count": rollup.record_count,
+            ":latest": rollup.latest_timestamp.isoformat(),
+        }
+        additions = ["#record_count :record_count"]
+        initializations = ["#latest = if_not_exists(#latest, :latest)"]
+        for index, (metric_name, metric) in enumerate(rollup.metrics.items()):
+            for aggregate in ["sum", "count", "min", "max"]:
+                names[f"#{aggregate}{index}"] = rollup_attribute(metric_name, aggregate)
+                values[f":{aggregate}{index}"] = getattr(metric, aggregate)
+            additions += [f"#sum{index} :sum{index}", f"#count{index} :count{index}"]
+            initializations += [
+                f"#min{index} = if_not_exists(#min{index}, :min{index})",
+                f"#max{index} = if_not_exists(#max{index}, :max{index})",
+            ]
+        stored = self.client.update_item(
+            TableName=ROLLUP_TABLE,
+            Key=key,
+            UpdateExpression=f"ADD {', '.join(additions)} SET {', '.join(initializations)}",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+            ReturnValues="ALL_NEW",
+        )["Attributes"]
+        self.update_extremes(key, rollup, stored)
+
+    def update_extremes(self, key: dict, rollup: DailyRollup, stored: dict):
+        """
+        Lowers or raises the minima, maxima and latest timestamp of a stored rollup, where the merged rollup
+        sets a new extreme that if_not_exists did not apply.
+        """
+        latest_timestamp = rollup.latest_timestamp.isoformat()
+        if stored["latest_timestamp"] < latest_timestamp:
+            self.update_extreme(key, "latest_timestamp", latest_timestamp, ">")
+        for metric_name, metric in rollup.metrics.items():
+            if stored[rollup_attribute(metric_name, "min")] > metric.min:
+                self.update_extreme(
+                    key, rollup_attribute(metric_name, "min"), metric.min, "<"
+                )
+            if stored[rollup_attribute(metric_name, "max")] < metric.max:
+                self.update_extreme(
+                    key, rollup_attribute(metric_name, "max"), metric.max, ">"
+                )
+
+    def update_extreme(self, key: dict, attribute: str, value, comparison: str):
+        """
+        Sets an attribute to a value if the value is a new minimum ("<") or maximum (">").
+        The comparison is part of the condition, so a concurrent update with a more extreme value is never overwritten.
+        """
+        try:
+            self.client.update_item(
+                TableName=ROLLUP_TABLE,
+                Key=key,
+                UpdateExpression="SET #attribute = :value",
+                ConditionExpression=f":value {comparison} #attribute",
+                ExpressionAttributeNames={"#attribute": attribute},
+                ExpressionAttributeValues={":value": value},
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            logging.info(f"{attribute} of rollup {key} was updated concurrently")
+
+    def find_daily_rollups(
+        self, user_id: int, beginning: datetime.date, end: datetime.date
+    ) -> list[DailyRollup]:
+        items = self.query_all(
+            self.rollups,
+            KeyConditionExpression=Key("user_id").eq(user_id)
+            & Key("date").between(beginning.isoformat(), end.isoformat()),
+        )
+        return [parse_rollup(item) for item in items]
+
+    def find_latest_record_timestamps(
+        self, user_ids: list[int], date: datetime.date
+    ) -> dict[int, datetime.datetime]:
+        keys = [{"user_id": user_id, "date": date.isoformat()} for user_id in user_ids]
+        items = batch_get_items(
+            self.rollups,
+            keys,
+            ProjectionExpression="user_id, latest_timestamp",
+        )
+        return {
+            int(item["user_id"]): datetime.datetime.fromisoformat(
+                item["latest_timestamp"]
+            )
+            for item in items
+        }
+
+    def save_daily_rollups(self, rollups: list[DailyRollup]):
+        with self.rollups.batch_writer(overwrite_by_pkeys=["user_id", "date"]) as batch:
+            for rollup in rollups:
+                item = {
+                    "user_id": rollup.user_id,
+                    "date": rollup.date.isoformat(),
+                    "record_count": rollup.record_count,
+                    "latest_timestamp": rollup.latest_timestamp.isoformat(),
+                }
+                for metric_name, metric in rollup.metrics.items():
+                    for aggregate, value in metric.model_dump().items():
+                        item[rollup_attribute(metric_name, aggregate)] = value
+                batch.put_item(Item=item)
+
+    def query_all(self, table=None, **query_arguments) -> Iterator[dict]:
+        """
+        Runs a query and follows the LastEvaluatedKey until all pages have been read.
+        DynamoDB returns at most 1 MB of data per page, so a single query() call may not return all results.
+        :param table: table to query; defaults to the record table.
+        :param query_arguments: arguments passed to table.query().
+        :return: iterator over all items matching the query.
+        """
+        table = table or self.table
+        while True:
+            response = table.query(**query_arguments)
+            yield from response.get("Items", [])
+            if "LastEvaluatedKey" not in response:
+                return
+            query_arguments["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    @staticmethod
+    def projection_arguments(projection: list[str] | None) -> dict:
+        """
+        Creates the ProjectionExpression and ExpressionAttributeNames for a query.
+        "data" and "timestamp" are reserved words in DynamoDB, so every attribute name is replaced with a placeholder.
+        :param projection: list of attribute paths to retrieve, with nested attributes separated by dots.
+        :return: keyword arguments for table.query(); empty if no projection is provided.
+        """
+        if not projection:
+            return {}
+        attribute_names = {}
+        placeholders = {}
+        for path in projection:
+            for attribute in path.split("."):
+                if attribute not in placeholders:
+                    placeholders[attribute] = f"#p{len(placeholders)}"
+                    attribute_names[placeholders[attribute]] = attribute
+        expression = ", ".join(
+            ".".join(placeholders[attribute] for attribute in path.split("."))
+            for path in projection
+        )
+        return {
+            "ProjectionExpression": expression,
+            "ExpressionAttributeNames": attribute_names,
+        }
+
+
+def rollup_attribute(metric_name: str, aggregate: str) -> str:
+    """
+    Rollups are stored flat, with one attribute per metric and aggregate, e.g. "metric:mood:sum".
+    Nested maps would have to exist before their attributes can be incremented, which would cost another write.
+    """
+    return f"metric:{metric_name}:{aggregate}"
+
+
+def parse_rollup(item: dict) -> DailyRollup:
+    metrics = {}
+    for attribute, value in item.items():
+        if attribute.startswith("metric:"):
+            metric_name, aggregate = attribute[len("metric:") :].rsplit(":", 1)
+            metrics.setdefault(metric_name, {})[aggregate] = int(value)
+    return DailyRollup(
+        user_id=int(item["user_id"]),
+        date=item["date"],
+        record_count=int(item["record_count"]),
+        latest_timestamp=item["latest_timestamp"],
+        metrics={
+            metric_name: MetricRollup(**aggregates)
+            for metric_name, aggregates in metrics.items()
+        },
+    )
 
 
 def modify_timestamp(timestamp: str, offset: int) -> datetime.datetime:
@@ -1,20 +1,29 @@
 import json
 import logging
+from typing import Iterator
 
 import boto3
 from pyautowire import autowire
 
 from src.config.config import Configuration
-from src.model.user import User
+from src.model.user import User, UserSchedule
+from src.repository.dynamodb.batch_get import batch_get_items
+from src.repository.dynamodb.tables import ThreadLocalTables
+from src.instrumentation import instrument_repository
 from src.repository.user_repository import UserRepository
 
 
+@instrument_repository
 class DynamoDBUserRepository(UserRepository):
     def __init__(self, dynamodb: boto3.resource):
-        self.table = dynamodb.Table("user")
+        self.tables = ThreadLocalTables(dynamodb)
         self.table.load()
         logging.info("DynamoDBUserRepository initialized.")
 
+    @property
+    def table(self):
+        return self.tables.table("user")
+
     @autowire("configuration")
     def create_user(self, user_id: int, configuration: Configuration) -> User:
         user = User.from_defaults(user_id, configuration)
@@ -36,6 +45,27 @@ class DynamoDBUserRepository(UserRepository):
         response = self.table.scan()
         return [self.parse_user(item) for item in response["Items"]]
 
+    def find_users(self, user_ids: list[int]) -> list[User]:
+        keys = [{"user_id": user_id} for user_id in user_ids]
+        return [self.parse_user(item) for item in batch_get_items(self.table, keys)]
+
+    def iter_user_schedules(self, batch_size: int = 500) -> Iterator[UserSchedule]:
+        """
+        Scans the user table page by page, only retrieving the attributes of UserSchedule.
+        The metrics, which are stored as a JSON string, are therefore neither transferred nor parsed.
+        """
+        scan_arguments = {
+            "ProjectionExpression": "user_id, notifications, auto_baseline_config",
+            "Limit": batch_size,
+        }
+        while True:
+            response = self.table.scan(**scan_arguments)
+            for item in response.get("Items", []):
+                yield UserSchedule(**item)
+            if "LastEvaluatedKey" not in response:
+                return
+            scan_arguments["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
     @staticmethod
     def parse_user(result: dict) -> User:
         result["metrics"] = json.loads(result.get("metrics", "[]"))
@@ -0,0 +1,41 @@
+import threading
+
+import boto3
+
+
+class ThreadLocalTables:
+    """
+    Provides boto3 Table resources per thread.
+    Resources are not thread-safe, but the repositories are called from the threads of the repository executor,
+    the rollup workers and the migration workers. Every thread therefore gets a resource of its own, created from
+    a session of its own for the region and endpoint of the given resource. Credentials are resolved by each session
+    from the environment, exactly as for the given resource.
+    """
+
+    def __init__(self, dynamodb: boto3.resource):
+        client_meta = dynamodb.meta.client.meta
+        self.region_name = client_meta.region_name
+        self.endpoint_url = client_meta.endpoint_url
+        self.local = threading.local()
+        # the creating thread keeps using the given resource
+        self.local.dynamodb = dynamodb
+
+    def resource(self) -> boto3.resource:
+        dynamodb = getattr(self.local, "dynamodb", None)
+        if dynamodb is None:
+            dynamodb = boto3.session.Session().resource(
+                "dynamodb", region_name=self.region_name, endpoint_url=self.endpoint_url
+            )
+            self.local.dynamodb = dynamodb
+        return dynamodb
+
+    def table(self, name: str):
+        """
+        :return: the Table resource of the calling thread for the table with the given name.
+        """
+        tables = getattr(self.local, "tables", None)
+        if tables is None:
+            tables = self.local.tables = {}
+        if name not in tables:
+            tables[name] = self.resource().Table(name)
+        return tables[name]
@@ -1,12 +1,17 @@
 import logging
 import os
+from concurrent.futures import Executor, ThreadPoolExecutor
 
 import boto3
+from boto3.resources.base import ServiceResource
 import pymongo
 
 from src.config.config import Configuration
+from src.repository.async_repository import AsyncUserRepository, AsyncRecordRepository
+from src.repository.cached_user_repository import CachedUserRepository
 from src.repository.dynamodb.dynamodb_record_repository import DynamoDBRecordRepository
 from src.repository.dynamodb.dynamodb_user_repository import DynamoDBUserRepository
+from src.repository.mongodb.indexes import ensure_indexes
 from src.repository.mongodb.mongodb_record_repository import MongoDBRecordRepository
 from src.repository.mongodb.mongodb_user_repository import MongoDBUserRepository
 from src.repository.record_repository import RecordRepository
@@ -14,10 +19,12 @@ from src.repository.user_repository import UserRepository
 
 
 def initialize_database(
-    configuration: Configuration,
+    configuration: Configuration, executor: Executor | None = None
 ) -> tuple[UserRepository, RecordRepository]:
     """
     Initializes the database by creating the tables if they do not exist.
+    :param executor: the executor for the blocking database calls of the asynchronous repositories.
+    If None, an executor of the configured size is created.
     """
     if configuration.database.type == "dynamodb":
         dynamodb = initialize_dynamodb_client(configuration.database.aws_region)
@@ -26,16 +33,69 @@ def initialize_database(
         record_repository = DynamoDBRecordRepository(dynamodb)
     else:
         mongo_client = initialize_mongo_client()
+        ensure_indexes(mongo_client)
 
         # Create repositories and register them
         user_repository = MongoDBUserRepository(mongo_client)
         record_repository = MongoDBRecordRepository(mongo_client)
 
+    user_cache_config = configuration.database.user_cache
+    if user_cache_config.enabled:
+        user_repository = CachedUserRepository(
+            user_repository,
+            max_size=user_cache_config.max_size,
+            ttl_seconds=user_cache_config.ttl_seconds,
+        )
+
+    initialize_async_repositories(
+        user_repository,
+        record_repository,
+        executor or create_repository_executor(configuration.database.thread_pool_size),
+    )
     return user_repository.register(
         alias="user_repository"
     ), record_repository.register(alias="record_repository")
 
 
+def initialize_state_database(
+    configuration: Configuration,
+) -> pymongo.MongoClient | ServiceResource | None:
+    """
+    Connects to the database that stores the conversation state, if the state is not kept in memory or SQLite.
+    The state is stored in the configured database, whose indexes or tables are created along with the others.
+    """
+    if configuration.state.backend == "dynamodb":
+        return initialize_dynamodb_client(configuration.database.aws_region)
+    if configuration.state.backend == "mongodb":
+        return initialize_mongo_client()
+    return None
+
+
+def create_repository_executor(thread_pool_size: int) -> ThreadPoolExecutor:
+    """
+    Creates the bounded thread pool on which the blocking database calls of the handlers are run.
+    """
+    return ThreadPoolExecutor(
+        max_workers=thread_pool_size, thread_name_prefix="repository"
+    )
+
+
+def initialize_async_repositories(
+    user_repository: UserRepository,
+    record_repository: RecordRepository,
+    executor: Executor,
+) -> tuple[AsyncUserRepository, AsyncRecordRepository]:
+    """
+    Creates and registers the asynchronous facades for the repositories, which are used by the handlers.
+    Both facades share a bounded thread pool for their blocking database calls.
+    """
+    return AsyncUserRepository(user_repository, executor).register(
+        alias="async_user_repository"
+    ), AsyncRecordRepository(record_repository, executor).register(
+        alias="async_record_repository"
+    )
+
+
 def initialize_dynamodb_client(aws_region: str) -> boto3.resource:
     """
     Initializes the DynamoDB client.
@@ -1,10 +1,15 @@
 import logging
 
 import src.repository.user_repository as user_repository
-from src.app import initialize_mongo_client, initialize_dynamodb_client
 from src.config.config import ConfigurationProvider
+from src.repository.initialize import (
+    initialize_database,
+    initialize_mongo_client,
+    initialize_dynamodb_client,
+)
 from src.repository.dynamodb.dynamodb_record_repository import DynamoDBRecordRepository
 from src.repository.dynamodb.dynamodb_user_repository import DynamoDBUserRepository
+from src.repository.migration_engine import MigrationEngine
 from src.repository.mongodb.mongodb_record_repository import MongoDBRecordRepository
 from src.repository.mongodb.mongodb_user_repository import MongoDBUserRepository
 
@@ -37,11 +42,8 @@ def migrate_record_format():
 
     for user in [mongodb_user_repository.find_user(1965256751)]:
         logging.info("Migrating user %s" % user)
-        user_records = mongodb_record_repository.find_records_for_user(user.user_id)
-        logging.info(
-            "Migrating %d records for user %s" % (len(user_records), user.user_id)
-        )
-        for record in user_records:
+        migrated_records = 0
+        for record in mongodb_record_repository.iter_records(user.user_id):
             record_dict = record.dict()
             record_dict["data"] = record_dict.pop("record")
             logging.info("Migrating record %s" % record_dict)
@@ -53,12 +55,25 @@ def migrate_record_format():
                 },
                 {"$set": record_dict, "$unset": {"record": ""}},
             )
+            migrated_records += 1
+        logging.info(
+            "Migrated %d records for user %s" % (migrated_records, user.user_id)
+        )
 
 
-def migrate_from_mongodb_to_dynamodb():
+def migrate_from_mongodb_to_dynamodb(
+    checkpoint_path: str = "migration_checkpoint.json",
+    workers: int = 4,
+    dry_run: bool = False,
+):
     """
     As of 0.4.0, DynamoDB is supported as a persistence backend.
     This function migrates all users from MongoDB to DynamoDB.
+    Migrated users are checkpointed, so an interrupted migration can simply be started again.
+    Run with dry_run=True afterwards to verify that the record counts and checksums of all users match.
+    :param checkpoint_path: file in which the IDs of migrated users are kept.
+    :param workers: number of users that are migrated concurrently.
+    :param dry_run: only compare source and target instead of migrating.
     :return:
     """
     configuration = ConfigurationProvider().get_configuration().register()
@@ -74,15 +89,36 @@ def migrate_from_mongodb_to_dynamodb():
     mongodb_user_repository = MongoDBUserRepository(mongo_client)
     mongodb_record_repository = MongoDBRecordRepository(mongo_client)
 
-    for user in mongodb_user_repository.find_all_users():
-        logging.info("Migrating user %s" % user.user_id)
-        dynamodb_user_repository.create_user(user.user_id)
-        dynamodb_user_repository.update_user(user)
-        user_records = mongodb_record_repository.find_records_for_user(user.user_id)
-        logging.info(
-            "Migrating %d records for user %s" % (len(user_records), user.user_id)
+    engine = MigrationEngine(
+        mongodb_user_repository,
+        mongodb_record_repository,
+        dynamodb_user_repository,
+        dynamodb_record_repository,
+        checkpoint_path=checkpoint_path,
+        workers=workers,
+    )
+    report = engine.run(dry_run=dry_run)
+    for user_id, error in report.failed_users.items():
+        logging.error("Migration of user %s failed: %s" % (user_id, error))
+    for verification in report.mismatches:
+        logging.error(
+            "User %s does not match: %s" % (verification.user_id, verification)
         )
-        for record in user_records:
-            dynamodb_record_repository.create_record(
-                record.user_id, record.data, record.timestamp
-            )
+    return report
+
+
+def migrate_daily_rollups():
+    """
+    As of 0.6.0, graphs are calculated from daily rollups, which are maintained whenever a record is created.
+    This function backfills the rollups of all users from their existing records.
+    It can be run repeatedly, since rebuilding a rollup replaces it.
+    :return:
+    """
+    configuration = ConfigurationProvider().get_configuration().register()
+    user_repository, record_repository = initialize_database(configuration)
+
+    # users are streamed page by page, only retrieving their IDs and schedules
+    for user in user_repository.iter_user_schedules():
+        logging.info("Rebuilding daily rollups for user %s" % user.user_id)
+        rollups = record_repository.rebuild_daily_rollups(user.user_id)
+        logging.info("Rebuilt %d daily rollups for user %s" % (rollups, user.user_id))
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from src.model.record import Record
+from src.model.user import User
+from src.repository.record_repository import RecordRepository
+from src.repository.user_repository import UserRepository
+
+"""
+Engine for migrating users and their records from one persistence backend to another,
+e.g. from MongoDB to DynamoDB.
+Users are migrated concurrently and every migrated user is checkpointed, so an interrupted migration
+resumes with the users that have not been migrated yet instead of starting over.
+"""
+
+
+class MigrationCheckpoint:
+    """
+    Persists the IDs of completely migrated users in a JSON file.
+    The file is replaced atomically, so a crash while writing it never loses earlier checkpoints.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.completed: set[int] = set()
+        if os.path.exists(path):
+            with open(path) as checkpoint:
+                self.completed = set(json.load(checkpoint)["completed_users"])
+            logging.info(
+                f"Resuming migration, {len(self.completed)} users have already been migrated"
+            )
+
+    def is_completed(self, user_id: int) -> bool:
+        with self.lock:
+            return user_id in self.completed
+
+    def mark_completed(self, user_id: int) -> None:
+        with self.lock:
+            self.completed.add(user_id)
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, "w") as checkpoint:
+                json.dump({"completed_users": sorted(self.completed)}, checkpoint)
+            os.replace(temporary_path, self.path)
+
+
+@dataclass
+class UserVerification:
+    user_id: int
+    source_count: int
+    target_count: int
+    source_checksum: str
+    target_checksum: str
+
+    @property
+    def matches(self) -> bool:
+        return (
+            self.source_count == self.target_count
+            and self.source_checksum == self.target_checksum
+        )
+
+
+@dataclass
+class MigrationReport:
+    migrated_users: list[int] = field(default_factory=list)
+    skipped_users: list[int] = field(default_factory=list)
+    failed_users: dict[int, str] = field(default_factory=dict)
+    verifications: list[UserVerification] = field(default_factory=list)
+    records: int = 0
+    seconds: float = 0.0
+
+    @property
+    def mismatches(self) -> list[UserVerification]:
+        return [
+            verification
+            for verification in self.verifications
+            if not verification.matches
+        ]
+
+
+def checksum(records: Iterable[Record]) -> tuple[int, str]:
+    """
+    Calculates a checksum over records in the order in which they are returned, i.e. ascending timestamps.
+    :return: the number of records and the hex digest of their checksum.
+    """
+    digest = hashlib.sha256()
+    count = 0
+    for record in records:
+        digest.update(json.dumps(record.serialize(), sort_keys=True).encode())
+        count += 1
+    return count, digest.hexdigest()
+
+
+class MigrationEngine:
+    """
+    Migrates users with a pool of worker threads. Each user is migrated by copying the user, writing their records
+    in batches and rebuilding their daily rollups. Writes to the target must be idempotent (as DynamoDB puts are),
+    so that a user whose migration was interrupted can simply be migrated again.
+    The repositories are used by all workers at once. The DynamoDB repositories are safe to share, since every worker
+    thread queries and writes through a Table resource, and thus batch writers, of its own.
+    """
+
+    def __init__(
+        self,
+        source_user_repository: UserRepository,
+        source_record_repository: RecordRepository,
+        target_user_repository: UserRepository,
+        target_record_repository: RecordRepository,
+        checkpoint_path: str = "migration_checkpoint.json",
+        workers: int = 4,
+        batch_size: int = 500,
+    ):
+        self.source_user_repository = source_user_repository
+        self.source_record_repository = source_record_repository
+        self.target_user_repository = target_user_repository
+        self.target_record_repository = target_record_repository
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def run(self, dry_run: bool = False) -> MigrationReport:
+        """
+        Migrates all users that have not been migrated yet.
+        :param dry_run: if True, nothing is written. Instead, the record counts and checksums of every user
+        are compared between source and target, e.g. to verify a finished migration.
+        :return: report of the migrated, skipped and failed users, or of the verified users in a dry run.
+        """
+        start = time.perf_counter()
+        report = MigrationReport()
+        users = self.source_user_repository.find_all_users()
+        checkpoint = None if dry_run else MigrationCheckpoint(self.checkpoint_path)
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="migration"
+        ) as executor:
+            if dry_run:
+                futures = {
+                    executor.submit(self.verify_user, user.user_id): user
+                    for user in users
+                }
+            else:
+                report.skipped_users = [
+                    user.user_id
+                    for user in users
+                    if checkpoint.is_completed(user.user_id)
+                ]
+                futures = {
+                    executor.submit(self.migrate_user, user, checkpoint): user
+                    for user in users
+                    if not checkpoint.is_completed(user.user_id)
+                }
+            for future in as_completed(futures):
+                user_id = futures[future].user_id
+                try:
+                    result = future.result()
+                except Exception as exception:
+                    action = "verify" if dry_run else "migrate"
+                    logging.exception(f"Failed to {action} user {user_id}")
+                    report.failed_users[user_id] = repr(exception)
+                    continue
+                if dry_run:
+                    report.verifications.append(result)
+                else:
+                    report.migrated_users.append(user_id)
+                    report.records += result
+        report.seconds = time.perf_counter() - start
+        if dry_run:
+            logging.info(
+                f"Verified {len(report.verifications)} users in {report.seconds:.2f}s, "
+                f"{len(report.mismatches)} mismatches"
+            )
+        else:
+            logging.info(
+                f"Migrated {len(report.migrated_users)} users with {report.records} records "
+                f"in {report.seconds:.2f}s, skipped {len(report.skipped_users)}, "
+                f"failed {len(report.failed_users)}"
+            )
+        return report
+
+    def migrate_user(self, user: User, checkpoint: MigrationCheckpoint) -> int:
+        """
+        Migrates a single user and checkpoints them once all of their records have been written.
+        :return: number of migrated records.
+        """
+        logging.info(f"Migrating user {user.user_id}")
+        if self.target_user_repository.find_user(user.user_id) is None:
+            self.target_user_repository.create_user(user.user_id)
+        self.target_user_repository.update_user(user)
+        # Rollups are rebuilt rather than merged, so that re-migrating a user does not count records twice
+        result = self.target_record_repository.create_records_bulk(
+            self.source_record_repository.iter_records(
+                user.user_id, batch_size=self.batch_size
+            ),
+            batch_size=self.batch_size,
+            update_rollups=False,
+        )
+        self.target_record_repository.rebuild_daily_rollups(user.user_id)
+        checkpoint.mark_completed(user.user_id)
+        logging.info(f"Migrated {result.records} records for user {user.user_id}")
+        return result.records
+
+    def verify_user(self, user_id: int) -> UserVerification:
+        """
+        Compares the record count and checksum of a user between source and target.
+        """
+        source_count, source_checksum = checksum(
+            self.source_record_repository.iter_records(
+                user_id, batch_size=self.batch_size
+            )
+        )
+        target_count, target_checksum = checksum(
+            self.target_record_repository.iter_records(
+                user_id, batch_size=self.batch_size
+            )
+        )
+        verification = UserVerification(
+            user_id, source_count, target_count, source_checksum, target_checksum
+        )
+        if not verification.matches:
+            logging.warning(
+                f"User {user_id} does not match: {source_count} records in source, {target_count} in target"
+            )
+        return verification
@@ -0,0 +1,85 @@
+import logging
+
+import pymongo
+from pymongo import IndexModel, MongoClient
+from pymongo.errors import OperationFailure
+
+"""
+Index definitions for the MongoDB persistence backend.
+The records index serves both get_latest_record_for_user (sorted by timestamp descending)
+and find_records_for_time_range (range scan over timestamps) without collection scans or in-memory sorts.
+The unique daily rollups index serves the upserts of merge_daily_rollups and the date range scans of find_daily_rollups.
+The TTL index of the state collection lets MongoDB delete the expired conversation state of MongoDBStateStore.
+"""
+INDEXES = {
+    "records": [
+        IndexModel(
+            [("user_id", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING)],
+            name="user_id_timestamp",
+        ),
+    ],
+    "daily_rollups": [
+        IndexModel(
+            [("user_id", pymongo.ASCENDING), ("date", pymongo.ASCENDING)],
+            name="user_id_date",
+            unique=True,
+        ),
+    ],
+    "user": [
+        IndexModel([("user_id", pymongo.ASCENDING)], name="user_id", unique=True),
+    ],
+    "state": [
+        IndexModel(
+            [("expires_at", pymongo.ASCENDING)], name="expires_at", expireAfterSeconds=0
+        ),
+    ],
+}
+
+
+def ensure_indexes(mongo_client: MongoClient) -> list[str]:
+    """
+    Creates all indexes that do not exist yet. Existing indexes are left untouched, so this can be run on every startup.
+    An index exists if an index with the same keys exists, whatever its name. Indexes that cannot be created,
+    e.g. a unique index over duplicate data, are logged and skipped, so that they do not prevent startup.
+    :param mongo_client: MongoDB client.
+    :return: names of the created indexes, in the form <collection>.<index>.
+    """
+    mood_tracker = mongo_client["mood_tracker"]
+    created_indexes = []
+    for collection_name, indexes in INDEXES.items():
+        collection = mood_tracker[collection_name]
+        existing_indexes = collection.index_information()
+        for index in indexes:
+            index_name = f"{collection_name}.{index.document['name']}"
+            existing_index = find_equivalent_index(index, existing_indexes)
+            if existing_index is not None:
+                if existing_index.get("unique", False) != index.document.get(
+                    "unique", False
+                ):
+                    logging.warning(
+                        f"Did not create MongoDB index {index_name}: the existing index on the same keys "
+                        f"differs in uniqueness."
+                    )
+                continue
+            try:
+                collection.create_indexes([index])
+            except OperationFailure as error:
+                logging.warning(f"Did not create MongoDB index {index_name}: {error}")
+                continue
+            created_indexes.append(index_name)
+    if created_indexes:
+        logging.info(f"Created MongoDB indexes: {', '.join(created_indexes)}")
+    else:
+        logging.info("No MongoDB indexes created.")
+    return created_indexes
+
+
+def find_equivalent_index(index: IndexModel, existing_indexes: dict) -> dict | None:
+    """
+    :return: the information of the existing index on the same keys in the same order and directions, if any.
+    """
+    keys = list(index.document["key"].items())
+    for existing_index in existing_indexes.values():
+        if list(existing_index["key"]) == keys:
+            return existing_index
+    return None
@@ -1,18 +1,24 @@
 import datetime
 import logging
+from collections import defaultdict
+from typing import Iterator
 
 import pymongo
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 
+from src.model.daily_rollup import DailyRollup
 from src.model.record import Record
+from src.instrumentation import instrument_repository
 from src.repository.record_repository import RecordRepository
 
 
+@instrument_repository
 class MongoDBRecordRepository(RecordRepository):
     def __init__(self, mongo_client: MongoClient):
         super().__init__()
         mood_tracker = mongo_client["mood_tracker"]
         self.records = mood_tracker["records"]
+        self.daily_rollups = mood_tracker["daily_rollups"]
         logging.info("MongoDBRecordRepository initialized.")
 
     def get_latest_records_for_user(self, user_id: int, limit: int) -> list[Record]:
@@ -33,32 +39,37 @@ class MongoDBRecordRepository(RecordRepository):
         self.records.insert_one(
             {"user_id": user_id, "data": record_data, "timestamp": timestamp}
         )
+        self.update_daily_rollup(
+            user_id, record_data, datetime.datetime.fromisoformat(timestamp)
+        )
 
     def save_record(self, record: Record):
         self.records.insert_one(record.serialize())
+        self.update_daily_rollup(record.user_id, record.data, record.timestamp)
 
     def find_records_for_user(self, user_id: int) -> list[Record]:
-        return [
-            self.parse_record(r) for r in list(self.records.find({"user_id": user_id}))
-        ]
-
-    def zeroes(self, from_date: datetime.date, to_date: datetime.date):
-        """
-        Inserts records with default values for missed days within a date range.
-        start_date (datetime.date): The start date of the range.
-        end_date (datetime.date): The end date of the range.
-        """
-
-        user_id = 1965256751
-        default_record = {"sleep": "8", "mood": "0"}
-        date_range = [
-            from_date + datetime.timedelta(days=i)
-            for i in range((to_date - from_date).days + 1)
-        ]
-
-        for date in date_range:
-            logging.info(f"Inserting neutral record for timestamp {date}")
-            self.create_record(user_id, default_record, f"{date}T12:00:00.000000")
+        return list(self.iter_records(user_id))
+
+    def iter_records(
+        self,
+        user_id: int,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+        batch_size: int = 100,
+    ) -> Iterator[Record]:
+        query = {"user_id": user_id}
+        timestamp_range = {}
+        if start is not None:
+            timestamp_range["$gte"] = start.isoformat()
+        if end is not None:
+            timestamp_range["$lte"] = end.isoformat()
+        if timestamp_range:
+            query["timestamp"] = timestamp_range
+        cursor = self.records.find(
+            query, {"_id": 0}, sort=[("timestamp", pymongo.ASCENDING)]
+        ).batch_size(batch_size)
+        for result in cursor:
+            yield self.parse_record(result)
 
     def find_records_for_time_range(
         self, user_id: int, beginning: datetime.datetime, end: datetime.datetime
@@ -66,17 +77,88 @@ class MongoDBRecordRepository(RecordRepository):
         logging.info(
             f"Retrieving data for between {beginning} and {end} for user {user_id}"
         )
-        return [
-            self.parse_record(r)
-            for r in list(
-                self.records.find(
-                    {
-                        "user_id": user_id,
-                        "timestamp": {
-                            "$gte": beginning.isoformat(),
-                            "$lte": end.isoformat(),
-                        },
-                    }
+        return list(self.iter_records(user_id, beginning, end))
+
+    def find_existing_record_keys(self, records: list[Record]) -> set[tuple[int, str]]:
+        timestamps = defaultdict(list)
+        for record in records:
+            timestamps[record.user_id].append(record.timestamp.isoformat())
+        query = {
+            "$or": [
+                {"user_id": user_id, "timestamp": {"$in": user_timestamps}}
+                for user_id, user_timestamps in timestamps.items()
+            ]
+        }
+        return {
+            (result["user_id"], result["timestamp"])
+            for result in self.records.find(
+                query, {"_id": 0, "user_id": 1, "timestamp": 1}
+            )
+        }
+
+    def insert_records(self, records: list[Record]):
+        # unordered, so that the server can apply the inserts in parallel and one failing document
+        # does not prevent the remaining documents from being inserted
+        self.records.insert_many(
+            [record.serialize() for record in records], ordered=False
+        )
+
+    def merge_daily_rollups(self, rollups: list[DailyRollup]):
+        updates = []
+        for rollup in rollups:
+            increments = {"record_count": rollup.record_count}
+            minimums = {}
+            maximums = {"latest_timestamp": rollup.latest_timestamp.isoformat()}
+            for metric_name, metric in rollup.metrics.items():
+                increments[f"metrics.{metric_name}.sum"] = metric.sum
+                increments[f"metrics.{metric_name}.count"] = metric.count
+                minimums[f"metrics.{metric_name}.min"] = metric.min
+                maximums[f"metrics.{metric_name}.max"] = metric.max
+            update = {"$inc": increments, "$max": maximums}
+            if minimums:
+                update["$min"] = minimums
+            updates.append(
+                UpdateOne(
+                    {"user_id": rollup.user_id, "date": rollup.date.isoformat()},
+                    update,
+                    upsert=True,
                 )
             )
-        ]
+        if updates:
+            self.daily_rollups.bulk_write(updates, ordered=False)
+
+    def find_daily_rollups(
+        self, user_id: int, beginning: datetime.date, end: datetime.date
+    ) -> list[DailyRollup]:
+        result = self.daily_rollups.find(
+            {
+                "user_id": user_id,
+                "date": {"$gte": beginning.isoformat(), "$lte": end.isoformat()},
+            },
+            {"_id": 0},
+            sort=[("date", pymongo.ASCENDING)],
+        )
+        return [DailyRollup(**rollup) for rollup in result]
+
+    def find_latest_record_timestamps(
+        self, user_ids: list[int], date: datetime.date
+    ) -> dict[int, datetime.datetime]:
+        result = self.daily_rollups.find(
+            {"user_id": {"$in": list(user_ids)}, "date": date.isoformat()},
+            {"_id": 0, "user_id": 1, "latest_timestamp": 1},
+        )
+        return {
+            rollup["user_id"]: datetime.datetime.fromisoformat(
+                rollup["latest_timestamp"]
+            )
+            for rollup in result
+        }
+
+    def save_daily_rollups(self, rollups: list[DailyRollup]):
+        for rollup in rollups:
+            serialized = rollup.serialize()
+            self.daily_rollups.replace_one(
+                {"user_id": serialized["user_id"], "date": serialized["date"]},
+                serialized,
+                upsert=True,
+            )
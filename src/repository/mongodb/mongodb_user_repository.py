@@ -1,13 +1,16 @@
 import logging
+from typing import Iterator
 
 from pymongo import MongoClient
 
 from pyautowire import autowire
 from src.config.config import Configuration
-from src.model.user import User
+from src.model.user import User, UserSchedule
+from src.instrumentation import instrument_repository
 from src.repository.user_repository import UserRepository
 
 
+@instrument_repository
 class MongoDBUserRepository(UserRepository):
     def __init__(self, mongo_client: MongoClient):
         super().__init__()
@@ -48,3 +51,17 @@ class MongoDBUserRepository(UserRepository):
 
     def find_all_users(self) -> list[User]:
         return [self.parse_user(dict(u)) for u in self.user.find()]
+
+    def find_users(self, user_ids: list[int]) -> list[User]:
+        return [
+            self.parse_user(dict(u))
+            for u in self.user.find({"user_id": {"$in": list(user_ids)}})
+        ]
+
+    def iter_user_schedules(self, batch_size: int = 500) -> Iterator[UserSchedule]:
+        cursor = self.user.find(
+            {},
+            {"_id": 0, "user_id": 1, "notifications": 1, "auto_baseline_config": 1},
+        ).batch_size(batch_size)
+        for result in cursor:
+            yield UserSchedule(**result)
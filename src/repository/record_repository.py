@@ -1,12 +1,33 @@
 import logging
+import time
 from abc import ABC, abstractmethod
 import datetime
+from dataclasses import dataclass
+from typing import Iterator, Iterable
 
 from pyautowire import Injectable
 
+from src.model.daily_rollup import DailyRollup, aggregate_daily_rollups
 from src.model.record import Record
 
 
+def record_key(record: Record) -> tuple[int, str]:
+    """
+    :return: the key that identifies a record, i.e. its user and ISO formatted timestamp.
+    """
+    return record.user_id, record.timestamp.isoformat()
+
+
+@dataclass
+class BulkWriteResult:
+    records: int
+    seconds: float
+
+    @property
+    def records_per_second(self) -> float:
+        return self.records / self.seconds if self.seconds else 0.0
+
+
 class RecordRepository(Injectable, ABC):
     @staticmethod
     def parse_record(result: dict) -> Record:
@@ -33,10 +54,106 @@ class RecordRepository(Injectable, ABC):
     def find_records_for_user(self, user_id: int) -> list[Record]:
         pass
 
+    @abstractmethod
+    def iter_records(
+        self,
+        user_id: int,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+        batch_size: int = 100,
+    ) -> Iterator[Record]:
+        """
+        Streams the records of a user in ascending order of their timestamps.
+        Records are fetched from the database in pages of batch_size, so memory usage is bounded
+        regardless of how many records a user has.
+        :param user_id: user for whom to retrieve records.
+        :param start: optional start of the time range (inclusive).
+        :param end: optional end of the time range (inclusive).
+        :param batch_size: number of records fetched per database round trip.
+        :return: iterator over the user's records.
+        """
+
     @abstractmethod
     def save_record(self, record: Record):
         pass
 
+    def create_records_bulk(
+        self,
+        records: Iterable[Record],
+        batch_size: int = 500,
+        update_rollups: bool = True,
+    ) -> BulkWriteResult:
+        """
+        Inserts many records with one database round trip per batch instead of one per record.
+        Records are consumed lazily, so arbitrarily long histories can be streamed in.
+        The daily rollups of each batch are merged right after the batch has been inserted, so that the rollups
+        match the written records even if a later batch fails.
+        A record is identified by its user and timestamp. Of records with the same key, only the first one is written,
+        and records that already exist are skipped, so that no record is counted twice in the rollups,
+        e.g. if zeroes() is run again over the same days.
+        :param records: records of one or more users.
+        :param batch_size: number of records inserted per round trip.
+        :param update_rollups: whether to merge the records into the daily rollups. Callers that rebuild
+        the rollups afterwards, e.g. migrations, can skip this. Existing records are then overwritten
+        instead of skipped, which saves the lookup of the existing records.
+        :return: number of records written and the time it took.
+        """
+        start = time.perf_counter()
+        written = 0
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == batch_size:
+                written += self.write_batch(batch, update_rollups)
+                batch = []
+        if batch:
+            written += self.write_batch(batch, update_rollups)
+        result = BulkWriteResult(written, time.perf_counter() - start)
+        logging.info(
+            f"Wrote {result.records} records in {result.seconds:.2f}s "
+            f"({result.records_per_second:.0f} records/s)"
+        )
+        return result
+
+    def write_batch(self, batch: list[Record], update_rollups: bool) -> int:
+        """
+        Inserts a batch of records and merges them into their daily rollups.
+        :return: number of records written.
+        """
+        unique_records = {}
+        for record in batch:
+            unique_records.setdefault(record_key(record), record)
+        batch = list(unique_records.values())
+        if update_rollups:
+            existing_keys = self.find_existing_record_keys(batch)
+            batch = [
+                record for record in batch if record_key(record) not in existing_keys
+            ]
+        skipped = len(unique_records) - len(batch)
+        if skipped:
+            logging.info(f"Skipped {skipped} records that already exist")
+        if not batch:
+            return 0
+        self.insert_records(batch)
+        if update_rollups:
+            self.merge_daily_rollups(aggregate_daily_rollups(batch))
+        return len(batch)
+
+    @abstractmethod
+    def find_existing_record_keys(self, records: list[Record]) -> set[tuple[int, str]]:
+        """
+        Finds which of the given records are already stored, without reading them one by one.
+        :param records: records with distinct keys.
+        :return: the keys of the stored records, as returned by record_key().
+        """
+
+    @abstractmethod
+    def insert_records(self, records: list[Record]):
+        """
+        Inserts a batch of records without updating their daily rollups.
+        Only to be used by create_records_bulk().
+        """
+
     def zeroes(self, from_date: datetime.date, to_date: datetime.date):
         """
         Inserts records with default values for missed days within a date range.
@@ -51,12 +168,84 @@ class RecordRepository(Injectable, ABC):
             for i in range((to_date - from_date).days + 1)
         ]
 
-        for date in date_range:
-            logging.info(f"Inserting neutral record for timestamp {date}")
-            self.create_record(user_id, default_record, f"{date}T12:00:00.000000")
+        logging.info(f"Inserting neutral records from {from_date} to {to_date}")
+        self.create_records_bulk(
+            Record(
+                user_id=user_id,
+                data=default_record,
+                timestamp=datetime.datetime.combine(date, datetime.time(12)),
+            )
+            for date in date_range
+        )
 
     @abstractmethod
     def find_records_for_time_range(
         self, user_id: int, beginning: datetime.datetime, end: datetime.datetime
     ) -> list[Record]:
         pass
+
+    def update_daily_rollup(
+        self, user_id: int, record_data: dict, timestamp: datetime.datetime
+    ):
+        """
+        Incrementally adds a record to the rollup of its day. Called whenever a record is created.
+        :param user_id: user the record belongs to.
+        :param record_data: metric values of the record.
+        :param timestamp: timestamp of the record.
+        """
+        record = Record(user_id=user_id, data=record_data, timestamp=timestamp)
+        self.merge_daily_rollups(aggregate_daily_rollups([record]))
+
+    @abstractmethod
+    def merge_daily_rollups(self, rollups: list[DailyRollup]):
+        """
+        Adds partial rollups to the stored rollups of the same days, creating them if they do not exist.
+        The update is atomic, so concurrent records of the same day are all counted.
+        :param rollups: rollups of newly created records.
+        """
+
+    @abstractmethod
+    def find_daily_rollups(
+        self, user_id: int, beginning: datetime.date, end: datetime.date
+    ) -> list[DailyRollup]:
+        """
+        Retrieves the daily rollups of a user within a date range.
+        :param user_id: user for whom to retrieve rollups.
+        :param beginning: first day of the range (inclusive).
+        :param end: last day of the range (inclusive).
+        :return: rollups in ascending order of their dates; days without records are omitted.
+        """
+
+    @abstractmethod
+    def save_daily_rollups(self, rollups: list[DailyRollup]):
+        """
+        Stores rollups, replacing existing rollups of the same days.
+        """
+
+    def find_latest_record_timestamps(
+        self, user_ids: list[int], date: datetime.date
+    ) -> dict[int, datetime.datetime]:
+        """
+        Retrieves the timestamp of the latest record on a given day for multiple users at once,
+        e.g. to find the users who have not created a record today.
+        The timestamps are read from the daily rollups; backends override this to read all rollups in a single query.
+        :param user_ids: the IDs of the users.
+        :param date: the day of the records.
+        :return: the timestamp of the latest record per user; users without records on that day are omitted.
+        """
+        timestamps = {}
+        for user_id in user_ids:
+            for rollup in self.find_daily_rollups(user_id, date, date):
+                timestamps[user_id] = rollup.latest_timestamp
+        return timestamps
+
+    def rebuild_daily_rollups(self, user_id: int) -> int:
+        """
+        Recalculates all daily rollups of a user from their records, e.g. to backfill rollups for existing records.
+        :param user_id: user for whom to rebuild rollups.
+        :return: number of rollups written.
+        """
+        rollups = aggregate_daily_rollups(self.iter_records(user_id))
+        self.save_daily_rollups(rollups)
+        logging.info(f"Rebuilt {len(rollups)} daily rollups for user {user_id}")
+        return len(rollups)
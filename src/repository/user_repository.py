@@ -1,9 +1,10 @@
 from abc import ABC, abstractmethod
+from typing import Iterator
 
 from pyautowire import Injectable
 
 from src.config.config import Configuration
-from src.model.user import User
+from src.model.user import User, UserSchedule
 
 
 class UserRepository(Injectable, ABC):
@@ -26,3 +27,27 @@ class UserRepository(Injectable, ABC):
     @abstractmethod
     def find_all_users(self) -> list[User]:
         pass
+
+    def find_users(self, user_ids: list[int]) -> list[User]:
+        """
+        Retrieves multiple users at once, e.g. all users that share a scheduled job.
+        Backends override this to retrieve all users in as few round trips as possible.
+        :param user_ids: the IDs of the users to retrieve.
+        :return: the users that exist, in no particular order.
+        """
+        users = [self.find_user(user_id) for user_id in user_ids]
+        return [user for user in users if user is not None]
+
+    def iter_user_schedules(self, batch_size: int = 500) -> Iterator[UserSchedule]:
+        """
+        Streams the scheduling information of all users.
+        Backends override this to only retrieve the fields of UserSchedule, page by page.
+        :param batch_size: number of users fetched per database round trip.
+        :return: iterator over the scheduling information of all users.
+        """
+        for user in self.find_all_users():
+            yield UserSchedule(
+                user_id=user.user_id,
+                notifications=user.notifications,
+                auto_baseline_config=user.auto_baseline_config,
+            )
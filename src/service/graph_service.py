@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator
+
+from pyautowire import autowire, Injectable
+
+from src.config.config import Configuration
+from src.graph_cache import (
+    GraphCache,
+    GraphKey,
+    Fingerprint,
+    fingerprint_rollups,
+    hash_metrics,
+)
+from src.model.user import User
+from src.repository.async_repository import AsyncRecordRepository
+from src.visualise import (
+    Month,
+    render_graph,
+    rollup_averages,
+    slice_month,
+)
+
+
+class GraphService(Injectable):
+    """
+    Service for rendering graphs.
+    Rendering is CPU-bound, so graphs are rendered in a process pool instead of the event loop,
+    which allows multiple months to be rendered in parallel while the bot keeps processing updates.
+    """
+
+    async_record_repository: AsyncRecordRepository
+    executor: ProcessPoolExecutor
+    cache: GraphCache
+    image_format: str
+    dpi: int
+
+    @autowire("configuration", "async_record_repository")
+    def __init__(
+        self,
+        configuration: Configuration,
+        async_record_repository: AsyncRecordRepository,
+    ):
+        self.async_record_repository = async_record_repository
+        # Processes are spawned rather than forked, since forking a process that holds
+        # database connections and running threads is not safe.
+        self.executor = ProcessPoolExecutor(
+            max_workers=configuration.graphing.process_pool_size,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self.cache = GraphCache(max_entries=configuration.graphing.cache_size)
+        self.image_format = configuration.graphing.image_format
+        self.dpi = configuration.graphing.dpi
+        logging.info(
+            f"GraphService initialized with {configuration.graphing.process_pool_size} rendering processes"
+        )
+
+    async def render(self, user: User, months: list[Month]) -> AsyncIterator[bytes]:
+        """
+        Renders graphs for multiple months in parallel.
+        The daily rollups for all months are retrieved with a single query into one DataFrame,
+        which is then sliced per month for plotting. Graphs whose records have not changed since they were last
+        rendered are served from the cache.
+        :param user: user for whom to render graphs.
+        :param months: consecutive months to render, in ascending order.
+        :return: encoded graphs in the order in which they finish rendering.
+        Months without records are skipped.
+        """
+        beginning, end = months[0].first_day(), months[-1].last_day()
+        rollups = await self.async_record_repository.find_daily_rollups(
+            user.user_id, beginning, end
+        )
+        logging.info(
+            f"Found {len(rollups)} daily rollups between {beginning} and {end}"
+        )
+        fingerprints = fingerprint_rollups(rollups)
+        metric_names = [metric.name for metric in user.metrics]
+        daily_avg = rollup_averages(rollups, metric_names)
+        metrics_hash = hash_metrics(user.metrics)
+
+        renders = []
+        for month in months:
+            fingerprint = fingerprints.get(month.unpack())
+            if fingerprint is None:
+                logging.info(f"No records to visualize for {month.month}/{month.year}")
+                continue
+            key = GraphKey(user.user_id, month.year, month.month, metrics_hash)
+            renders.append(
+                self.render_month(
+                    user, month, slice_month(daily_avg, month), key, fingerprint
+                )
+            )
+        for render in asyncio.as_completed(renders):
+            graph = await render
+            if graph:
+                yield graph
+        logging.info(f"Graph cache statistics: {self.cache.statistics()}")
+
+    async def render_month(
+        self,
+        user: User,
+        month: Month,
+        daily_avg,
+        key: GraphKey,
+        fingerprint: Fingerprint,
+    ) -> bytes | None:
+        """
+        Renders the graph for a single month, unless it is cached.
+        """
+        cached_graph = self.cache.get(key, fingerprint)
+        if cached_graph is not None:
+            logging.info(f"Serving graph for {month.month}/{month.year} from cache")
+            return cached_graph
+        loop = asyncio.get_running_loop()
+        graph = await loop.run_in_executor(
+            self.executor,
+            render_graph,
+            user.metrics,
+            daily_avg,
+            month,
+            self.image_format,
+            self.dpi,
+        )
+        if graph is not None:
+            self.cache.put(key, fingerprint, graph)
+        return graph
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
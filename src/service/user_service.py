@@ -1,12 +1,14 @@
 import logging
+import time
 
 from pyautowire import autowire, Injectable
 from src.exception.auto_baseline_exception import (
     MetricBaselinesNotDefinedException,
     AutoBaselineTimeNotDefinedException,
 )
-from src.model.user import User
+from src.model.user import User, UserSchedule
 from src.notifier import Notifier
+from src.repository.async_repository import AsyncUserRepository
 from src.repository.user_repository import UserRepository
 
 
@@ -17,17 +19,28 @@ class UserService(Injectable):
     """
 
     user_repository: UserRepository
+    async_user_repository: AsyncUserRepository
     notifier: Notifier
 
-    @autowire("user_repository", "notifier")
-    def __init__(self, user_repository: UserRepository, notifier: Notifier):
+    @autowire("user_repository", "async_user_repository", "notifier")
+    def __init__(
+        self,
+        user_repository: UserRepository,
+        async_user_repository: AsyncUserRepository,
+        notifier: Notifier,
+    ):
+        """
+        The synchronous user repository is used for scheduling jobs on startup, before the event loop is running.
+        Everything called from handlers goes through the asynchronous repository.
+        """
         self.user_repository = user_repository
+        self.async_user_repository = async_user_repository
         logging.info(
             f"UserService initialized with {user_repository.__class__.__name__}"
         )
         self.notifier = notifier
 
-    def toggle_auto_baseline(self, user: User) -> bool:
+    async def toggle_auto_baseline(self, user: User) -> bool:
         """
         Toggles the auto-baseline feature for a user.
         :param user: User to toggle the auto-baseline feature for.
@@ -37,12 +50,12 @@ class UserService(Injectable):
             logging.info(f"Disabling auto-baseline for user {user.user_id}")
             user.disable_auto_baseline()
             self.notifier.remove_auto_baseline(user)
-            self.user_repository.update_user(user)
+            await self.async_user_repository.update_user(user)
             return False
         else:
-            return self.enable_auto_baseline(user)
+            return await self.enable_auto_baseline(user)
 
-    def enable_auto_baseline(self, user: User) -> bool:
+    async def enable_auto_baseline(self, user: User) -> bool:
         """
         Enables the auto-baseline feature for a user.
         :param user: User to enable the auto-baseline feature for.
@@ -60,39 +73,50 @@ class UserService(Injectable):
             raise AutoBaselineTimeNotDefinedException()
         user.enable_auto_baseline()
         self.notifier.create_auto_baseline(user)
-        self.user_repository.update_user(user)
+        await self.async_user_repository.update_user(user)
         return True
 
-    def schedule_auto_baselines(self):
-        """
-        Sets up the auto-baseline for all users in the database.
+    def schedule_jobs(self, batch_size: int = 500) -> int:
         """
-        for user in self.user_repository.find_all_users():
-            if user.has_auto_baseline_enabled() and user.has_baselines_defined():
-                self.notifier.create_auto_baseline(user)
-
-    def schedule_notifications(self) -> None:
+        Adds reminders and auto-baselines to the job queue for all users in the database.
+        Users are streamed in a single pass, only retrieving the fields that are needed for scheduling.
+        A user can only have auto-baseline enabled if all of their baselines are defined, so the metrics are not needed.
+        :param batch_size: number of users fetched per database round trip.
+        :return: number of users for whom jobs were scheduled.
         """
-        Adds reminders to the job queue for all users that have configured reminders.
-        """
-        for user in self.user_repository.find_all_users():
+        start = time.perf_counter()
+        users = 0
+        for user in self.user_repository.iter_user_schedules(batch_size):
             self.setup_notifications(user)
+            if user.has_auto_baseline_enabled():
+                self.notifier.create_auto_baseline(user)
+            users += 1
+            if users % 1000 == 0:
+                logging.info(
+                    f"Scheduled jobs for {users} users in {time.perf_counter() - start:.2f}s"
+                )
+        elapsed = time.perf_counter() - start
+        per_thousand = elapsed / users * 1000 if users else 0.0
+        logging.info(
+            f"Scheduled jobs for {users} users in {elapsed:.2f}s ({per_thousand:.2f}s per 1000 users)"
+        )
+        return users
 
-    def find_user(self, user_id: int) -> User | None:
-        return self.user_repository.find_user(user_id)
+    async def find_user(self, user_id: int) -> User | None:
+        return await self.async_user_repository.find_user(user_id)
 
-    def create_user(self, user_id: int) -> User:
+    async def create_user(self, user_id: int) -> User:
         logging.info(f"Creating user {user_id}")
-        user = self.user_repository.create_user(user_id)
+        user = await self.async_user_repository.create_user(user_id)
         self.setup_notifications(user)
-        self.setup_auto_baseline(user)
+        await self.setup_auto_baseline(user)
         return user
 
-    def setup_notifications(self, user: User) -> None:
+    def setup_notifications(self, user: User | UserSchedule) -> None:
         logging.info(f"Setting up notifications for user {user.user_id}")
         for notification in user.get_notifications():
             self.notifier.create_notification(user.user_id, notification)
 
-    def setup_auto_baseline(self, user: User) -> None:
+    async def setup_auto_baseline(self, user: User) -> None:
         if user.has_auto_baseline_enabled():
-            self.enable_auto_baseline(user)
+            await self.enable_auto_baseline(user)
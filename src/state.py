@@ -1,10 +1,399 @@
+import asyncio
+import datetime
+import logging
+import math
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Executor
 from enum import Enum
+from functools import partial
+from typing import Any, Callable
 
-from expiringdict import ExpiringDict
+import boto3
+from boto3.resources.base import ServiceResource
+from boto3.dynamodb.conditions import Attr
+from pymongo import MongoClient
+from pyautowire import Injectable
 
-APPLICATION_STATE = ExpiringDict(max_len=100, max_age_seconds=300)
+from src.config.state_config import StateConfig
+from src.repository.dynamodb.tables import ThreadLocalTables
 
 
 class State(Enum):
     RECORDING = 1
     GRAPHING = 2
+
+
+class StateStore(Injectable, ABC):
+    """
+    Key-value store for conversation state that expires after a fixed time, e.g. unfinished records.
+    Supports the subset of the mapping interface that the handlers use, so that it can replace a dict.
+    """
+
+    @abstractmethod
+    def get(self, key: int, default: Any = None) -> Any:
+        pass
+
+    @abstractmethod
+    def set(self, key: int, value: Any) -> None:
+        """
+        Stores a value. Setting a value resets its expiry.
+        """
+
+    @abstractmethod
+    def delete(self, key: int) -> bool:
+        """
+        :return: True if a value was deleted.
+        """
+
+    def __getitem__(self, key: int) -> Any:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: int, value: Any) -> None:
+        self.set(key, value)
+
+    def __delitem__(self, key: int) -> None:
+        if not self.delete(key):
+            raise KeyError(key)
+
+    def __contains__(self, key: int) -> bool:
+        return self.get(key) is not None
+
+
+class InMemoryStateStore(StateStore):
+    """
+    State store local to the process.
+    All entries have the same TTL and are moved to the end when they are set, so entries are ordered by expiry:
+    expired entries are removed from the front, and when the store is full, the entry that expires next is evicted.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10_000,
+        ttl_seconds: float = 300,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.entries: OrderedDict[int, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: int, default: Any = None) -> Any:
+        self.expire()
+        entry = self.entries.get(key)
+        return default if entry is None else entry[1]
+
+    def set(self, key: int, value: Any) -> None:
+        self.expire()
+        self.entries[key] = (self.clock() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            evicted, _ = self.entries.popitem(last=False)
+            logging.warning(f"State store is full, evicted state of user {evicted}")
+
+    def delete(self, key: int) -> bool:
+        return self.entries.pop(key, None) is not None
+
+    def expire(self) -> None:
+        now = self.clock()
+        while self.entries:
+            key, (expires_at, _) = next(iter(self.entries.items()))
+            if expires_at > now:
+                return
+            del self.entries[key]
+
+    def __len__(self) -> int:
+        self.expire()
+        return len(self.entries)
+
+
+class SQLiteStateStore(StateStore):
+    """
+    State store backed by a SQLite database, so that state survives restarts and is shared by all processes
+    on the same host that use the same database file.
+    SQLite's locking is not reliable on network file systems, so replicas on different hosts must use
+    MongoDBStateStore or DynamoDBStateStore instead.
+    Values are pickled. Stores with different namespaces can share one database file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        namespace: str,
+        ttl_seconds: float = 300,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "namespace TEXT NOT NULL, key INTEGER NOT NULL, value BLOB NOT NULL, expires_at REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS state_expires_at ON state (expires_at)"
+        )
+        logging.info(f"SQLiteStateStore initialized for {namespace} at {path}.")
+
+    def get(self, key: int, default: Any = None) -> Any:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (self.namespace, key, self.clock()),
+            ).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def set(self, key: int, value: Any) -> None:
+        now = self.clock()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, pickle.dumps(value), now + self.ttl_seconds),
+            )
+            # expired entries of all namespaces are found through the index, so this only touches expired rows
+            self.connection.execute("DELETE FROM state WHERE expires_at <= ?", (now,))
+
+    def delete(self, key: int) -> bool:
+        with self.lock:
+            cursor = self.connection.execute(
+                "DELETE FROM state WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (self.namespace, key, self.clock()),
+            )
+        return cursor.rowcount > 0
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM state WHERE namespace = ? AND expires_at > ?",
+                (self.namespace, self.clock()),
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class MongoDBStateStore(StateStore):
+    """
+    State store backed by MongoDB, shared by all replicas that use the same database.
+    Expired documents are deleted by the TTL index on expires_at. The TTL monitor of MongoDB only runs about once
+    a minute, so reads ignore expired documents that have not been deleted yet.
+    Values are pickled. Stores with different namespaces share one collection.
+    """
+
+    COLLECTION = "state"
+
+    def __init__(
+        self,
+        mongo_client: MongoClient,
+        namespace: str,
+        ttl_seconds: float = 300,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.collection = mongo_client["mood_tracker"][self.COLLECTION]
+        logging.info(f"MongoDBStateStore initialized for {namespace}.")
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.clock(), datetime.timezone.utc)
+
+    def document_id(self, key: int) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: int, default: Any = None) -> Any:
+        document = self.collection.find_one(
+            {"_id": self.document_id(key), "expires_at": {"$gt": self.now()}}
+        )
+        return default if document is None else pickle.loads(document["value"])
+
+    def set(self, key: int, value: Any) -> None:
+        self.collection.replace_one(
+            {"_id": self.document_id(key)},
+            {
+                "namespace": self.namespace,
+                "key": key,
+                "value": pickle.dumps(value),
+                "expires_at": self.now() + datetime.timedelta(seconds=self.ttl_seconds),
+            },
+            upsert=True,
+        )
+
+    def delete(self, key: int) -> bool:
+        result = self.collection.delete_one(
+            {"_id": self.document_id(key), "expires_at": {"$gt": self.now()}}
+        )
+        return result.deleted_count > 0
+
+    def __len__(self) -> int:
+        return self.collection.count_documents(
+            {"namespace": self.namespace, "expires_at": {"$gt": self.now()}}
+        )
+
+
+class DynamoDBStateStore(StateStore):
+    """
+    State store backed by DynamoDB, shared by all replicas that use the same table.
+    Expired items are deleted by DynamoDB, as expires_at is the TTL attribute of the table. DynamoDB deletes
+    expired items only eventually, so reads ignore expired items that have not been deleted yet.
+    expires_at is rounded up to whole seconds, the unit of the TTL attribute. Values are pickled.
+    Items are partitioned by namespace and key, i.e. per user, so that the state of all users is spread across
+    the partitions of the table.
+    """
+
+    TABLE = "state"
+
+    def __init__(
+        self,
+        dynamodb: boto3.resource,
+        namespace: str,
+        ttl_seconds: float = 300,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.tables = ThreadLocalTables(dynamodb)
+        logging.info(f"DynamoDBStateStore initialized for {namespace}.")
+
+    @property
+    def table(self):
+        return self.tables.table(self.TABLE)
+
+    def item_key(self, key: int) -> dict[str, str]:
+        return {"id": f"{self.namespace}:{key}"}
+
+    def get(self, key: int, default: Any = None) -> Any:
+        item = self.table.get_item(Key=self.item_key(key), ConsistentRead=True).get(
+            "Item"
+        )
+        if item is None or item["expires_at"] <= self.clock():
+            return default
+        return pickle.loads(item["value"].value)
+
+    def set(self, key: int, value: Any) -> None:
+        self.table.put_item(
+            Item={
+                **self.item_key(key),
+                "namespace": self.namespace,
+                "key": key,
+                "value": pickle.dumps(value),
+                "expires_at": math.ceil(self.clock() + self.ttl_seconds),
+            }
+        )
+
+    def delete(self, key: int) -> bool:
+        table = self.table
+        try:
+            table.delete_item(
+                Key=self.item_key(key),
+                ConditionExpression=Attr("expires_at").gt(math.floor(self.clock())),
+            )
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def __len__(self) -> int:
+        """
+        Counts the entries of the namespace with a scan of the whole table, so it is only meant for diagnostics.
+        """
+        scan = {
+            "FilterExpression": Attr("namespace").eq(self.namespace)
+            & Attr("expires_at").gt(math.floor(self.clock())),
+            "Select": "COUNT",
+            "ConsistentRead": True,
+        }
+        count = 0
+        while True:
+            response = self.table.scan(**scan)
+            count += response["Count"]
+            if "LastEvaluatedKey" not in response:
+                return count
+            scan["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+class AsyncStateStore(Injectable):
+    """
+    Asynchronous facade for a state store, which is used by the handlers.
+    Stores in SQLite or a database make a blocking round trip per call, which is run on the given executor,
+    e.g. the one of the repositories, so that it does not block the event loop. Without an executor, e.g. for
+    the in-memory store, the store is called directly, as the call is cheaper than handing it to a thread.
+    """
+
+    store: StateStore
+    executor: Executor | None
+
+    def __init__(self, store: StateStore, executor: Executor | None = None):
+        self.store = store
+        self.executor = executor
+
+    async def run(self, func: Callable, *args) -> Any:
+        if self.executor is None:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args))
+
+    async def get(self, key: int, default: Any = None) -> Any:
+        return await self.run(self.store.get, key, default)
+
+    async def set(self, key: int, value: Any) -> None:
+        await self.run(self.store.set, key, value)
+
+    async def delete(self, key: int) -> bool:
+        return await self.run(self.store.delete, key)
+
+
+def create_state_store(
+    config: StateConfig,
+    namespace: str,
+    database: MongoClient | ServiceResource | None = None,
+) -> StateStore:
+    """
+    :param database: the MongoDB client or DynamoDB resource if the state is stored in a database.
+    """
+    if config.backend == "sqlite":
+        return SQLiteStateStore(config.sqlite_path, namespace, config.ttl_seconds)
+    if config.backend == "mongodb":
+        return MongoDBStateStore(database, namespace, config.ttl_seconds)
+    if config.backend == "dynamodb":
+        return DynamoDBStateStore(database, namespace, config.ttl_seconds)
+    return InMemoryStateStore(config.max_size, config.ttl_seconds)
+
+
+def initialize_state_stores(
+    config: StateConfig,
+    database: MongoClient | ServiceResource | None = None,
+    executor: Executor | None = None,
+) -> tuple[StateStore, StateStore]:
+    """
+    Creates and registers the state stores for the conversation state and the unfinished records,
+    along with their asynchronous facades for the handlers.
+    :param database: the MongoDB client or DynamoDB resource if the state is stored in a database.
+    :param executor: the executor on which the calls to stores other than the in-memory store are run.
+    :return: the registered application state and temporary record stores.
+    """
+    if config.backend == "memory":
+        executor = None
+    stores = []
+    for namespace in ("application_state", "temp_records"):
+        store = create_state_store(config, namespace, database).register(
+            alias=namespace
+        )
+        AsyncStateStore(store, executor).register(alias=f"async_{namespace}")
+        stores.append(store)
+    application_state, temp_records = stores
+    logging.info(f"Initialized {config.backend} state stores")
+    return application_state, temp_records
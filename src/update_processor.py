@@ -0,0 +1,66 @@
+import asyncio
+from typing import Any, Awaitable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+"""
+Concurrent update processing.
+Updates of different users are processed concurrently, so that e.g. rendering a graph for one user does not
+delay everyone else. The updates of a single user are processed one after another in the order in which they
+were received, since they read and write the same conversation state (e.g. their unfinished record).
+"""
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Serializes the updates of each user with a per-user lock and limits the number of updates processed concurrently.
+    The updates of a user wait for their lock before they count towards max_concurrent_updates, so that a user
+    sending many updates at once does not occupy the capacity of other users.
+    Locks are only kept while a user has updates in flight.
+    """
+
+    # maximum number of updates processed or waiting for earlier updates of their user
+    MAX_PENDING_UPDATES = 4096
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(self.MAX_PENDING_UPDATES)
+        self.concurrent_updates = max_concurrent_updates
+        self.semaphore = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self.locks: dict[int, asyncio.Lock] = {}
+        self.pending: dict[int, int] = {}
+
+    async def do_process_update(
+        self, update: object, coroutine: Awaitable[Any]
+    ) -> None:
+        user_id = get_user_id(update)
+        if user_id is None:
+            async with self.semaphore:
+                await coroutine
+            return
+        lock = self.locks.setdefault(user_id, asyncio.Lock())
+        self.pending[user_id] = self.pending.get(user_id, 0) + 1
+        try:
+            async with lock:
+                async with self.semaphore:
+                    await coroutine
+        finally:
+            self.pending[user_id] -= 1
+            if self.pending[user_id] == 0:
+                del self.pending[user_id]
+                del self.locks[user_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+def get_user_id(update: object) -> int | None:
+    """
+    :return: the user who sent the update, or None if the update has no user, e.g. a channel post.
+    """
+    if isinstance(update, Update) and update.effective_user is not None:
+        return update.effective_user.id
+    return None
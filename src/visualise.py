@@ -1,18 +1,22 @@
 import calendar
 import logging
 from dataclasses import dataclass
-from datetime import datetime
+from io import BytesIO
+from datetime import datetime, date
 from pathlib import Path
 from typing import Tuple
 
-import matplotlib.pyplot as plt
+import matplotlib.style
+import numpy as np
 import pandas as pd
+from matplotlib.axes import Axes
+from matplotlib.figure import Figure
 from pyautowire import autowire
 
 from src.config.config import ConfigurationProvider
+from src.graph_cache import hash_metrics
+from src.model.daily_rollup import DailyRollup
 from src.model.metric import Metric
-from src.model.record import Record
-from src.model.user import User
 from src.repository.initialize import initialize_database
 from src.repository.record_repository import RecordRepository
 
@@ -31,81 +35,150 @@ class Month:
     def unpack(self) -> (int, int):
         return self.year, self.month
 
+    def first_day(self) -> date:
+        return date(self.year, self.month, 1)
 
-def visualize(user: User, month: Month) -> str:
+    def last_day(self) -> date:
+        return date(
+            self.year, self.month, calendar.monthrange(self.year, self.month)[1]
+        )
+
+
+def graph_file_path(
+    user_id: int,
+    user_metrics: list[Metric],
+    month: Month,
+    image_format: str = "png",
+    output_dir: str = "graphs",
+) -> str:
     """
-    Generate a line graph of the record data for a given month.
-    :param user: User for whom to generate the graph. Needed for metric information.
-    :param month: Tuple of (year, month) for the month to visualize. For naming purposes only.
-    :return: JPG file path of the generated graph.
+    Determines the file path for a graph. Graphs of different users and metric configurations never share a path.
+    :param user_id: user the graph belongs to.
+    :param user_metrics: metrics that are plotted.
+    :param month: month that is plotted.
+    :param image_format: image format of the graph, used as the file extension.
+    :param output_dir: directory the graph is stored in.
+    :return: file path of the graph.
     """
+    metric_names = "_".join(metric.name for metric in user_metrics)
+    return (
+        f"{output_dir}/{user_id}_{metric_names}_{month.first_day()}_{month.last_day()}"
+        f"_{hash_metrics(user_metrics)}.{image_format}"
+    )
+
 
-    records = retrieve_records(user.user_id, month)
+def render_graph(
+    user_metrics: list[Metric],
+    daily_avg: pd.DataFrame,
+    month: Month,
+    image_format: str = "png",
+    dpi: int = 100,
+) -> bytes | None:
+    """
+    Render a line graph of daily averages into memory.
+    This does not access the database, the file system or any global pyplot state,
+    so it can safely run in a separate process.
+    :param user_metrics: metrics to plot.
+    :param daily_avg: daily averages within the month, as created by rollup_averages().
+    :param month: month that is plotted.
+    :param image_format: image format of the graph, e.g. png, jpg or webp.
+    :param dpi: resolution of the graph.
+    :return: the encoded image, or None if there is no data to plot.
+    """
     year, month = month.unpack()
+    if daily_avg.empty:
+        logging.info(f"No records to visualize for {month}/{year}")
+        return None
 
-    logging.info(f"Visualizing records for user {user.user_id} and month {month}")
-    ensure_output_dir()
+    logging.info(f"Visualizing {len(daily_avg)} days for {month}/{year}")
     # Calculate the first and last day of the given month
     first_day = datetime(year, month, 1).date()
     last_day = datetime(year, month, calendar.monthrange(year, month)[1]).date()
-    user_metrics = user.metrics
-
-    records = [record.serialize() for record in records]
-    metric_names = [metric.name for metric in user_metrics]
-
-    df = create_panda_df(records, metric_names)
-
-    # In case of multiple records per day, take the average
-    daily_avg = df.groupby("timestamp")[metric_names].mean().reset_index()
 
     # Generate a complete date range for the month
     date_range = pd.date_range(start=first_day, end=last_day)
 
-    plt.style.use("seaborn-v0_8-dark")
+    with matplotlib.style.context("seaborn-v0_8-dark"):
+        figure = Figure(figsize=(10, 6))
+
+        ax = None
+        colors = ["blue", "green", "orange", "purple", "brown", "pink", "gray"]
+        for i, metric in enumerate(user_metrics):
+            ax = visualize_metric(figure, date_range, daily_avg, colors[i], metric, ax)
 
-    # Plotting
-    plt.figure(figsize=(10, 6))
+        # Title and layout
+        figure.suptitle(f"Average Mood and Sleep from {first_day} to {last_day}")
+        for axis in figure.axes:
+            axis.tick_params(axis="x", labelrotation=45)
+        figure.tight_layout()
 
-    ax = None
-    colors = ["blue", "green", "orange", "purple", "brown", "pink", "gray"]
-    for i, metric in enumerate(user_metrics):
-        ax = visualize_metric(plt, date_range, daily_avg, colors[i], metric, ax)
+        # Encode the plot
+        buffer = BytesIO()
+        figure.savefig(buffer, format=image_format, dpi=dpi)
+    graph = buffer.getvalue()
+    logging.info(f"Rendered {image_format} graph of {len(graph)} bytes")
+    return graph
 
-    # Title and layout
-    plt.title(f"Average Mood and Sleep from {first_day} to {last_day}")
-    plt.xticks(rotation=45)
-    plt.tight_layout()
 
-    # Save the plot
-    file_path = f"graphs/{'_'.join(metric_names)}_{first_day}_{last_day}.jpg"
-    plt.savefig(file_path, format="jpg", dpi=300)
-    plt.close()
-    logging.info(f"Graph saved to {file_path}")
-    return file_path
+def rollup_averages(
+    rollups: list[DailyRollup], metric_names: list[str]
+) -> pd.DataFrame:
+    """
+    Calculates the daily averages from daily rollups, without touching the raw records.
+    :param rollups: rollups to average; may span multiple months.
+    :param metric_names: metrics to average.
+    :return: DataFrame with the day of each rollup as datetime64 under "timestamp" and one float column of daily averages
+    per metric; metrics missing on a day are NaN.
+    """
+    columns = {
+        "timestamp": np.array(
+            [rollup.date for rollup in rollups], dtype="datetime64[D]"
+        ).astype("datetime64[s]")
+    }
+    for metric_name in metric_names:
+        columns[metric_name] = np.array(
+            [
+                (
+                    rollup.metrics[metric_name].mean()
+                    if metric_name in rollup.metrics
+                    else np.nan
+                )
+                for rollup in rollups
+            ],
+            dtype=np.float64,
+        )
+    return pd.DataFrame(columns)
+
+
+def slice_month(daily_avg: pd.DataFrame, month: Month) -> pd.DataFrame:
+    """
+    Selects the daily averages within a month.
+    :param daily_avg: daily averages, as created by rollup_averages().
+    :param month: month to select.
+    :return: DataFrame holding only the days of the given month.
+    """
+    within_month = (daily_avg["timestamp"] >= pd.Timestamp(month.first_day())) & (
+        daily_avg["timestamp"] <= pd.Timestamp(month.last_day())
+    )
+    return daily_avg[within_month]
 
 
 @autowire("record_repository")
-def retrieve_records(
+def retrieve_daily_rollups(
     user_id: int, month: Month, record_repository: RecordRepository
-) -> list[Record]:
+) -> list[DailyRollup]:
     """
-    Retrieve records for a given month.
-    :param year:
-    :param user_id: user for whom to retrieve record data.
+    Retrieve the daily rollups for a given month.
+    :param user_id: user for whom to retrieve rollups.
     :param record_repository: autowired.
-    :param month: (year, month) tuple for the month to retrieve records for.
-    :return: list of records for the given month.
+    :param month: month to retrieve rollups for.
+    :return: at most one rollup per day of the month.
     """
-    year, month = month.unpack()
-    # Calculate the first and last day of the given month
-    first_day = datetime(year, month, 1)
-    last_day = datetime(year, month, calendar.monthrange(year, month)[1])
-
-    records = list(
-        record_repository.find_records_for_time_range(user_id, first_day, last_day)
+    rollups = record_repository.find_daily_rollups(
+        user_id, month.first_day(), month.last_day()
     )
-    logging.info(f"Found {len(records)} records for {month}/{year}")
-    return records
+    logging.info(f"Found {len(rollups)} daily rollups for {month.month}/{month.year}")
+    return rollups
 
 
 def ensure_output_dir(output_dir: str = "graphs") -> None:
@@ -119,16 +192,17 @@ def ensure_output_dir(output_dir: str = "graphs") -> None:
 
 
 def visualize_metric(
-    plt, date_range, daily_avg, color: str, metric: Metric, axis=None
-) -> str:
+    figure: Figure, date_range, daily_avg, color: str, metric: Metric, axis=None
+) -> Axes:
     """
     Create matplotlib axis for a given metric.
-    :param records:
+    The first metric is plotted on a new axis of the figure; subsequent metrics share its x-axis.
+    :param figure: Figure to plot on.
     :param metric:
-    :return:
+    :return: the axis the metric was plotted on.
     """
     if not axis:
-        ax = plt.gca()
+        ax = figure.add_subplot()
     else:
         ax = axis.twinx()
     ax.plot(
@@ -148,20 +222,6 @@ def visualize_metric(
     return ax
 
 
-def create_panda_df(records: list[dict], metrics: list[str]):
-    """
-    Create a pandas DataFrame from the records for easier visualization purposes.
-    :param records: serialized records
-    :param metrics: metrics from those records.
-    :return: pandas DataFrame
-    """
-    df = pd.DataFrame(records)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601").dt.date
-    for metric in metrics:
-        df[metric] = df["data"].apply(lambda x: x[metric])
-    return df
-
-
 def main(user_id: int, months: list[Tuple[int, int]]):
     """
     Main function that retrieves records for a given month and visualizes them.
@@ -172,8 +232,19 @@ def main(user_id: int, months: list[Tuple[int, int]]):
 
     user = user_repository.find_user(user_id)
     for month in months:
-        records = retrieve_records(user_id, month, record_repository=record_repository)
-        file_path = visualize(user, records, month)
+        month = Month(*month)
+        rollups = retrieve_daily_rollups(
+            user_id, month, record_repository=record_repository
+        )
+        metric_names = [metric.name for metric in user.metrics]
+        graph = render_graph(
+            user.metrics, rollup_averages(rollups, metric_names), month
+        )
+        if graph is None:
+            continue
+        ensure_output_dir()
+        file_path = graph_file_path(user_id, user.metrics, month)
+        Path(file_path).write_bytes(graph)
         logging.info(f"Graph saved to {file_path}")
 
 
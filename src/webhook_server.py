@@ -0,0 +1,303 @@
+import asyncio
+import hmac
+import json
+import logging
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Awaitable, Callable
+
+from telegram import Update
+from telegram.ext import Application
+
+from src.config.instrumentation_config import InstrumentationConfig
+from src.config.webhook_config import WebhookConfig
+from src.instrumentation import REGISTRY, MetricsRegistry
+
+"""
+Minimal HTTP/1.1 server for receiving updates via webhook and for serving metrics.
+Updates posted by Telegram are put on the update queue of the application, from where they are processed
+exactly as polled updates. The server additionally serves a health endpoint for load balancers.
+It is built on asyncio streams, so that it runs on the event loop of the application without further dependencies.
+Every read is bounded in time and size, so that clients that send slowly or never finish a request
+cannot hold connections and memory indefinitely.
+"""
+
+# Telegram updates are small; anything larger is not an update
+MAX_BODY_BYTES = 1024 * 1024
+# maximum length of the request line and of each header line
+MAX_LINE_BYTES = 8192
+MAX_HEADERS = 100
+# time within which the rest of a request must arrive once its request line has been received
+READ_TIMEOUT_SECONDS = 10
+# time a kept alive connection may wait for its next request
+IDLE_TIMEOUT_SECONDS = 60
+SECRET_TOKEN_HEADER = "x-telegram-bot-api-secret-token"
+
+
+class RequestError(ValueError):
+    """
+    Raised for requests the server cannot read, which are answered with the given status before closing the connection.
+    """
+
+    def __init__(self, message: str, status: HTTPStatus = HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    headers: dict[str, str]
+    body: bytes = b""
+
+
+@dataclass
+class Response:
+    status: HTTPStatus
+    body: bytes = b""
+    headers: dict[str, str] = field(
+        default_factory=lambda: {"Content-Type": "application/json"}
+    )
+
+    @classmethod
+    def json(cls, status: HTTPStatus, content: dict) -> "Response":
+        return cls(status, json.dumps(content).encode())
+
+
+Route = Callable[[Request], Awaitable[Response]]
+
+
+class HttpServer:
+    """
+    Serves the added routes. Connections are kept alive, since Telegram delivers consecutive updates
+    over the same connections. Connections that are idle or send a request too slowly are closed.
+    """
+
+    def __init__(
+        self,
+        listen: str,
+        port: int,
+        read_timeout_seconds: float = READ_TIMEOUT_SECONDS,
+        idle_timeout_seconds: float = IDLE_TIMEOUT_SECONDS,
+    ):
+        self.listen = listen
+        self.requested_port = port
+        self.read_timeout_seconds = read_timeout_seconds
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.server: asyncio.Server | None = None
+        self.routes: dict[tuple[str, str], Route] = {}
+        # tasks handling the open connections, which are cancelled when the server is stopped
+        self.connections: set[asyncio.Task] = set()
+
+    def add_route(self, method: str, path: str, route: Route) -> None:
+        self.routes[(method, path)] = route
+
+    @property
+    def port(self) -> int:
+        """
+        The port the server is listening on, e.g. if it was started on port 0.
+        """
+        return self.server.sockets[0].getsockname()[1]
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(
+            self.handle_connection,
+            self.listen,
+            self.requested_port,
+            limit=MAX_LINE_BYTES,
+        )
+        logging.info(
+            f"{type(self).__name__} listening on {self.listen}:{self.port}, serving "
+            f"{', '.join(path for _, path in self.routes)}"
+        )
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            for connection in self.connections:
+                connection.cancel()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        connection = asyncio.current_task()
+        self.connections.add(connection)
+        try:
+            while True:
+                try:
+                    request = await read_request(
+                        reader, self.read_timeout_seconds, self.idle_timeout_seconds
+                    )
+                except RequestError as error:
+                    await write_response(
+                        writer,
+                        Response.json(error.status, {"error": str(error)}),
+                        keep_alive=False,
+                    )
+                    return
+                if request is None:
+                    return
+                response = await self.dispatch(request)
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                await write_response(writer, response, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, TimeoutError):
+            pass
+        finally:
+            writer.close()
+            self.connections.discard(connection)
+
+    async def dispatch(self, request: Request) -> Response:
+        route = self.routes.get((request.method, request.path))
+        if route is None:
+            if any(path == request.path for _, path in self.routes):
+                return Response.json(HTTPStatus.METHOD_NOT_ALLOWED, {})
+            return Response.json(HTTPStatus.NOT_FOUND, {})
+        try:
+            return await route(request)
+        except Exception:
+            logging.exception(f"Failed to handle {request.method} {request.path}")
+            return Response.json(HTTPStatus.INTERNAL_SERVER_ERROR, {})
+
+
+class WebhookServer(HttpServer):
+    """
+    Serves the webhook and the health endpoint.
+    """
+
+    def __init__(self, application: Application, config: WebhookConfig):
+        super().__init__(config.listen, config.port)
+        self.application = application
+        self.config = config
+        self.add_route("POST", f"/{config.url_path.strip('/')}", self.handle_update)
+        self.add_route("GET", "/health", self.handle_health)
+
+    async def handle_update(self, request: Request) -> Response:
+        if self.config.secret_token is not None and not hmac.compare_digest(
+            request.headers.get(SECRET_TOKEN_HEADER, ""), self.config.secret_token
+        ):
+            logging.warning("Rejected webhook request with invalid secret token")
+            return Response.json(HTTPStatus.FORBIDDEN, {})
+        try:
+            content = json.loads(request.body)
+            if not isinstance(content, dict):
+                raise ValueError("update is not a JSON object")
+            update = Update.de_json(content, self.application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as error:
+            logging.warning(f"Received invalid update: {error}")
+            return Response.json(HTTPStatus.BAD_REQUEST, {"error": "invalid update"})
+        await self.application.update_queue.put(update)
+        return Response.json(HTTPStatus.OK, {})
+
+    async def handle_health(self, _: Request) -> Response:
+        running = self.application.running
+        return Response.json(
+            HTTPStatus.OK if running else HTTPStatus.SERVICE_UNAVAILABLE,
+            {
+                "status": "ok" if running else "unavailable",
+                "update_queue": self.application.update_queue.qsize(),
+            },
+        )
+
+
+class MetricsServer(HttpServer):
+    """
+    Serves the metrics of a registry in the Prometheus text exposition format.
+    """
+
+    def __init__(
+        self, config: InstrumentationConfig, registry: MetricsRegistry = REGISTRY
+    ):
+        super().__init__(config.listen, config.port)
+        self.registry = registry
+        self.add_route("GET", config.path, self.handle_metrics)
+
+    async def handle_metrics(self, _: Request) -> Response:
+        return Response(
+            HTTPStatus.OK,
+            self.registry.render().encode(),
+            {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+
+async def read_request(
+    reader: asyncio.StreamReader,
+    read_timeout_seconds: float = READ_TIMEOUT_SECONDS,
+    idle_timeout_seconds: float = IDLE_TIMEOUT_SECONDS,
+) -> Request | None:
+    """
+    Reads a single request from a connection.
+    The request line must arrive within the idle timeout, the headers and body within the read timeout after it.
+    Lines are limited to the limit of the reader, i.e. MAX_LINE_BYTES for connections of the HttpServer.
+    :return: the request, or None if the client closed the connection.
+    :raises RequestError: if the request is malformed, too large or uses a transfer coding.
+    :raises TimeoutError: if the request did not arrive in time.
+    """
+    request_line = await asyncio.wait_for(read_line(reader), idle_timeout_seconds)
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split()
+    except ValueError:
+        raise RequestError("Malformed request line")
+    headers, body = await asyncio.wait_for(
+        read_headers_and_body(reader), read_timeout_seconds
+    )
+    return Request(method.upper(), target.split("?")[0], headers, body)
+
+
+async def read_line(reader: asyncio.StreamReader) -> bytes:
+    try:
+        return await reader.readline()
+    except ValueError:
+        # the line exceeds the limit of the reader
+        raise RequestError("Line too long")
+
+
+async def read_headers_and_body(
+    reader: asyncio.StreamReader,
+) -> tuple[dict[str, str], bytes]:
+    headers = {}
+    # repeated headers are counted as well, though only the last one is kept
+    header_lines = 0
+    while (line := await read_line(reader)) not in (b"\r\n", b"\n", b""):
+        header_lines += 1
+        if header_lines > MAX_HEADERS:
+            raise RequestError("Too many headers")
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    # Bodies are only read by their content length. Telegram sends one, and a body of any other
+    # transfer coding would be left on the connection and read as the next request.
+    if "transfer-encoding" in headers:
+        if headers["transfer-encoding"].lower() == "chunked":
+            raise RequestError("Content length required", HTTPStatus.LENGTH_REQUIRED)
+        raise RequestError("Transfer coding not supported", HTTPStatus.NOT_IMPLEMENTED)
+    try:
+        content_length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise RequestError("Malformed content length")
+    if content_length < 0:
+        raise RequestError("Malformed content length")
+    if content_length > MAX_BODY_BYTES:
+        raise RequestError("Request body too large")
+    body = await reader.readexactly(content_length) if content_length else b""
+    return headers, body
+
+
+async def write_response(
+    writer: asyncio.StreamWriter, response: Response, keep_alive: bool
+) -> None:
+    headers = {
+        **response.headers,
+        "Content-Length": str(len(response.body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+    }
+    head = f"HTTP/1.1 {response.status.value} {response.status.phrase}\r\n"
+    head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    writer.write(head.encode("latin-1") + b"\r\n" + response.body)
+    await writer.drain()
@@ -34,3 +34,44 @@ module "record" {
 
   billing_mode = "PAY_PER_REQUEST"
 }
+
+module "daily_rollup" {
+  source = "terraform-aws-modules/dynamodb-table/aws"
+
+  name      = "daily_rollup"
+  hash_key  = "user_id"
+  range_key = "date"
+
+  attributes = [
+    {
+      name = "user_id"
+      type = "N"
+    },
+    {
+      name = "date"
+      type = "S"
+    }
+  ]
+
+  billing_mode = "PAY_PER_REQUEST"
+}
+
+module "state" {
+  source = "terraform-aws-modules/dynamodb-table/aws"
+
+  name     = "state"
+  hash_key = "id"
+
+  # namespace and user, e.g. temp_records:1, so that the state of all users is spread across partitions
+  attributes = [
+    {
+      name = "id"
+      type = "S"
+    }
+  ]
+
+  ttl_enabled        = true
+  ttl_attribute_name = "expires_at"
+
+  billing_mode = "PAY_PER_REQUEST"
+}
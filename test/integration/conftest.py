@@ -10,12 +10,19 @@ from kink import di
 from src.app import MoodTrackerApplication
 from src.config.auto_baseline import AutoBaselineConfig
 from src.config.config import ConfigurationProvider
+from src.config.state_config import StateConfig
 from src.notifier import Notifier
 from src.repository.dynamodb.dynamodb_record_repository import DynamoDBRecordRepository
 from src.repository.dynamodb.dynamodb_user_repository import DynamoDBUserRepository
+from src.repository.initialize import (
+    create_repository_executor,
+    initialize_async_repositories,
+)
 from src.repository.mongodb.mongodb_record_repository import MongoDBRecordRepository
 from src.repository.mongodb.mongodb_user_repository import MongoDBUserRepository
+from src.service.graph_service import GraphService
 from src.service.user_service import UserService
+from src.state import initialize_state_stores
 
 """
 Pytest Fixture setup.
@@ -80,9 +87,22 @@ def dynamodb_record_repository(dynamodb):
         ],
         BillingMode="PAY_PER_REQUEST",
     )
+    dynamodb.create_table(
+        TableName="daily_rollup",
+        KeySchema=[
+            {"AttributeName": "user_id", "KeyType": "HASH"},
+            {"AttributeName": "date", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "user_id", "AttributeType": "N"},
+            {"AttributeName": "date", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
     record_repository = DynamoDBRecordRepository(dynamodb)
     yield record_repository
     record_repository.table.delete()
+    record_repository.rollups.delete()
 
 
 # Declare Repositories named tuple for easier access in tests
@@ -108,6 +128,9 @@ def repositories(
         record_repository = dynamodb_record_repository.register(
             alias="record_repository"
         )
+    initialize_async_repositories(
+        user_repository, record_repository, create_repository_executor(4)
+    )
     return Repositories(
         user_repository=user_repository, record_repository=record_repository
     )
@@ -132,6 +155,11 @@ def auto_baseline_config():
     )
 
 
+@pytest.fixture(autouse=True)
+def state_stores():
+    return initialize_state_stores(StateConfig())
+
+
 @pytest.fixture(autouse=True)
 def application():
     # initializes application, registers notifier implicitly
@@ -148,6 +176,13 @@ def user_service(repositories):
     return user_service.register()
 
 
+@pytest.fixture(autouse=True)
+def graph_service(repositories):
+    graph_service = GraphService().register()
+    yield graph_service
+    graph_service.shutdown()
+
+
 @pytest.fixture(autouse=True)
 def update():
     update = Mock()
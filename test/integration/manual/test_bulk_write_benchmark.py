@@ -0,0 +1,43 @@
+import datetime
+
+from src.model.record import Record
+
+"""
+Benchmark for writing a year of records for many users.
+Compares one create_record call per record with create_records_bulk.
+Requires a local DynamoDB stand-in (e.g. localstack) on localhost:4566, like the integration tests.
+mongomock is not benchmarked, since it neither has network round trips nor uses indexes for upserts.
+"""
+
+USERS = 2
+DAYS = 365
+
+
+def records(user_offset: int) -> list[Record]:
+    start = datetime.datetime(2023, 1, 1, 12)
+    return [
+        Record(
+            user_id=user_offset + user_id,
+            data={"mood": 1, "sleep": 8},
+            timestamp=start + datetime.timedelta(days=day),
+        )
+        for user_id in range(USERS)
+        for day in range(DAYS)
+    ]
+
+
+def test_bulk_write_is_faster_than_single_writes(dynamodb_record_repository):
+    record_repository = dynamodb_record_repository
+
+    single_start = datetime.datetime.now()
+    for record in records(0):
+        record_repository.save_record(record)
+    single_seconds = (datetime.datetime.now() - single_start).total_seconds()
+
+    result = record_repository.create_records_bulk(records(USERS))
+
+    print(
+        f"\n{result.records} records: single writes {single_seconds:.2f}s, "
+        f"bulk write {result.seconds:.2f}s ({result.records_per_second:.0f} records/s)"
+    )
+    assert result.seconds < single_seconds
@@ -0,0 +1,62 @@
+import datetime
+import time
+
+import pandas as pd
+
+from src.model.daily_rollup import aggregate_daily_rollups
+from src.model.record import Record
+from src.visualise import rollup_averages
+
+"""
+Micro-benchmark for building the graphing DataFrame.
+Compares the previous construction, which serialized records to dicts, re-parsed their ISO timestamps
+and averaged them per day, with the construction from typed columns of the daily rollups.
+The rollups are aggregated outside the measurement, since the repositories maintain them when records are written.
+"""
+
+RECORDS = 10_000
+METRICS = ["mood", "sleep", "energy"]
+
+
+def legacy_daily_averages(records: list[dict], metrics: list[str]) -> pd.DataFrame:
+    df = pd.DataFrame(records)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601").dt.date
+    for metric in metrics:
+        df[metric] = df["data"].apply(lambda x: x[metric])
+    return df.groupby("timestamp")[metrics].mean().reset_index()
+
+
+def best_of(runs: int, function) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def test_columnar_construction_is_faster():
+    start = datetime.datetime(2020, 1, 1, 8)
+    records = [
+        Record(
+            user_id=1,
+            data={metric: index % 5 for metric in METRICS},
+            timestamp=start + datetime.timedelta(hours=index * 3),
+        )
+        for index in range(RECORDS)
+    ]
+    rollups = aggregate_daily_rollups(records)
+
+    legacy = best_of(
+        5,
+        lambda: legacy_daily_averages(
+            [record.serialize() for record in records], METRICS
+        ),
+    )
+    columnar = best_of(5, lambda: rollup_averages(rollups, METRICS))
+
+    print(
+        f"\n{RECORDS} records in {len(rollups)} days: legacy {legacy * 1000:.1f} ms, "
+        f"columnar {columnar * 1000:.1f} ms, speedup {legacy / columnar:.1f}x"
+    )
+    assert columnar < legacy
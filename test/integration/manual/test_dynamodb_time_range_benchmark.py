@@ -0,0 +1,79 @@
+import datetime
+import logging
+import time
+
+from boto3.dynamodb.conditions import Key
+
+"""
+Benchmark for retrieving a user's records for a time range from DynamoDB.
+Compares the previous full-table scan with the key-conditioned query in terms of latency and read capacity units.
+Requires a local DynamoDB stand-in (e.g. localstack) on localhost:4566, like the integration tests.
+"""
+
+USERS = 50
+DAYS = 365
+
+
+def seed(table):
+    start = datetime.datetime(2023, 1, 1, 12)
+    with table.batch_writer() as batch:
+        for user_id in range(USERS):
+            for day in range(DAYS):
+                timestamp = (start + datetime.timedelta(days=day)).isoformat()
+                batch.put_item(
+                    Item={
+                        "user_id": user_id,
+                        "timestamp": timestamp,
+                        "data": {"mood": 1, "sleep": 8},
+                    }
+                )
+
+
+def measure(read_page, **arguments) -> tuple[int, int, float, float]:
+    """
+    Reads all pages of a scan or query.
+    Read capacity is billed on the items DynamoDB evaluates, not the ones it returns, so the scanned count is reported
+    alongside the consumed capacity (which some local stand-ins do not calculate accurately).
+    :return: returned items, scanned items, consumed capacity units and latency in seconds.
+    """
+    items, scanned, capacity = 0, 0, 0.0
+    start = time.perf_counter()
+    while True:
+        response = read_page(ReturnConsumedCapacity="TOTAL", **arguments)
+        items += len(response["Items"])
+        scanned += response["ScannedCount"]
+        capacity += response.get("ConsumedCapacity", {}).get("CapacityUnits", 0)
+        if "LastEvaluatedKey" not in response:
+            break
+        arguments["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return items, scanned, capacity, time.perf_counter() - start
+
+
+def test_time_range_query_reads_less_than_scan(dynamodb_record_repository):
+    table = dynamodb_record_repository.table
+    seed(table)
+    beginning = datetime.datetime(2023, 3, 1)
+    end = datetime.datetime(2023, 3, 31, 23, 59, 59)
+
+    scan_items, scan_scanned, scan_capacity, scan_latency = measure(
+        table.scan,
+        FilterExpression=Key("user_id").eq(1)
+        & Key("timestamp").between(beginning.isoformat(), end.isoformat()),
+    )
+    query_items, query_scanned, query_capacity, query_latency = measure(
+        table.query,
+        KeyConditionExpression=Key("user_id").eq(1)
+        & Key("timestamp").between(beginning.isoformat(), end.isoformat()),
+    )
+
+    logging.info(
+        f"scan: {scan_items} items, {scan_scanned} scanned, {scan_capacity} RCUs, {scan_latency * 1000:.1f} ms"
+    )
+    logging.info(
+        f"query: {query_items} items, {query_scanned} scanned, {query_capacity} RCUs, {query_latency * 1000:.1f} ms"
+    )
+    assert scan_items == query_items == 31
+    assert query_scanned == query_items
+    assert scan_scanned == USERS * DAYS
+    assert query_capacity <= scan_capacity
+    assert query_latency < scan_latency
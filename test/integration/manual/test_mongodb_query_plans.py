@@ -0,0 +1,77 @@
+import datetime
+import os
+
+import pymongo
+import pytest
+
+from src.repository.mongodb.indexes import ensure_indexes
+
+"""
+Verifies that the hot record queries are served by the records index.
+mongomock does not implement explain(), so this requires a MongoDB instance reachable via MONGODB_HOST.
+"""
+
+
+@pytest.fixture
+def records():
+    client = pymongo.MongoClient(
+        os.environ.get("MONGODB_HOST"), ServerSelectionTimeoutMS=2000
+    )
+    client.server_info()
+    client.drop_database("mood_tracker")
+    ensure_indexes(client)
+    records = client["mood_tracker"]["records"]
+    start = datetime.datetime(2024, 1, 1, 12)
+    records.insert_many(
+        [
+            {
+                "user_id": user_id,
+                "data": {"mood": 0},
+                "timestamp": (start + datetime.timedelta(days=day)).isoformat(),
+            }
+            for user_id in range(10)
+            for day in range(100)
+        ]
+    )
+    yield records
+    client.drop_database("mood_tracker")
+
+
+def stages(plan: dict) -> list[str]:
+    """
+    Flattens a query plan into the list of its stage names.
+    """
+    result = [plan["stage"]]
+    for child in plan.get("inputStages", []) + [plan.get("inputStage")]:
+        if child:
+            result.extend(stages(child))
+    return result
+
+
+def test_latest_record_query_uses_index(records):
+    plan = (
+        records.find({"user_id": 1})
+        .sort("timestamp", pymongo.DESCENDING)
+        .limit(1)
+        .explain()
+    )
+    plan_stages = stages(plan["queryPlanner"]["winningPlan"])
+    assert "IXSCAN" in plan_stages
+    assert "COLLSCAN" not in plan_stages
+    assert "SORT" not in plan_stages
+
+
+def test_time_range_query_uses_index(records):
+    plan = records.find(
+        {
+            "user_id": 1,
+            "timestamp": {
+                "$gte": datetime.datetime(2024, 2, 1).isoformat(),
+                "$lte": datetime.datetime(2024, 2, 29).isoformat(),
+            },
+        }
+    ).explain()
+    plan_stages = stages(plan["queryPlanner"]["winningPlan"])
+    assert "IXSCAN" in plan_stages
+    assert "COLLSCAN" not in plan_stages
+    assert plan["executionStats"]["totalDocsExamined"] == 29
@@ -27,7 +27,7 @@ async def test_notification(application, configuration):
     # Utility: Add an error handler to the application
     add_error_handler(application.application)
 
-    with unittest.mock.patch("src.notifier.Notifier.reminder"):
+    with unittest.mock.patch("src.notifier.Notifier.send_reminders"):
         # When the application runs
         loop = asyncio.get_event_loop()
         apply()
@@ -54,7 +54,7 @@ async def test_auto_baseline(update, application, configuration, user_repository
     # Utility: Add an error handler to the application
     add_error_handler(application.application)
 
-    with unittest.mock.patch("src.notifier.Notifier.auto_baseline"):
+    with unittest.mock.patch("src.notifier.Notifier.run_auto_baselines"):
         # When the application runs
         loop = asyncio.get_event_loop()
         apply()
@@ -0,0 +1,47 @@
+import gc
+import time
+import tracemalloc
+
+from src.model.metric import Metric
+from src.model.record import TempRecord
+
+"""
+Micro-benchmark for in-flight records.
+Measures the memory held by many concurrent recording sessions and the time to answer all metrics of a record.
+"""
+
+SESSIONS = 10_000
+METRICS = [
+    Metric(
+        name=f"metric-{i}",
+        user_prompt="How do you feel right now?",
+        values={str(value): value for value in range(-3, 4)},
+    )
+    for i in range(5)
+]
+
+
+def test_temp_record_memory_and_answer_time():
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    # every session receives the metrics of its user, freshly retrieved from the database
+    sessions = [
+        TempRecord([metric.model_copy(deep=True) for metric in METRICS])
+        for _ in range(SESSIONS)
+    ]
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    start = time.perf_counter()
+    for temp_record in sessions:
+        while not temp_record.is_complete():
+            temp_record.update_data(temp_record.next_unanswered_metric().name, 1)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"\n{SESSIONS} sessions: {allocated / SESSIONS:.0f} bytes per session, "
+        f"{elapsed / (SESSIONS * len(METRICS)) * 1e6:.2f}µs per answer"
+    )
+    assert all(temp_record.is_complete() for temp_record in sessions)
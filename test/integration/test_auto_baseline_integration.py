@@ -16,8 +16,8 @@ async def test_auto_baseline_happy_path_if_no_other_records_exist(
     context = Mock()
     context.bot.send_message = AsyncMock()
 
-    # When auto-baseline is called
-    await notifier.auto_baseline(context, user)
+    # When baselines are created for the user
+    await notifier.create_baselines(context.bot, [user.user_id])
 
     # Then a record is created
     record = record_repository.get_latest_record_for_user(user.user_id)
@@ -42,8 +42,8 @@ async def test_auto_baseline_happy_path_if_record_exists_from_yesterday(
     yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
     record_repository.create_record(user.user_id, {}, yesterday.isoformat())
 
-    # When auto-baseline is called
-    await notifier.auto_baseline(context, user)
+    # When baselines are created for the user
+    await notifier.create_baselines(context.bot, [user.user_id])
 
     # Then a record is created
     assert len(records := record_repository.find_records_for_user(user.user_id)) == 2
@@ -69,8 +69,49 @@ async def test_auto_baseline_wont_create_record_if_record_already_exists_for_the
     # exactly one record exists
     assert len(record_repository.find_records_for_user(user.user_id)) == 1
 
-    # When auto-baseline is called
-    await notifier.auto_baseline(context, user)
+    # When baselines are created for the user
+    await notifier.create_baselines(context.bot, [user.user_id])
 
     # Then no new record is created
     assert len(record_repository.find_records_for_user(user.user_id)) == 1
+
+
+@pytest.mark.asyncio
+async def test_auto_baselines_are_created_in_batch_for_time_slot(
+    update, notifier, repositories, auto_baseline_config
+):
+    record_repository = repositories.record_repository
+    # Given three users with auto-baseline at the same time
+    for user_id in (1, 2, 3):
+        update.effective_user.id = user_id
+        user = await create_user(update, None)
+        user.auto_baseline_config = auto_baseline_config
+        job_name = notifier.create_auto_baseline(user)
+
+    # And a user who has already created a record today
+    record_repository.create_record(2, {}, datetime.datetime.now().isoformat())
+
+    context = Mock()
+    context.job.name = job_name
+    context.bot.send_message = AsyncMock()
+
+    # When the job of the time slot runs
+    await notifier.run_auto_baselines(context)
+
+    # Then baseline records are created for the other users only
+    for user_id in (1, 3):
+        record = record_repository.get_latest_record_for_user(user_id)
+        assert record.data["mood"] == user.get_metric_by_name("mood").baseline
+    assert len(record_repository.find_records_for_user(2)) == 1
+
+    # And the daily rollups include the baseline records
+    timestamps = record_repository.find_latest_record_timestamps(
+        [1, 2, 3], datetime.date.today()
+    )
+    assert sorted(timestamps) == [1, 2, 3]
+
+    # And the users are notified
+    notified = {
+        call.kwargs["chat_id"] for call in context.bot.send_message.call_args_list
+    }
+    assert notified == {1, 3}
@@ -0,0 +1,119 @@
+import datetime
+
+from src.model.record import Record
+
+
+def test_records_are_rolled_up_per_day(repositories):
+    # Given records on two days, created through both write paths
+    record_repository = repositories.record_repository
+    record_repository.create_record(
+        1, {"mood": 1, "sleep": 8}, datetime.datetime(2024, 3, 1, 8).isoformat()
+    )
+    record_repository.create_record(
+        1, {"mood": -2, "sleep": "6"}, datetime.datetime(2024, 3, 1, 20).isoformat()
+    )
+    record_repository.save_record(
+        Record(
+            user_id=1,
+            data={"mood": 3, "sleep": 7},
+            timestamp=datetime.datetime(2024, 3, 1, 12),
+        )
+    )
+    record_repository.create_record(
+        1, {"mood": 0, "sleep": 9}, datetime.datetime(2024, 3, 2, 8).isoformat()
+    )
+
+    # When retrieving the rollups
+    rollups = record_repository.find_daily_rollups(
+        1, datetime.date(2024, 3, 1), datetime.date(2024, 3, 31)
+    )
+
+    # Then there is one rollup per day, holding sum, count, minimum and maximum
+    assert [rollup.date for rollup in rollups] == [
+        datetime.date(2024, 3, 1),
+        datetime.date(2024, 3, 2),
+    ]
+    first_day = rollups[0]
+    assert first_day.record_count == 3
+    assert first_day.latest_timestamp == datetime.datetime(2024, 3, 1, 20)
+    assert first_day.metrics["mood"].model_dump() == {
+        "sum": 2,
+        "count": 3,
+        "min": -2,
+        "max": 3,
+    }
+    assert first_day.metrics["sleep"].mean() == 7
+    assert rollups[1].metrics["mood"].count == 1
+
+
+def test_rollups_are_retrieved_for_date_range_and_user(repositories):
+    # Given records of two users on several days
+    for user_id in [1, 2]:
+        for day in [1, 15, 31]:
+            repositories.record_repository.create_record(
+                user_id, {"mood": 1}, datetime.datetime(2024, 3, day, 23).isoformat()
+            )
+
+    # When retrieving the rollups of one user for part of the month
+    rollups = repositories.record_repository.find_daily_rollups(
+        1, datetime.date(2024, 3, 15), datetime.date(2024, 3, 31)
+    )
+
+    # Then only the user's rollups within the range are returned
+    assert [rollup.date.day for rollup in rollups] == [15, 31]
+    assert all(rollup.user_id == 1 for rollup in rollups)
+
+
+def test_rebuilt_rollups_match_incremental_rollups(repositories):
+    # Given rollups that have been maintained incrementally
+    record_repository = repositories.record_repository
+    for hour, mood in [(8, 2), (12, -1), (20, 0)]:
+        record_repository.create_record(
+            1, {"mood": mood}, datetime.datetime(2024, 3, 1, hour).isoformat()
+        )
+    beginning, end = datetime.date(2024, 3, 1), datetime.date(2024, 3, 31)
+    incremental = record_repository.find_daily_rollups(1, beginning, end)
+
+    # When rebuilding the rollups from the records
+    rebuilt_count = record_repository.rebuild_daily_rollups(1)
+
+    # Then the rebuilt rollups are identical
+    assert rebuilt_count == 1
+    assert record_repository.find_daily_rollups(1, beginning, end) == incremental
+
+
+def test_latest_record_timestamps_of_multiple_users(repositories):
+    record_repository = repositories.record_repository
+    today = datetime.datetime(2024, 5, 2, 12, 0)
+    # Given users with records today, yesterday and not at all
+    record_repository.create_record(1, {"mood": 1}, today.isoformat())
+    record_repository.create_record(
+        1, {"mood": 2}, (today + datetime.timedelta(hours=2)).isoformat()
+    )
+    record_repository.create_record(
+        2, {"mood": 1}, (today - datetime.timedelta(days=1)).isoformat()
+    )
+
+    # When the latest timestamps of today are retrieved
+    timestamps = record_repository.find_latest_record_timestamps(
+        [1, 2, 3], today.date()
+    )
+
+    # Then only the user with records today is returned, with their latest timestamp
+    assert timestamps == {1: today + datetime.timedelta(hours=2)}
+
+
+def test_dynamodb_record_written_twice_is_rolled_up_once(dynamodb_record_repository):
+    # Given a record whose write is retried, e.g. after a timeout
+    timestamp = datetime.datetime(2024, 3, 1, 8).isoformat()
+    dynamodb_record_repository.create_record(1, {"mood": 1}, timestamp)
+
+    # When the same record is written again
+    dynamodb_record_repository.create_record(1, {"mood": 1}, timestamp)
+
+    # Then it is counted once in its daily rollup
+    [rollup] = dynamodb_record_repository.find_daily_rollups(
+        1, datetime.date(2024, 3, 1), datetime.date(2024, 3, 1)
+    )
+    assert rollup.record_count == 1
+    assert rollup.metrics["mood"].sum == 1
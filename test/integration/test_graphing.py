@@ -1,21 +1,21 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 
-from copy import deepcopy
 from unittest.mock import Mock, AsyncMock
 
 import pytest
+import pytest_asyncio
 
 from src.handlers import graphing
 from src.model.metric import Metric
 from src.model.record import Record
 import src.visualise as visualize
 
-from pathlib import Path
+PNG_SIGNATURE = b"\x89PNG"
 
 
-@pytest.fixture
-def user(user_service):
-    return user_service.create_user(1)
+@pytest_asyncio.fixture
+async def user(user_service):
+    return await user_service.create_user(1)
 
 
 @pytest.fixture
@@ -46,50 +46,35 @@ def graph_spec_button():
     return button_update
 
 
-def test_should_retrieve_one_record_for_time_range(month, record, repositories):
-    # Given two records for user 1
-    record_days_past = deepcopy(record)
-    record_days_future = deepcopy(record)
-    record_years_past = deepcopy(record)
-    record_years_future = deepcopy(record)
+def render_month(user, month, **kwargs) -> bytes | None:
+    rollups = visualize.retrieve_daily_rollups(user.user_id, month)
+    metric_names = [metric.name for metric in user.metrics]
+    return visualize.render_graph(
+        user.metrics, visualize.rollup_averages(rollups, metric_names), month, **kwargs
+    )
 
-    record_days_past.timestamp = datetime.today() - timedelta(days=10)
-    record_days_future.timestamp = datetime.today() + timedelta(days=30)
-    record_years_future.timestamp = datetime.today() + timedelta(days=365)
-    record_years_past.timestamp = datetime.today() - timedelta(days=365)
 
+def test_render_graph_creates_graph(record, repositories, user, month):
+    # Given a record
     repositories.record_repository.save_record(record)
-    repositories.record_repository.save_record(record_days_past)
-    repositories.record_repository.save_record(record_days_future)
-    repositories.record_repository.save_record(record_years_past)
-    repositories.record_repository.save_record(record_years_future)
-
-    # When retrieving records for the last 7 days
-    records = visualize.retrieve_records(
-        1, month, record_repository=repositories.record_repository
-    )
 
-    # Then only the record within the time range should be returned
-    assert len(records) == 1
-    assert records[0].timestamp == record.timestamp
+    # When rendering the month of the record
+    graph = render_month(user, month)
 
+    # Then the graph should be rendered as a PNG image
+    assert graph is not None
+    assert graph.startswith(PNG_SIGNATURE)
 
-def test_visualize_creates_graph(record, repositories, user, month):
+
+def test_render_graph_renders_configured_format(record, repositories, user, month):
     # Given a record
     repositories.record_repository.save_record(record)
 
-    # When visualizing the record
-    graph_path = visualize.visualize(user, month)
-
-    # Then the graph should be created
-    assert graph_path is not None
-    assert graph_path.endswith(".jpg")
-    assert Path(graph_path).exists()
-
-    assert "2022" in graph_path
-    assert "3" in graph_path
+    # When rendering the month of the record as a JPEG image
+    graph = render_month(user, month, image_format="jpg")
 
-    Path(graph_path).unlink()  # Clean up
+    # Then the graph should be rendered as a JPEG image
+    assert graph.startswith(b"\xff\xd8")
 
 
 @pytest.mark.asyncio
@@ -102,15 +87,13 @@ async def test_visualization_end_to_end(graph_spec_button, record, repositories)
     repositories.record_repository.save_record(record)
 
     # When visualizing the record
-    paths = await graphing.handle_graph_specification(graph_spec_button)
+    graphs = await graphing.handle_graph_specification(graph_spec_button)
 
-    # Then the graph should be created
-    assert graph_spec_button.effective_user.get_bot().send_photo.called
-    assert len(paths) == 1
-    assert Path(paths[0]).exists()
-    assert "2022" in paths[0]
-    assert "mood" in paths[0]
-    assert "sleep" in paths[0]
+    # Then the graph should be sent from memory
+    send_photo = graph_spec_button.effective_user.get_bot().send_photo
+    send_photo.assert_called_once_with(chat_id=1, photo=graphs[0])
+    assert len(graphs) == 1
+    assert graphs[0].startswith(PNG_SIGNATURE)
 
 
 @pytest.mark.asyncio
@@ -131,11 +114,115 @@ async def test_visualization_for_different_metrics(
     graphing.get_month_tuples_for_time_range = Mock(
         return_value=[visualize.Month(2022, 3)]
     )
-    paths = await graphing.handle_graph_specification(graph_spec_button)
+    graphs = await graphing.handle_graph_specification(graph_spec_button)
 
     # Then the graph should be created
     assert graph_spec_button.effective_user.get_bot().send_photo.called
 
-    assert len(paths) == 1
-    assert Path(paths[0]).exists()
-    assert "some-metric" in paths[0]
+    assert len(graphs) == 1
+    assert graphs[0].startswith(PNG_SIGNATURE)
+
+
+@pytest.mark.asyncio
+async def test_graphs_are_rendered_for_multiple_months(
+    graph_spec_button, record, repositories
+):
+    # Given records in two consecutive months
+    repositories.record_repository.save_record(record)
+    record.timestamp = datetime(2022, 4, 2)
+    repositories.record_repository.save_record(record)
+
+    # When visualizing both months
+    graphing.get_month_tuples_for_time_range = Mock(
+        return_value=[visualize.Month(2022, 3), visualize.Month(2022, 4)]
+    )
+    graphs = await graphing.handle_graph_specification(graph_spec_button)
+
+    # Then a graph is sent for each month
+    assert graph_spec_button.effective_user.get_bot().send_photo.call_count == 2
+    assert len(graphs) == 2
+    assert graphs[0] != graphs[1]
+
+
+@pytest.mark.asyncio
+async def test_months_without_records_are_skipped(
+    graph_spec_button, record, repositories
+):
+    # Given a record in only one of two months
+    repositories.record_repository.save_record(record)
+
+    # When visualizing both months
+    graphing.get_month_tuples_for_time_range = Mock(
+        return_value=[visualize.Month(2022, 2), visualize.Month(2022, 3)]
+    )
+    graphs = await graphing.handle_graph_specification(graph_spec_button)
+
+    # Then only the month with records is graphed
+    assert graph_spec_button.effective_user.get_bot().send_photo.call_count == 1
+    assert len(graphs) == 1
+
+
+@pytest.mark.asyncio
+async def test_rollups_for_all_months_are_retrieved_with_one_query(
+    graph_spec_button, record, repositories, graph_service
+):
+    # Given records in two consecutive months
+    repositories.record_repository.save_record(record)
+    record.timestamp = datetime(2022, 4, 30, 23)
+    repositories.record_repository.save_record(record)
+    graph_service.async_record_repository = Mock(
+        wraps=graph_service.async_record_repository
+    )
+
+    # When visualizing both months
+    graphing.get_month_tuples_for_time_range = Mock(
+        return_value=[visualize.Month(2022, 3), visualize.Month(2022, 4)]
+    )
+    graphs = await graphing.handle_graph_specification(graph_spec_button)
+
+    # Then the daily rollups are queried once, including records late on the last day
+    async_record_repository = graph_service.async_record_repository
+    assert async_record_repository.find_daily_rollups.call_count == 1
+    assert async_record_repository.find_records_for_time_range.call_count == 0
+    assert len(graphs) == 2
+
+
+@pytest.mark.asyncio
+async def test_unchanged_month_is_served_from_cache(
+    graph_spec_button, record, repositories, graph_service
+):
+    # Given a graph that has been rendered before
+    repositories.record_repository.save_record(record)
+    graphing.get_month_tuples_for_time_range = Mock(
+        return_value=[visualize.Month(2022, 3)]
+    )
+    first_graphs = await graphing.handle_graph_specification(graph_spec_button)
+
+    # When the same graph is requested again
+    second_graphs = await graphing.handle_graph_specification(graph_spec_button)
+
+    # Then it is served from the cache
+    assert first_graphs == second_graphs
+    assert graph_service.cache.statistics()["hits"] == 1
+    assert graph_spec_button.effective_user.get_bot().send_photo.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_month_is_rendered_again_when_records_change(
+    graph_spec_button, record, repositories, graph_service
+):
+    # Given a graph that has been rendered before
+    repositories.record_repository.save_record(record)
+    graphing.get_month_tuples_for_time_range = Mock(
+        return_value=[visualize.Month(2022, 3)]
+    )
+    await graphing.handle_graph_specification(graph_spec_button)
+
+    # When a record is added to the month and the graph is requested again
+    record.timestamp = datetime(2022, 3, 3)
+    repositories.record_repository.save_record(record)
+    await graphing.handle_graph_specification(graph_spec_button)
+
+    # Then the graph is rendered again
+    assert graph_service.cache.statistics()["hits"] == 0
+    assert graph_service.cache.statistics()["misses"] == 2
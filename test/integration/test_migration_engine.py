@@ -0,0 +1,139 @@
+import datetime
+import json
+import threading
+from unittest.mock import Mock, patch
+
+import pytest
+
+from src.model.record import Record
+from src.repository.dynamodb.tables import ThreadLocalTables
+from src.repository.migration_engine import MigrationEngine
+
+
+@pytest.fixture
+def source(mongodb_user_repository, mongodb_record_repository):
+    # Given three users with a month of records each in MongoDB
+    start = datetime.datetime(2024, 1, 1, 12)
+    for user_id in [1, 2, 3]:
+        mongodb_user_repository.create_user(user_id)
+        mongodb_record_repository.create_records_bulk(
+            Record(
+                user_id=user_id,
+                data={"mood": day % 3, "sleep": 8},
+                timestamp=start + datetime.timedelta(days=day),
+            )
+            for day in range(31)
+        )
+    return mongodb_user_repository, mongodb_record_repository
+
+
+@pytest.fixture
+def engine(source, dynamodb_user_repository, dynamodb_record_repository, tmp_path):
+    return MigrationEngine(
+        *source,
+        dynamodb_user_repository,
+        dynamodb_record_repository,
+        checkpoint_path=str(tmp_path / "checkpoint.json"),
+        workers=3,
+        batch_size=10,
+    )
+
+
+def test_all_users_and_records_are_migrated(engine, dynamodb_record_repository):
+    # When migrating
+    report = engine.run()
+
+    # Then all users, records and rollups are migrated
+    assert sorted(report.migrated_users) == [1, 2, 3]
+    assert report.records == 93
+    assert engine.target_user_repository.find_user(2) is not None
+    assert len(dynamodb_record_repository.find_records_for_user(2)) == 31
+    rollups = dynamodb_record_repository.find_daily_rollups(
+        2, datetime.date(2024, 1, 1), datetime.date(2024, 1, 31)
+    )
+    assert len(rollups) == 31
+
+    # And a dry run verifies that source and target match
+    verification = engine.run(dry_run=True)
+    assert len(verification.verifications) == 3
+    assert verification.mismatches == []
+
+
+def test_workers_write_through_table_resources_of_their_own(engine):
+    # Given a migration that records the threads using each resource
+    threads = {}
+    resource = ThreadLocalTables.resource
+
+    def record_resource(tables):
+        thread_resource = resource(tables)
+        threads.setdefault(id(thread_resource), set()).add(
+            threading.current_thread().name
+        )
+        return thread_resource
+
+    # When migrating with several workers
+    with patch.object(ThreadLocalTables, "resource", record_resource):
+        report = engine.run()
+
+    # Then the workers used resources, and no resource was used by more than one thread
+    assert sorted(report.migrated_users) == [1, 2, 3]
+    assert any(
+        name.startswith("migration") for names in threads.values() for name in names
+    )
+    assert all(len(names) == 1 for names in threads.values())
+
+
+def test_dry_run_reports_mismatches_without_writing(engine, dynamodb_record_repository):
+    # When verifying before migrating
+    report = engine.run(dry_run=True)
+
+    # Then every user is reported as mismatching and nothing is written
+    assert sorted(mismatch.user_id for mismatch in report.mismatches) == [1, 2, 3]
+    assert report.mismatches[0].source_count == 31
+    assert report.mismatches[0].target_count == 0
+    assert dynamodb_record_repository.find_records_for_user(1) == []
+
+
+def test_migration_resumes_from_checkpoint(engine, tmp_path):
+    # Given a checkpoint of an interrupted migration
+    with open(tmp_path / "checkpoint.json", "w") as checkpoint:
+        json.dump({"completed_users": [1, 3]}, checkpoint)
+
+    # When migrating again
+    report = engine.run()
+
+    # Then only the remaining user is migrated
+    assert report.migrated_users == [2]
+    assert sorted(report.skipped_users) == [1, 3]
+    assert engine.target_user_repository.find_user(1) is None
+
+
+def test_failed_users_are_retried_on_the_next_run(engine, dynamodb_record_repository):
+    # Given a user whose migration fails halfway
+    create_records_bulk = dynamodb_record_repository.create_records_bulk
+
+    def fail_for_second_user(records, **kwargs):
+        records = list(records)
+        result = create_records_bulk(records, **kwargs)
+        if records[0].user_id == 2:
+            raise ConnectionError("connection lost")
+        return result
+
+    dynamodb_record_repository.create_records_bulk = Mock(
+        side_effect=fail_for_second_user
+    )
+    report = engine.run()
+    assert list(report.failed_users) == [2]
+
+    # When migrating again
+    dynamodb_record_repository.create_records_bulk = create_records_bulk
+    report = engine.run()
+
+    # Then the user is migrated again without duplicating their records or rollups
+    assert report.migrated_users == [2]
+    assert len(dynamodb_record_repository.find_records_for_user(2)) == 31
+    rollup = dynamodb_record_repository.find_daily_rollups(
+        2, datetime.date(2024, 1, 1), datetime.date(2024, 1, 1)
+    )[0]
+    assert rollup.record_count == 1
+    assert engine.run(dry_run=True).mismatches == []
@@ -0,0 +1,77 @@
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from src.repository.mongodb.indexes import ensure_indexes
+
+
+def test_ensure_indexes_creates_missing_indexes(mongo_client):
+    # When indexes are ensured on an empty database
+    created_indexes = ensure_indexes(mongo_client)
+
+    # Then all indexes are created
+    assert created_indexes == [
+        "records.user_id_timestamp",
+        "daily_rollups.user_id_date",
+        "user.user_id",
+        "state.expires_at",
+    ]
+    records_index = mongo_client["mood_tracker"]["records"].index_information()
+    assert list(records_index["user_id_timestamp"]["key"]) == [
+        ("user_id", 1),
+        ("timestamp", -1),
+    ]
+
+
+def test_ensure_indexes_is_idempotent(mongo_client):
+    # Given indexes that have already been created
+    ensure_indexes(mongo_client)
+
+    # When indexes are ensured again
+    created_indexes = ensure_indexes(mongo_client)
+
+    # Then no indexes are created
+    assert created_indexes == []
+
+
+def test_user_id_is_unique(mongo_client, mongodb_user_repository):
+    # Given the user index
+    ensure_indexes(mongo_client)
+
+    # When the same user is created twice
+    mongodb_user_repository.create_user(1)
+
+    # Then the second insertion is rejected
+    with pytest.raises(DuplicateKeyError):
+        mongodb_user_repository.create_user(1)
+
+
+def test_equivalent_index_under_another_name_is_not_recreated(mongo_client):
+    # Given an index on the records keys under another name
+    mongo_client["mood_tracker"]["records"].create_index(
+        [("user_id", 1), ("timestamp", -1)], name="legacy_index"
+    )
+
+    # When indexes are ensured
+    created_indexes = ensure_indexes(mongo_client)
+
+    # Then the equivalent index is not created again
+    assert "records.user_id_timestamp" not in created_indexes
+    assert "user_id_timestamp" not in (
+        mongo_client["mood_tracker"]["records"].index_information()
+    )
+
+
+def test_index_that_cannot_be_created_does_not_prevent_startup(mongo_client, caplog):
+    # Given duplicate users
+    mongo_client["mood_tracker"]["user"].insert_many([{"user_id": 1}, {"user_id": 1}])
+
+    # When indexes are ensured
+    created_indexes = ensure_indexes(mongo_client)
+
+    # Then the unique user index is skipped with a warning, and the other indexes are created
+    assert created_indexes == [
+        "records.user_id_timestamp",
+        "daily_rollups.user_id_date",
+        "state.expires_at",
+    ]
+    assert "Did not create MongoDB index user.user_id" in caplog.text
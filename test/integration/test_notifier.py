@@ -1,6 +1,18 @@
 import datetime
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
 
+import pytest
+from telegram.error import Forbidden
+from telegram.ext import Job, JobQueue
+
+from src.config.auto_baseline import AutoBaselineConfig
+from src.instrumentation import REGISTRY
 from src.model.notification import Notification
+from src.model.user import UserSchedule
+
+
+async def callback(context):
+    pass
 
 
 def test_add_to_job_queue(notifier):
@@ -11,3 +23,230 @@ def test_add_to_job_queue(notifier):
     assert notifier.find_job(job) is not None
     notifier.remove_job(job)
     assert job not in notifier.job_queue.jobs()
+
+
+def test_job_index_is_consistent_on_create_and_remove(notifier):
+    # Given a job and a reminder
+    notifier.register_job(notifier.job_queue.run_once(callback, 60, name="job_1"))
+    reminder = notifier.create_notification(
+        1, Notification(time=datetime.time(18, 0), text="Evening")
+    )
+
+    # When the job is removed
+    notifier.remove_job("job_1")
+
+    # Then it is neither indexed nor scheduled anymore
+    assert notifier.find_job("job_1") is None
+    assert [job.name for job in notifier.job_queue.jobs()] == [reminder]
+
+    # And removing it again does nothing
+    notifier.remove_job("job_1")
+    assert notifier.find_job(reminder) is not None
+
+
+def test_job_with_existing_name_replaces_job(notifier):
+    # Given a scheduled job
+    notifier.register_job(notifier.job_queue.run_once(callback, 60, name="job_1"))
+
+    # When a job with the same name is scheduled
+    job = notifier.job_queue.run_once(callback, 60, name="job_1")
+    notifier.register_job(job)
+
+    # Then only one job remains scheduled, which is the indexed one
+    assert notifier.job_queue.jobs() == (job,)
+    assert notifier.find_job("job_1") is job
+
+
+def schedule(user_id: int, time: str) -> UserSchedule:
+    return UserSchedule(
+        user_id=user_id,
+        auto_baseline_config=AutoBaselineConfig(enabled=True, time=time),
+    )
+
+
+def test_auto_baselines_at_same_time_share_one_job(notifier):
+    # Given users with auto-baseline at the same time
+    for user_id in (1, 2):
+        job_name = notifier.create_auto_baseline(schedule(user_id, "20:00"))
+
+    # Then there is a single job for both users
+    assert [job.name for job in notifier.job_queue.jobs()] == [job_name]
+    assert notifier.auto_baseline_slots[job_name] == {1, 2}
+
+    # When a user changes their auto-baseline time, they are moved to another time slot
+    other_job_name = notifier.create_auto_baseline(schedule(1, "21:00"))
+    assert notifier.auto_baseline_slots == {job_name: {2}, other_job_name: {1}}
+
+    # When the auto-baseline is removed for both users, so are the jobs
+    notifier.remove_auto_baseline(schedule(1, "21:00"))
+    notifier.remove_auto_baseline(schedule(2, "20:00"))
+    assert notifier.auto_baseline_slots == {}
+    assert notifier.job_queue.jobs() == ()
+
+
+def test_notifications_at_same_time_share_one_job(notifier):
+    # Given users with notifications at two distinct times
+    for user_id in range(1, 101):
+        for hour in (9, 18):
+            notifier.create_notification(
+                user_id, Notification(time=datetime.time(hour, 0), text="Reminder")
+            )
+
+    # Then there is one job per time slot, holding all subscribers
+    assert sorted(job.name for job in notifier.job_queue.jobs()) == [
+        "reminders_09:00:00",
+        "reminders_18:00:00",
+    ]
+    assert len(notifier.notification_slots["reminders_18:00:00"]) == 100
+
+
+def test_time_slot_is_removed_with_last_subscriber(notifier):
+    time = datetime.time(18, 0)
+    # Given two users subscribed to the same time slot
+    for user_id in (1, 2):
+        job_name = notifier.create_notification(
+            user_id, Notification(time=time, text="Reminder")
+        )
+
+    # When the first user's jobs are removed, the job remains for the second user
+    assert notifier.remove_jobs_for_user(1) == 1
+    assert notifier.find_job(job_name) is not None
+    assert notifier.notification_slots[job_name] == {2: "Reminder"}
+
+    # When the second user's jobs are removed, the job is removed
+    assert notifier.remove_jobs_for_user(2) == 1
+    assert notifier.find_job(job_name) is None
+    assert job_name not in notifier.notification_slots
+    assert notifier.job_queue.jobs() == ()
+
+
+def test_all_jobs_of_a_user_are_removed(notifier):
+    # Given a user with two reminders and an auto-baseline, sharing a time slot with another user
+    for hour in (9, 18):
+        notifier.create_notification(
+            1, Notification(time=datetime.time(hour, 0), text="Reminder")
+        )
+    notifier.create_notification(
+        2, Notification(time=datetime.time(9, 0), text="Reminder")
+    )
+    notifier.create_auto_baseline(
+        UserSchedule(
+            user_id=1,
+            auto_baseline_config=AutoBaselineConfig(enabled=True, time="12:00"),
+        )
+    )
+
+    # When the jobs of the user are removed
+    assert notifier.remove_jobs_for_user(1) == 3
+
+    # Then only the time slot of the other user remains
+    assert list(notifier.jobs) == ["reminders_09:00:00"]
+    assert notifier.notification_slots == {"reminders_09:00:00": {2: "Reminder"}}
+    assert notifier.auto_baseline_slots == {}
+    assert notifier.remove_jobs_for_user(1) == 0
+
+
+@pytest.mark.asyncio
+async def test_send_reminders_fans_out_to_all_subscribers(notifier):
+    # Given 50 users subscribed to a time slot
+    for user_id in range(1, 51):
+        job_name = notifier.create_notification(
+            user_id, Notification(time=datetime.time(18, 0), text=f"Hi {user_id}")
+        )
+    context = Mock()
+    context.job.name = job_name
+
+    # And a user for whom sending fails, e.g. because they blocked the bot
+    async def send_message(chat_id: int, text: str):
+        if chat_id == 7:
+            raise Forbidden("bot was blocked by the user")
+
+    context.bot.send_message = AsyncMock(side_effect=send_message)
+
+    # When the job of the time slot runs
+    await notifier.send_reminders(context)
+
+    # Then every subscriber is sent their reminder
+    sent = {
+        call.kwargs["chat_id"]: call.kwargs["text"]
+        for call in context.bot.send_message.call_args_list
+    }
+    assert sent == {user_id: f"Hi {user_id}" for user_id in range(1, 51)}
+
+
+@pytest.mark.asyncio
+async def test_send_reminders_queues_one_batch_at_a_time(notifier):
+    # Given more subscribers than fit in one batch
+    notifier.SEND_BATCH_SIZE = 10
+    for user_id in range(1, 26):
+        job_name = notifier.create_notification(
+            user_id, Notification(time=datetime.time(18, 0), text="Reminder")
+        )
+    context = Mock()
+    context.job.name = job_name
+    queue_depths = []
+
+    async def send_message(chat_id: int, text: str):
+        queue_depths.append(notifier.message_dispatcher.bulk.queue.qsize())
+
+    context.bot.send_message = AsyncMock(side_effect=send_message)
+
+    # When the job of the time slot runs
+    await notifier.send_reminders(context)
+
+    # Then all reminders are sent, but at most one batch is queued at a time
+    assert context.bot.send_message.call_count == 25
+    assert max(queue_depths) < 10
+
+
+def test_find_job_with_100k_jobs_does_not_scan_job_queue(notifier):
+    # Given 100k indexed jobs
+    # (they are not handed to the scheduler, which would take minutes to schedule this many jobs)
+    for user_id in range(100_000):
+        notifier.register_job(
+            Job(callback, name=f"reminder_{user_id}", chat_id=user_id)
+        )
+
+    # When jobs are looked up
+    with patch.object(
+        JobQueue, "jobs", side_effect=AssertionError("job queue scanned")
+    ):
+        # Then they are found in the index, without scanning the job queue
+        for user_id in range(0, 100_000, 100):
+            assert notifier.find_job(f"reminder_{user_id}").chat_id == user_id
+        assert notifier.find_job("reminder_100000") is None
+
+
+def test_application_metrics(application, state_stores):
+    notifier = application.notifier
+    application_state, temp_records = state_stores
+    application.register_metrics({"temp_records": temp_records}, {})
+    reminder = Notification(time=datetime.time(8, 0), text="Reminder")
+    notifier.create_notification(1, reminder)
+    notifier.create_notification(2, reminder)
+    notifier.create_auto_baseline(
+        UserSchedule(
+            user_id=1,
+            auto_baseline_config=AutoBaselineConfig(enabled=True, time="12:00"),
+        )
+    )
+    temp_records[1] = "record"
+
+    rendered = REGISTRY.render()
+
+    assert 'mood_tracker_scheduled_jobs{job="reminders"} 1.0' in rendered
+    assert 'mood_tracker_scheduled_jobs{job="baselines"} 1.0' in rendered
+    assert 'mood_tracker_job_subscriptions{job="reminders"} 2.0' in rendered
+    assert 'mood_tracker_job_subscriptions{job="baselines"} 1.0' in rendered
+    assert 'mood_tracker_state_entries{store="temp_records"} 1.0' in rendered
+    assert "mood_tracker_message_retries_total 0.0" in rendered
+
+
+def test_entries_of_database_state_stores_are_not_counted(application):
+    # Given a state store whose entries could only be counted by querying the database
+    store = MagicMock()
+    application.register_metrics({"temp_records": store}, {})
+
+    # When the metrics are scraped, the database is not queried
+    assert "mood_tracker_state_entries{" not in REGISTRY.render()
+    store.__len__.assert_not_called()
@@ -1,17 +1,24 @@
+import asyncio
 import datetime
 import logging
+import random
 import time
 from unittest.mock import Mock, AsyncMock
 
 import pytest
-from expiringdict import ExpiringDict
+from telegram import Update
 
 from src.config.config import ConfigurationProvider
+from src.config.state_config import StateConfig
 import src.handlers.record_handlers as command_handlers
 from src.handlers.record_handlers import create_temporary_record, button
 from src.handlers.user_handlers import create_user
+from src.message_dispatcher import MessageDispatcher
 from src.model.metric import Metric
 from src.model.user import User
+from src.rate_limiter import RateLimiter
+from src.state import initialize_state_stores
+from src.update_processor import PerUserUpdateProcessor
 
 expiry_time = 1
 
@@ -34,10 +41,7 @@ def button_update():
 
 @pytest.fixture(autouse=True)
 def patch_command_handler_methods():
-    command_handlers.temp_records = ExpiringDict(
-        max_len=100, max_age_seconds=expiry_time
-    )
-    command_handlers.state = ExpiringDict(max_len=100, max_age_seconds=expiry_time)
+    initialize_state_stores(StateConfig(ttl_seconds=expiry_time))
     command_handlers.prompt_user_for_metric = AsyncMock()
     command_handlers.handle_numeric_metric = AsyncMock()
     command_handlers.handle_no_known_state = AsyncMock()
@@ -64,12 +68,12 @@ async def test_init_and_expire_record(update, button_update):
     """
     # create record
     await create_user(update, None)
-    create_temporary_record(1)
-    assert command_handlers.get_temp_record(1) is not None
+    await create_temporary_record(1)
+    assert await command_handlers.get_temp_record(1) is not None
     # let expiry time elapse
     time.sleep(expiry_time + 1)
     # after being emptied, the dict contains an empty list, as opposed to being empty entirely
-    assert command_handlers.get_temp_record(1) is None
+    assert await command_handlers.get_temp_record(1) is None
 
     # when user attempts to record, they receive an error message
     await command_handlers.button(button_update, None)
@@ -95,8 +99,8 @@ async def test_record_registration(button_update, update):
 
     # first metric is set in the temporary record
     # omit this in further tests
-    assert command_handlers.get_temp_record(1).data["mood"] == 3
-    assert command_handlers.get_temp_record(1).data["sleep"] is None
+    assert (await command_handlers.get_temp_record(1)).data["mood"] == 3
+    assert (await command_handlers.get_temp_record(1)).data["sleep"] is None
 
 
 @pytest.mark.asyncio
@@ -120,7 +124,7 @@ async def test_finish_record_creation(
 
     # then record creation is complete
     # verify that the temporary record has been cleaned
-    assert command_handlers.temp_records.get(1) is None
+    assert await command_handlers.get_temp_record(1) is None
 
     # verify record was created
     user_records = record_repository.find_records_for_user(1)
@@ -153,8 +157,8 @@ async def test_double_answer_works_as_intended(update, button_update):
     await button(button_update, None)
 
     # then the record is updated
-    assert command_handlers.get_temp_record(1).data["mood"] == 3
-    assert command_handlers.get_temp_record(1).data["sleep"] is None
+    assert (await command_handlers.get_temp_record(1)).data["mood"] == 3
+    assert (await command_handlers.get_temp_record(1)).data["sleep"] is None
 
 
 @pytest.mark.asyncio
@@ -169,10 +173,9 @@ async def test_record_with_offset(update):
     await command_handlers.offset_handler(update, offset_context)
 
     # then the temp record's timestamp should be offset by 1 day
-    assert (
-        command_handlers.get_temp_record(1).timestamp.day
-        == (datetime.datetime.now() - datetime.timedelta(days=1)).day
-    )
+    assert (await command_handlers.get_temp_record(1)).timestamp.day == (
+        datetime.datetime.now() - datetime.timedelta(days=1)
+    ).day
 
 
 @pytest.mark.asyncio
@@ -242,3 +245,97 @@ async def test_latest_record_is_queried_correctly(update, repositories):
     logging.info(record)
 
     assert record.timestamp.isoformat() == timestamp_today
+
+
+@pytest.mark.asyncio
+async def test_compact_recording_edits_prompt_in_place(
+    update, button_update, repositories, configuration
+):
+    """
+    In compact mode, a record is entered in a single message that is edited as metrics are answered.
+    """
+    configuration.recording.mode = "compact"
+    # the edits go to the same chat in quick succession, which must neither wait for the per-chat interval
+    # nor outlast the unfinished record
+    MessageDispatcher(rate_limiter=RateLimiter(per_chat_interval_seconds=0)).register()
+    initialize_state_stores(StateConfig())
+    await create_user(update, None)
+    bot = button_update.effective_user.get_bot()
+    bot.edit_message_text = AsyncMock()
+    button_update.callback_query.message.message_id = 42
+
+    # when user calls /record, only the first prompt is sent
+    await command_handlers.record_handler(update, None)
+    command_handlers.prompt_user_for_metric.assert_awaited_once()
+    update.effective_user.get_bot().send_message.assert_called_once()  # /start
+
+    # when the first metric is answered, the prompt is replaced by the prompt of the next metric
+    await button(button_update, None)
+    kwargs = bot.edit_message_text.call_args.kwargs
+    assert kwargs["message_id"] == 42
+    assert kwargs["text"] == "How much sleep did you get today?"
+    assert kwargs["reply_markup"] is not None
+
+    # when the last metric is answered, the keyboard is removed and the record is stored
+    button_update.callback_query.data = "sleep:8"
+    await button(button_update, None)
+    kwargs = bot.edit_message_text.call_args.kwargs
+    assert kwargs["text"] == command_handlers.RECORD_COMPLETED_MESSAGE
+    assert kwargs["reply_markup"] is None
+    bot.send_message.assert_not_called()
+
+    records = repositories.record_repository.find_records_for_user(1)
+    assert len(records) == 1
+    assert records[0].data == {"mood": 3, "sleep": 8}
+
+
+def user_update(user_id: int, query_data: str | None = None) -> Update:
+    update = Mock(spec=Update)
+    update.effective_user.id = user_id
+    update.effective_user.get_bot().send_message = AsyncMock()
+    if query_data is not None:
+
+        async def answer():
+            # answering the query takes a varying amount of time, which reorders unsynchronized presses
+            await asyncio.sleep(random.uniform(0, 0.01))
+
+        update.callback_query.data = query_data
+        update.callback_query.answer = answer
+    return update
+
+
+@pytest.mark.asyncio
+async def test_interleaved_button_presses_are_assembled_per_user(repositories):
+    """
+    Button presses of many users arrive interleaved and are processed concurrently.
+    Every user's record contains their last answer to each metric.
+    """
+    initialize_state_stores(StateConfig())
+    processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+    user_ids = range(1, 11)
+    for user_id in user_ids:
+        await create_user(user_update(user_id), None)
+        await create_temporary_record(user_id)
+
+    # every user first answers the mood wrongly, corrects it and then answers the sleep
+    presses = [
+        user_update(user_id, query_data)
+        for query_data in ["mood:1", "mood:{}", "sleep:{}"]
+        for user_id in user_ids
+    ]
+    for press in presses:
+        press.callback_query.data = press.callback_query.data.format(
+            press.effective_user.id
+        )
+    await asyncio.gather(
+        *(
+            asyncio.create_task(processor.process_update(press, button(press, None)))
+            for press in presses
+        )
+    )
+
+    for user_id in user_ids:
+        records = repositories.record_repository.find_records_for_user(user_id)
+        assert len(records) == 1
+        assert records[0].data == {"mood": user_id, "sleep": user_id}
+        assert await command_handlers.get_temp_record(user_id) is None
@@ -1,6 +1,13 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from unittest.mock import Mock
+
 import pytest
+from boto3.dynamodb.conditions import Key
 
 from src.handlers.user_handlers import create_user
+from src.model.record import Record
 
 
 @pytest.mark.asyncio
@@ -8,3 +15,287 @@ async def test_should_retrieve_one_record_for_current_month(update):
     # Given a user
     user = await create_user(update, None)
     ...
+
+
+def test_dynamodb_time_range_query_only_returns_records_of_user_within_range(
+    dynamodb_record_repository,
+):
+    # Given records for two users, inside and outside the time range
+    day = datetime.datetime(2024, 3, 15)
+    for user_id in [1, 2]:
+        for offset in [-40, 0, 1, 40]:
+            timestamp = (day + datetime.timedelta(days=offset)).isoformat()
+            dynamodb_record_repository.create_record(user_id, {"mood": 1}, timestamp)
+
+    # When retrieving records for the time range
+    records = dynamodb_record_repository.find_records_for_time_range(
+        1, datetime.datetime(2024, 3, 1), datetime.datetime(2024, 3, 31)
+    )
+
+    # Then only the user's records within the time range are returned
+    assert len(records) == 2
+    assert all(record.user_id == 1 for record in records)
+
+
+def test_dynamodb_query_follows_last_evaluated_key(dynamodb_record_repository):
+    # Given more records than fit on a single page
+    for day in range(1, 6):
+        timestamp = datetime.datetime(2024, 3, day).isoformat()
+        dynamodb_record_repository.create_record(1, {"mood": 1}, timestamp)
+
+    # When querying with a page size of two
+    items = list(
+        dynamodb_record_repository.query_all(
+            KeyConditionExpression=Key("user_id").eq(1), Limit=2
+        )
+    )
+
+    # Then all pages are read
+    assert len(items) == 5
+
+
+def test_dynamodb_repository_uses_a_table_resource_per_thread(
+    dynamodb_record_repository,
+):
+    # Given the table of the thread that created the repository
+    table = dynamodb_record_repository.table
+
+    # When the repository is used from a thread of the repository executor
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor_table = executor.submit(
+            lambda: dynamodb_record_repository.table
+        ).result()
+        executor.submit(
+            dynamodb_record_repository.create_record,
+            1,
+            {"mood": 1},
+            datetime.datetime(2024, 3, 1).isoformat(),
+        ).result()
+
+    # Then that thread uses a resource of its own for the same table
+    assert executor_table is not table
+    assert executor_table.meta.client is not table.meta.client
+    assert executor_table.name == table.name
+    assert dynamodb_record_repository.get_latest_record_for_user(1) is not None
+
+
+def test_dynamodb_time_range_query_with_projection(dynamodb_record_repository):
+    # Given a record with multiple metrics
+    dynamodb_record_repository.create_record(
+        1, {"mood": 1, "sleep": 8}, datetime.datetime(2024, 3, 2).isoformat()
+    )
+
+    # When retrieving the record with a projection on a single metric
+    records = dynamodb_record_repository.find_records_for_time_range(
+        1,
+        datetime.datetime(2024, 3, 1),
+        datetime.datetime(2024, 3, 31),
+        projection=["user_id", "timestamp", "data.mood"],
+    )
+
+    # Then only the projected metric is returned
+    assert records[0].data == {"mood": 1}
+
+
+def test_iter_records_streams_all_records_across_pages(repositories):
+    record_repository = repositories.record_repository
+    # Given more records than fit into a single batch
+    start = datetime.datetime(2024, 1, 1, 12)
+    for hour in range(25):
+        timestamp = (start + datetime.timedelta(hours=hour)).isoformat()
+        record_repository.create_record(1, {"mood": hour}, timestamp)
+
+    # When iterating over the records in batches of ten
+    records = list(record_repository.iter_records(1, batch_size=10))
+
+    # Then all records are returned in ascending order
+    assert len(records) == 25
+    assert [record.data["mood"] for record in records] == list(range(25))
+
+
+def test_iter_records_within_time_range(repositories):
+    record_repository = repositories.record_repository
+    # Given records on five consecutive days
+    for day in range(1, 6):
+        timestamp = datetime.datetime(2024, 3, day, 12).isoformat()
+        record_repository.create_record(1, {"mood": day}, timestamp)
+
+    # When iterating over the records of the second to fourth day
+    records = record_repository.iter_records(
+        1, datetime.datetime(2024, 3, 2), datetime.datetime(2024, 3, 4, 23, 59)
+    )
+
+    # Then only records within the time range are returned
+    assert [record.data["mood"] for record in records] == [2, 3, 4]
+
+
+def test_iter_records_with_open_ended_time_range(repositories):
+    record_repository = repositories.record_repository
+    # Given records on five consecutive days
+    for day in range(1, 6):
+        timestamp = datetime.datetime(2024, 3, day, 12).isoformat()
+        record_repository.create_record(1, {"mood": day}, timestamp)
+
+    # When iterating over records from the fourth day onwards, or up to the second day
+    after = record_repository.iter_records(1, start=datetime.datetime(2024, 3, 4))
+    before = record_repository.iter_records(1, end=datetime.datetime(2024, 3, 2, 23))
+
+    # Then the time range is only bounded on one side
+    assert [record.data["mood"] for record in after] == [4, 5]
+    assert [record.data["mood"] for record in before] == [1, 2]
+
+
+def test_create_records_bulk_writes_all_batches(repositories):
+    record_repository = repositories.record_repository
+    # Given records of two users spanning more than one batch
+    start = datetime.datetime(2024, 1, 1, 12)
+    records = (
+        Record(
+            user_id=user_id,
+            data={"mood": day % 3},
+            timestamp=start + datetime.timedelta(days=day),
+        )
+        for user_id in [1, 2]
+        for day in range(30)
+    )
+
+    # When writing them in bulk in batches of 25
+    result = record_repository.create_records_bulk(records, batch_size=25)
+
+    # Then all records are written and the throughput is reported
+    assert result.records == 60
+    assert result.records_per_second > 0
+    assert len(record_repository.find_records_for_user(1)) == 30
+    assert len(record_repository.find_records_for_user(2)) == 30
+
+
+def test_create_records_bulk_merges_daily_rollups(repositories):
+    record_repository = repositories.record_repository
+    # Given a record that has already been rolled up
+    record_repository.create_record(
+        1, {"mood": 0}, datetime.datetime(2024, 3, 1, 8).isoformat()
+    )
+
+    # When more records of the same day are written in bulk
+    record_repository.create_records_bulk(
+        [
+            Record(
+                user_id=1,
+                data={"mood": mood},
+                timestamp=datetime.datetime(2024, 3, 1, hour),
+            )
+            for hour, mood in [(12, 2), (20, -1)]
+        ]
+    )
+
+    # Then they are merged into the existing rollup
+    day = datetime.date(2024, 3, 1)
+    rollup = record_repository.find_daily_rollups(1, day, day)[0]
+    assert rollup.record_count == 3
+    assert rollup.latest_timestamp == datetime.datetime(2024, 3, 1, 20)
+    assert rollup.metrics["mood"].model_dump() == {
+        "sum": 1,
+        "count": 3,
+        "min": -1,
+        "max": 2,
+    }
+
+
+def test_create_records_bulk_merges_rollups_of_written_batches(repositories):
+    record_repository = repositories.record_repository
+    # Given records of two days, of which the second batch fails to be written
+    records = [
+        Record(user_id=1, data={"mood": 1}, timestamp=datetime.datetime(2024, 3, day))
+        for day in [1, 2]
+    ]
+    insert_records = record_repository.insert_records
+
+    def insert_first_batch(batch):
+        if batch[0].timestamp.day == 2:
+            raise RuntimeError("write failed")
+        insert_records(batch)
+
+    record_repository.insert_records = insert_first_batch
+
+    # When writing them in batches of one
+    with pytest.raises(RuntimeError):
+        record_repository.create_records_bulk(records, batch_size=1)
+
+    # Then the rollup of the written batch has been merged
+    rollups = record_repository.find_daily_rollups(
+        1, datetime.date(2024, 3, 1), datetime.date(2024, 3, 2)
+    )
+    assert [rollup.date.day for rollup in rollups] == [1]
+
+
+def test_zeroes_inserts_neutral_records_in_bulk(repositories):
+    record_repository = repositories.record_repository
+    record_repository.insert_records = Mock(wraps=record_repository.insert_records)
+
+    # When backfilling a week of neutral records
+    record_repository.zeroes(datetime.date(2024, 3, 1), datetime.date(2024, 3, 7))
+
+    # Then the records are written in a single batch
+    assert record_repository.insert_records.call_count == 1
+    records = record_repository.find_records_for_user(1965256751)
+    assert [record.data for record in records] == [{"sleep": 8, "mood": 0}] * 7
+
+
+def test_create_records_bulk_writes_duplicate_records_once(repositories):
+    record_repository = repositories.record_repository
+    # Given a batch containing two records of the same user and timestamp
+    timestamp = datetime.datetime(2024, 3, 1, 12)
+    records = [
+        Record(user_id=1, data={"mood": mood}, timestamp=timestamp) for mood in [2, -1]
+    ]
+
+    # When writing them in bulk
+    result = record_repository.create_records_bulk(records)
+
+    # Then only the first one is written and rolled up
+    assert result.records == 1
+    assert [record.data for record in record_repository.find_records_for_user(1)] == [
+        {"mood": 2}
+    ]
+    day = datetime.date(2024, 3, 1)
+    rollup = record_repository.find_daily_rollups(1, day, day)[0]
+    assert rollup.record_count == 1
+    assert rollup.metrics["mood"].sum == 2
+
+
+def test_create_records_bulk_skips_existing_records(repositories):
+    record_repository = repositories.record_repository
+    # Given a record that has already been written
+    timestamp = datetime.datetime(2024, 3, 1, 12)
+    record_repository.create_record(1, {"mood": 0}, timestamp.isoformat())
+
+    # When writing a record with the same timestamp and a new one in bulk
+    result = record_repository.create_records_bulk(
+        [
+            Record(user_id=1, data={"mood": 2}, timestamp=timestamp),
+            Record(user_id=1, data={"mood": 1}, timestamp=timestamp.replace(hour=20)),
+        ]
+    )
+
+    # Then the existing record is kept and only the new one is rolled up
+    assert result.records == 1
+    records = record_repository.find_records_for_user(1)
+    assert [record.data for record in records] == [{"mood": 0}, {"mood": 1}]
+    day = datetime.date(2024, 3, 1)
+    rollup = record_repository.find_daily_rollups(1, day, day)[0]
+    assert rollup.record_count == 2
+    assert rollup.metrics["mood"].sum == 1
+
+
+def test_zeroes_can_be_run_again(repositories):
+    record_repository = repositories.record_repository
+    from_date, to_date = datetime.date(2024, 3, 1), datetime.date(2024, 3, 7)
+    record_repository.zeroes(from_date, to_date)
+
+    # When backfilling the same week again
+    record_repository.zeroes(from_date, to_date)
+
+    # Then no record is written or rolled up twice
+    assert len(record_repository.find_records_for_user(1965256751)) == 7
+    rollups = record_repository.find_daily_rollups(1965256751, from_date, to_date)
+    assert [rollup.record_count for rollup in rollups] == [1] * 7
@@ -40,24 +40,25 @@ async def test_message_gets_retried_three_times(update):
 
 @pytest.mark.asyncio
 async def test_reminder_gets_retried(context, notifier):
-    # Given that when send_from_context() is called for the first time, it raises a TimeoutError
+    # Given that when send_message() is called for the first time, it raises a TimeoutError
     context.bot.send_message.side_effect = [TimeoutError(), None]
 
-    # Exception does not have to be caught because of the retry decorator
-    await notifier.reminder(context, 1, "Hello!")
+    # When a reminder is sent
+    sent = await notifier.send_in_batches(context.bot, [(1, "Hello!")], "reminder")
 
-    # Then a message should be sent again
+    # Then the message should be sent again
+    assert sent == 1
     assert context.bot.send_message.call_count == 2
 
 
 @pytest.mark.asyncio
-async def test_reminder_gets_retried(context, notifier):
-    # Given that when send_from_context() is called for the first time, it raises a TimeoutError
+async def test_reminder_gets_retried_three_times(context, notifier):
+    # Given that when send_message() is called, it raises a TimeoutError
     context.bot.send_message.side_effect = TimeoutError()
 
-    # Exception does not have to be caught because of the retry decorator
-    with pytest.raises(RetryError):
-        await notifier.reminder(context, 1, "Hello!")
+    # When a reminder is sent, the failure is logged instead of raised
+    sent = await notifier.send_in_batches(context.bot, [(1, "Hello!")], "reminder")
 
-    # Then a message should be sent again
+    # Then the message should be tried three times
+    assert sent == 0
     assert context.bot.send_message.call_count == 3
@@ -0,0 +1,157 @@
+import pytest
+
+from src.config.config import Configuration
+from src.config.state_config import StateConfig
+from src.model.metric import Metric
+from src.model.record import TempRecord
+from src.repository.mongodb.indexes import ensure_indexes
+from src.state import DynamoDBStateStore, MongoDBStateStore, State, create_state_store
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
+
+
+@pytest.fixture
+def state_table(dynamodb):
+    table = dynamodb.create_table(
+        TableName="state",
+        KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    yield table
+    table.delete()
+
+
+@pytest.fixture(params=["mongodb", "dynamodb"])
+def database(request):
+    """
+    :return: a function creating a state store of the given namespace on the database.
+    """
+    if request.param == "mongodb":
+        mongo_client = request.getfixturevalue("mongo_client")
+        return lambda namespace, clock: MongoDBStateStore(
+            mongo_client, namespace, ttl_seconds=300, clock=clock
+        )
+    dynamodb = request.getfixturevalue("dynamodb")
+    request.getfixturevalue("state_table")
+    return lambda namespace, clock: DynamoDBStateStore(
+        dynamodb, namespace, ttl_seconds=300, clock=clock
+    )
+
+
+@pytest.fixture
+def store(database, clock):
+    return database("test", clock)
+
+
+def test_values_are_stored_until_they_expire(store, clock):
+    store[1] = State.RECORDING
+    assert store.get(1) is State.RECORDING
+    assert 1 in store
+
+    clock.now += 299
+    assert store[1] is State.RECORDING
+
+    clock.now += 1
+    assert store.get(1) is None
+    assert store.get(1, State.GRAPHING) is State.GRAPHING
+    with pytest.raises(KeyError):
+        store[1]
+
+
+def test_setting_a_value_resets_its_expiry(store, clock):
+    store[1] = State.RECORDING
+    clock.now += 200
+    store[1] = State.GRAPHING
+    clock.now += 200
+    assert store.get(1) is State.GRAPHING
+
+
+def test_values_are_deleted(store, clock):
+    store[1] = State.RECORDING
+    del store[1]
+    assert store.get(1) is None
+    with pytest.raises(KeyError):
+        del store[1]
+
+    # expired values cannot be deleted, as they are gone already
+    store[2] = State.RECORDING
+    clock.now += 300
+    assert not store.delete(2)
+
+
+def test_temporary_records_are_stored(store):
+    record = TempRecord(
+        [Metric(name="mood", user_prompt="How do you feel?", values={"good": 1})]
+    )
+    record.update_data("mood", 1)
+    store[1] = record
+    assert store[1].data == {"mood": 1}
+    assert store[1].metrics == record.metrics
+
+
+def test_expired_values_are_not_counted(store, clock):
+    for user_id in range(10):
+        store[user_id] = State.RECORDING
+        clock.now += 60
+    # entries set 300 seconds ago or earlier have expired
+    assert len(store) == 4
+
+
+def test_store_is_shared_between_replicas(database, clock):
+    # Given two replicas using the same database
+    first = database("temp_records", clock)
+    second = database("temp_records", clock)
+    other_namespace = database("application_state", clock)
+
+    # When one replica stores a value, the other one can read and delete it
+    first[1] = State.RECORDING
+    assert second[1] is State.RECORDING
+    assert other_namespace.get(1) is None
+    assert len(other_namespace) == 0
+    del second[1]
+    assert first.get(1) is None
+
+
+def test_mongodb_state_expires_through_ttl_index(mongo_client):
+    ensure_indexes(mongo_client)
+    index = mongo_client["mood_tracker"]["state"].index_information()["expires_at"]
+    assert index["expireAfterSeconds"] == 0
+
+
+def test_dynamodb_state_is_partitioned_per_user(dynamodb, state_table, clock):
+    store = DynamoDBStateStore(dynamodb, "temp_records", clock=clock)
+
+    store[1] = State.RECORDING
+
+    item = state_table.get_item(Key={"id": "temp_records:1"})["Item"]
+    assert item["namespace"] == "temp_records"
+    assert item["key"] == 1
+
+
+def test_database_state_store_is_created_from_configuration(mongo_client):
+    store = create_state_store(
+        StateConfig(backend="mongodb"), "temp_records", mongo_client
+    )
+    assert isinstance(store, MongoDBStateStore)
+    assert store.namespace == "temp_records"
+
+
+def test_state_must_be_stored_in_configured_database():
+    with pytest.raises(ValueError):
+        Configuration(
+            metrics=[],
+            database={"type": "mongodb"},
+            state={"backend": "dynamodb"},
+        )
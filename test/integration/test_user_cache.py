@@ -0,0 +1,164 @@
+from unittest.mock import Mock
+
+import pytest
+
+from src.handlers.record_handlers import baseline_handler
+from src.handlers.user_handlers import create_user, toggle_auto_baseline
+from src.repository.cached_user_repository import CachedUserRepository
+from src.repository.initialize import (
+    create_repository_executor,
+    initialize_async_repositories,
+)
+from src.service.user_service import UserService
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def cached_user_repository(repositories, clock):
+    return CachedUserRepository(
+        repositories.user_repository, max_size=2, ttl_seconds=60, clock=clock
+    )
+
+
+def test_repeated_lookups_are_served_from_cache(cached_user_repository):
+    # Given an existing user
+    cached_user_repository.create_user(1)
+    cached_user_repository.user_repository = Mock(
+        wraps=cached_user_repository.user_repository
+    )
+
+    # When the user is looked up repeatedly
+    for _ in range(3):
+        assert cached_user_repository.find_user(1).user_id == 1
+
+    # Then the database is only queried once
+    assert cached_user_repository.user_repository.find_user.call_count == 1
+    assert cached_user_repository.statistics()["hits"] == 2
+    assert cached_user_repository.statistics()["misses"] == 1
+
+
+def test_nonexistent_users_are_not_cached(cached_user_repository):
+    # Given a user that is looked up before they are registered
+    assert cached_user_repository.find_user(1) is None
+
+    # When the user is created
+    cached_user_repository.create_user(1)
+
+    # Then they can be found
+    assert cached_user_repository.find_user(1) is not None
+
+
+def test_update_invalidates_cached_user(cached_user_repository):
+    # Given a cached user
+    cached_user_repository.create_user(1)
+    user = cached_user_repository.find_user(1)
+
+    # When the user is updated
+    user.notifications = []
+    cached_user_repository.update_user(user)
+
+    # Then the updated user is returned
+    assert cached_user_repository.find_user(1).notifications == []
+
+
+def test_lookup_concurrent_to_update_does_not_cache_outdated_user(
+    cached_user_repository,
+):
+    # Given a lookup that retrieves the user before a concurrent update is persisted
+    cached_user_repository.create_user(1)
+    underlying_repository = cached_user_repository.user_repository
+    outdated_user = underlying_repository.find_user(1)
+
+    def find_user_during_update(user_id):
+        updated_user = outdated_user.model_copy(deep=True)
+        updated_user.notifications = []
+        cached_user_repository.update_user(updated_user)
+        return outdated_user
+
+    cached_user_repository.user_repository = Mock(wraps=underlying_repository)
+    cached_user_repository.user_repository.find_user.side_effect = (
+        find_user_during_update
+    )
+
+    # When the lookup completes after the update
+    cached_user_repository.find_user(1)
+
+    # Then the outdated user is not cached
+    assert 1 not in cached_user_repository.cache
+    cached_user_repository.user_repository = underlying_repository
+    assert cached_user_repository.find_user(1).notifications == []
+
+
+def test_modifying_returned_user_does_not_modify_cache(cached_user_repository):
+    # Given a cached user
+    cached_user_repository.create_user(1)
+    cached_user_repository.find_user(1)
+
+    # When the returned user is modified without being persisted
+    cached_user_repository.find_user(1).notifications = []
+
+    # Then the cache still holds the persisted state
+    assert cached_user_repository.find_user(1).notifications != []
+
+
+def test_cached_user_expires_after_ttl(cached_user_repository, clock):
+    # Given a cached user
+    cached_user_repository.create_user(1)
+    cached_user_repository.find_user(1)
+
+    # When the TTL elapses
+    clock.now += 61
+    cached_user_repository.find_user(1)
+
+    # Then the user is retrieved from the database again
+    assert cached_user_repository.statistics()["misses"] == 2
+
+
+def test_least_recently_used_user_is_evicted(cached_user_repository):
+    # Given a full cache
+    for user_id in [1, 2, 3]:
+        cached_user_repository.create_user(user_id)
+    cached_user_repository.find_user(1)
+    cached_user_repository.find_user(2)
+
+    # When another user is looked up
+    cached_user_repository.find_user(1)
+    cached_user_repository.find_user(3)
+
+    # Then the least recently used user is evicted
+    assert list(cached_user_repository.cache.keys()) == [1, 3]
+
+
+@pytest.mark.asyncio
+async def test_handlers_use_cache_through_alias(
+    update, cached_user_repository, repositories
+):
+    # Given the cache is registered as the user repository
+    cached_user_repository.register(alias="user_repository")
+    initialize_async_repositories(
+        cached_user_repository,
+        repositories.record_repository,
+        create_repository_executor(4),
+    )
+    UserService().register()
+
+    # When a user is created, auto-baseline is toggled and a baseline is recorded
+    await create_user(update, None)
+    await toggle_auto_baseline(update, None)
+    await baseline_handler(update, None)
+
+    # Then the toggle has invalidated the cached user
+    assert cached_user_repository.find_user(1).has_auto_baseline_enabled() is True
+    assert cached_user_repository.statistics()["hits"] > 0
@@ -189,3 +189,70 @@ async def test_metric_order_is_retained(update, repositories):
     # Then the order of the metrics should be retained
     for metric, db_metric in zip(metrics, db_metrics):
         assert OrderedDict(metric.values) == OrderedDict(db_metric.values)
+
+
+@pytest.mark.asyncio
+async def test_find_users(update, repositories):
+    user_repository = repositories.user_repository
+    # Given three users
+    for user_id in (1, 2, 3):
+        update.effective_user.id = user_id
+        await create_user(update, None)
+
+    # When two of them and a nonexistent user are retrieved at once
+    users = user_repository.find_users([1, 3, 4])
+
+    # Then the existing users are returned
+    assert sorted(user.user_id for user in users) == [1, 3]
+    assert users[0] == user_repository.find_user(users[0].user_id)
+
+
+@pytest.mark.asyncio
+async def test_iter_user_schedules_only_returns_scheduling_fields(
+    update, repositories, auto_baseline_config
+):
+    user_repository = repositories.user_repository
+    # Given two users, one of them with auto-baseline enabled
+    for user_id in (1, 2):
+        update.effective_user.id = user_id
+        await create_user(update, None)
+    user = user_repository.find_user(2)
+    user.auto_baseline_config = auto_baseline_config
+    user_repository.update_user(user)
+
+    # When the schedules are iterated in batches smaller than the number of users
+    schedules = sorted(
+        user_repository.iter_user_schedules(batch_size=1), key=lambda s: s.user_id
+    )
+
+    # Then every user is returned with their notifications and auto-baseline config
+    assert [schedule.user_id for schedule in schedules] == [1, 2]
+    assert schedules[0].get_notifications() == user.get_notifications()
+    assert schedules[0].has_auto_baseline_enabled() is False
+    assert schedules[1].has_auto_baseline_enabled() is True
+    assert schedules[1].get_auto_baseline_time() == auto_baseline_config.time
+
+
+@pytest.mark.asyncio
+async def test_schedule_jobs(
+    update, repositories, application, user_service, notifier, auto_baseline_config
+):
+    user_repository = repositories.user_repository
+    # Given two users with notifications, one of them with auto-baseline enabled
+    for user_id in (1, 2):
+        update.effective_user.id = user_id
+        await create_user(update, None)
+    user = user_repository.find_user(2)
+    user.auto_baseline_config = auto_baseline_config
+    user_repository.update_user(user)
+    jobs_before = len(application.application.job_queue.jobs())
+
+    # When the jobs are scheduled on startup
+    assert user_service.schedule_jobs(batch_size=1) == 2
+
+    # Then the reminders created on registration are replaced rather than duplicated,
+    # and one auto-baseline job is added
+    job_names = [job.name for job in application.application.job_queue.jobs()]
+    assert len(job_names) == jobs_before + 1
+    assert job_names.count("baselines_12:00:00") == 1
+    assert notifier.auto_baseline_slots["baselines_12:00:00"] == {2}
@@ -0,0 +1,38 @@
+import datetime
+
+from src.model.daily_rollup import aggregate_daily_rollups
+from src.model.record import Record
+from src.visualise import rollup_averages
+
+
+def records() -> list[Record]:
+    return [
+        Record(
+            user_id=1,
+            data={"mood": mood, "sleep": 8},
+            timestamp=datetime.datetime(2024, 3, day, hour),
+        )
+        for day, hour, mood in [(1, 8, 1), (1, 20, -2), (2, 12, 3), (4, 12, 0)]
+    ]
+
+
+def test_records_are_aggregated_per_day():
+    rollups = aggregate_daily_rollups(records())
+
+    assert [rollup.date.day for rollup in rollups] == [1, 2, 4]
+    assert rollups[0].record_count == 2
+    assert rollups[0].latest_timestamp == datetime.datetime(2024, 3, 1, 20)
+    assert rollups[0].metrics["mood"].model_dump() == {
+        "sum": -1,
+        "count": 2,
+        "min": -2,
+        "max": 1,
+    }
+
+
+def test_rollup_averages_are_daily_averages_of_records():
+    averages = rollup_averages(aggregate_daily_rollups(records()), ["mood", "sleep"])
+
+    assert averages["timestamp"].dt.day.tolist() == [1, 2, 4]
+    assert averages["mood"].tolist() == [-0.5, 3, 0]
+    assert averages["sleep"].tolist() == [8, 8, 8]
@@ -1,4 +1,5 @@
 import datetime
+import pickle
 
 import pytest
 
@@ -52,3 +53,47 @@ def test_update_data(temp_record):
 def test_update_data_raises_value_error(temp_record):
     with pytest.raises(ValueError):
         temp_record.update_data("unknown-metric", 1)
+
+
+@pytest.fixture
+def metrics() -> list[Metric]:
+    return [
+        Metric(name=f"metric-{i}", user_prompt="metric user prompt", values={"1": 1})
+        for i in range(1, 4)
+    ]
+
+
+def test_metrics_are_answered_in_any_order(metrics):
+    temp_record = TempRecord(metrics)
+    temp_record.update_data("metric-2", 1)
+    assert temp_record.next_unanswered_metric().name == "metric-1"
+
+    temp_record.update_data("metric-1", 1)
+    assert temp_record.next_unanswered_metric().name == "metric-3"
+    assert not temp_record.is_complete()
+
+    temp_record.update_data("metric-3", 1)
+    assert temp_record.is_complete()
+    assert temp_record.data == {"metric-1": 1, "metric-2": 1, "metric-3": 1}
+
+
+def test_records_with_same_metrics_share_definitions(metrics):
+    first, second = TempRecord(metrics), TempRecord(list(metrics))
+    assert first.definitions is second.definitions
+    # definitions are copied, so modifying the user's metrics does not affect them
+    metrics[0].user_prompt = "changed"
+    assert first.metrics[0].user_prompt == "metric user prompt"
+    assert TempRecord(metrics).definitions is not first.definitions
+
+
+def test_temp_record_has_no_instance_dict(temp_record):
+    assert not hasattr(temp_record, "__dict__")
+
+
+def test_temp_record_can_be_pickled(metrics):
+    temp_record = TempRecord(metrics)
+    temp_record.update_data("metric-1", 1)
+    unpickled = pickle.loads(pickle.dumps(temp_record))
+    assert unpickled.data == temp_record.data
+    assert unpickled.timestamp == temp_record.timestamp
+    assert unpickled.next_unanswered_metric().name == "metric-2"
@@ -0,0 +1,75 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.repository.async_repository import AsyncRecordRepository
+
+LATENCY = 0.2
+
+
+class SlowRecordRepository:
+    """
+    Stands in for a synchronous repository whose database round trips take LATENCY seconds.
+    """
+
+    def get_latest_record_for_user(self, user_id: int):
+        time.sleep(LATENCY)
+        return None
+
+
+def async_record_repository(max_workers: int) -> AsyncRecordRepository:
+    return AsyncRecordRepository(
+        SlowRecordRepository(), ThreadPoolExecutor(max_workers=max_workers)
+    )
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_do_not_serialize_behind_io():
+    repository = async_record_repository(max_workers=10)
+
+    # When ten coroutines query the database at the same time
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[repository.get_latest_record_for_user(user_id) for user_id in range(10)]
+    )
+    elapsed = time.perf_counter() - start
+
+    # Then they run concurrently instead of one after another
+    assert elapsed < 3 * LATENCY
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded_by_thread_pool():
+    repository = async_record_repository(max_workers=2)
+
+    # When four coroutines query the database with only two threads available
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[repository.get_latest_record_for_user(user_id) for user_id in range(4)]
+    )
+    elapsed = time.perf_counter() - start
+
+    # Then at most two queries run at the same time
+    assert elapsed >= 2 * LATENCY
+
+
+@pytest.mark.asyncio
+async def test_event_loop_stays_responsive_during_database_call():
+    repository = async_record_repository(max_workers=1)
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    # When a slow database call is made while another coroutine is running
+    ticker = asyncio.create_task(tick())
+    await repository.get_latest_record_for_user(1)
+    ticker.cancel()
+
+    # Then the other coroutine keeps being scheduled
+    assert ticks > 5
@@ -1,7 +1,11 @@
+from datetime import datetime
+
 import pytest
 
 from src.handlers.graphing import get_month_tuples_for_time_range
-from src.visualise import Month
+from src.model.daily_rollup import aggregate_daily_rollups
+from src.model.record import Record
+from src.visualise import Month, rollup_averages, slice_month
 
 
 @pytest.mark.asyncio
@@ -15,3 +19,28 @@ async def test_should_graph_for_correct_months():
         Month(2020, 12),
         Month(2021, 1),
     ] == get_month_tuples_for_time_range(3, 2021, 1)
+
+
+def test_slice_month_selects_days_of_month():
+    records = [
+        Record(user_id=1, data={"mood": day}, timestamp=datetime(2024, month, day))
+        for month in [1, 2, 3]
+        for day in [1, 15]
+    ]
+    daily_avg = rollup_averages(aggregate_daily_rollups(records), ["mood"])
+    assert len(slice_month(daily_avg, Month(2024, 2))) == 2
+    assert slice_month(daily_avg, Month(2024, 4)).empty
+
+
+def test_rollup_averages_are_built_from_typed_columns():
+    records = [
+        Record(user_id=1, data={"mood": mood}, timestamp=datetime(2024, 3, 1, hour))
+        for hour, mood in [(8, 1), (20, -2)]
+    ] + [Record(user_id=1, data={"sleep": 7}, timestamp=datetime(2024, 3, 2))]
+
+    daily_avg = rollup_averages(aggregate_daily_rollups(records), ["mood", "sleep"])
+
+    assert str(daily_avg["timestamp"].dtype) == "datetime64[s]"
+    assert str(daily_avg["mood"].dtype) == "float64"
+    assert daily_avg["mood"].tolist()[0] == -0.5
+    assert daily_avg["sleep"].isna().tolist() == [True, False]
@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytest
+
+from src.graph_cache import (
+    GraphCache,
+    GraphKey,
+    Fingerprint,
+    fingerprint_rollups,
+    hash_metrics,
+)
+from src.model.daily_rollup import aggregate_daily_rollups
+from src.model.metric import Metric
+from src.model.record import Record
+
+
+@pytest.fixture
+def cache() -> GraphCache:
+    return GraphCache(max_entries=2)
+
+
+def key(month: int) -> GraphKey:
+    return GraphKey(user_id=1, year=2024, month=month, metrics_hash="hash")
+
+
+def test_graph_is_served_for_same_fingerprint(cache):
+    fingerprint = Fingerprint(1, "2024-01-01T12:00:00")
+    cache.put(key(1), fingerprint, b"january")
+    assert cache.get(key(1), fingerprint) == b"january"
+    assert cache.statistics()["hits"] == 1
+
+
+def test_graph_is_not_served_for_changed_fingerprint(cache):
+    cache.put(key(1), Fingerprint(1, "2024-01-01T12:00:00"), b"january")
+    assert cache.get(key(1), Fingerprint(2, "2024-01-02T12:00:00")) is None
+    assert cache.statistics()["misses"] == 1
+
+
+def test_least_recently_used_graph_is_evicted(cache):
+    fingerprint = Fingerprint(1, "2024-01-01T12:00:00")
+    cache.put(key(1), fingerprint, b"january")
+    cache.put(key(2), fingerprint, b"february")
+    cache.get(key(1), fingerprint)
+    cache.put(key(3), fingerprint, b"march")
+
+    assert cache.get(key(2), fingerprint) is None
+    assert cache.get(key(1), fingerprint) == b"january"
+    assert cache.statistics()["size"] == 2
+    assert cache.statistics()["size_bytes"] == len(b"january") + len(b"march")
+
+
+def test_fingerprint_rollups():
+    records = [
+        Record(user_id=1, data={}, timestamp=datetime(2024, 1, 2)),
+        Record(user_id=1, data={}, timestamp=datetime(2024, 1, 5)),
+        Record(user_id=1, data={}, timestamp=datetime(2024, 1, 5, 8)),
+        Record(user_id=1, data={}, timestamp=datetime(2024, 2, 1)),
+    ]
+    assert fingerprint_rollups(aggregate_daily_rollups(records)) == {
+        (2024, 1): Fingerprint(3, "2024-01-05T08:00:00"),
+        (2024, 2): Fingerprint(1, "2024-02-01T00:00:00"),
+    }
+
+
+def test_metrics_hash_changes_with_metric_definition():
+    metric = Metric(name="mood", user_prompt="How are you?", values={"good": 1})
+    changed_metric = Metric(name="mood", user_prompt="How are you?", values={"ok": 0})
+    assert hash_metrics([metric]) == hash_metrics([metric.model_copy()])
+    assert hash_metrics([metric]) != hash_metrics([changed_metric])
@@ -0,0 +1,155 @@
+import datetime
+from unittest.mock import Mock
+
+import pytest
+from apscheduler.events import EVENT_JOB_SUBMITTED, JobSubmissionEvent
+
+from src.instrumentation import (
+    MetricsRegistry,
+    REPOSITORY_DURATION,
+    instrument_handler,
+    instrument_repository,
+    observe_job_lag,
+    HANDLER_DURATION,
+    HANDLER_ERRORS,
+    JOB_LAG,
+)
+from src.repository.user_repository import UserRepository
+
+
+def samples(metric) -> dict[tuple, float]:
+    return {
+        (name, tuple(sorted(labels.items()))): value
+        for name, labels, value in metric.samples()
+    }
+
+
+def test_histogram_exposition():
+    registry = MetricsRegistry()
+    histogram = registry.histogram(
+        "latency_seconds", "Latency.", ("handler",), buckets=(0.1, 1.0)
+    )
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, handler="record")
+
+    assert registry.render() == (
+        "# HELP latency_seconds Latency.\n"
+        "# TYPE latency_seconds histogram\n"
+        'latency_seconds_bucket{handler="record",le="0.1"} 2.0\n'
+        'latency_seconds_bucket{handler="record",le="1.0"} 3.0\n'
+        'latency_seconds_bucket{handler="record",le="+Inf"} 4.0\n'
+        'latency_seconds_sum{handler="record"} 2.65\n'
+        'latency_seconds_count{handler="record"} 4.0\n'
+    )
+
+
+def test_counter_and_callbacks():
+    registry = MetricsRegistry()
+    counter = registry.counter("errors_total", "Errors.", ("handler",))
+    counter.inc(handler="graph")
+    counter.inc(2, handler="graph")
+    registry.gauge_callback("queue_depth", "Queue depth.", lambda: 3)
+    registry.gauge_callback(
+        "entries", "Entries.", lambda: [({"store": 'temp "records"'}, 1)]
+    )
+
+    rendered = registry.render()
+    assert 'errors_total{handler="graph"} 3.0' in rendered
+    assert "# TYPE queue_depth gauge\nqueue_depth 3.0" in rendered
+    assert 'entries{store="temp \\"records\\""} 1.0' in rendered
+
+
+def test_failing_callback_is_omitted():
+    registry = MetricsRegistry()
+    registry.gauge_callback("broken", "Broken.", Mock(side_effect=RuntimeError))
+    registry.gauge_callback("working", "Working.", lambda: 1)
+
+    rendered = registry.render()
+    assert "broken" not in rendered
+    assert "working 1.0" in rendered
+
+
+def test_labels_must_match():
+    with pytest.raises(ValueError):
+        HANDLER_DURATION.observe(1.0, command="record")
+
+
+@pytest.mark.asyncio
+async def test_instrumented_handler():
+    async def failing_handler(update, context):
+        raise RuntimeError()
+
+    async def handler(update, context):
+        return update
+
+    errors_before = samples(HANDLER_ERRORS).get(
+        ("mood_tracker_handler_errors_total", (("handler", "test"),)), 0
+    )
+    assert await instrument_handler("test", handler)(1, None) == 1
+    with pytest.raises(RuntimeError):
+        await instrument_handler("test", failing_handler)(1, None)
+
+    observed = samples(HANDLER_DURATION)
+    assert (
+        observed[
+            ("mood_tracker_handler_duration_seconds_count", (("handler", "test"),))
+        ]
+        >= 2
+    )
+    assert (
+        samples(HANDLER_ERRORS)[
+            ("mood_tracker_handler_errors_total", (("handler", "test"),))
+        ]
+        == errors_before + 1
+    )
+
+
+def test_instrumented_repository():
+    @instrument_repository
+    class InMemoryUserRepository(UserRepository):
+        def find_user(self, user_id: int):
+            return None
+
+        def create_user(self, user_id: int):
+            pass
+
+        def update_user(self, user):
+            pass
+
+        def find_all_users(self):
+            return []
+
+        def iter_user_schedules(self, batch_size: int = 500):
+            yield from ()
+
+    repository = InMemoryUserRepository()
+    assert repository.find_user(1) is None
+    # inherited methods are timed as well
+    assert repository.find_users([1, 2]) == []
+
+    observed = samples(REPOSITORY_DURATION)
+    labels = (("method", "find_user"), ("repository", "InMemoryUserRepository"))
+    assert observed[("mood_tracker_repository_duration_seconds_count", labels)] == 3
+    labels = (("method", "find_users"), ("repository", "InMemoryUserRepository"))
+    assert observed[("mood_tracker_repository_duration_seconds_count", labels)] == 1
+    # generators and methods that are not part of the repository are not wrapped
+    assert not hasattr(InMemoryUserRepository.iter_user_schedules, "__wrapped__")
+    assert not hasattr(InMemoryUserRepository.register, "__wrapped__")
+
+
+def test_job_lag():
+    scheduler = Mock()
+    scheduler.get_job.return_value.name = "reminders_08:00:00"
+    scheduled = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        seconds=2
+    )
+
+    observe_job_lag(
+        scheduler, JobSubmissionEvent(EVENT_JOB_SUBMITTED, "id", "default", [scheduled])
+    )
+
+    observed = samples(JOB_LAG)
+    assert (
+        observed[("mood_tracker_job_lag_seconds_count", (("job", "reminders"),))] >= 1
+    )
+    assert observed[("mood_tracker_job_lag_seconds_sum", (("job", "reminders"),))] >= 2
@@ -0,0 +1,191 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from telegram.error import RetryAfter, TimedOut
+from tenacity import RetryError
+
+from src.message_dispatcher import MessageDispatcher
+from src.rate_limiter import RateLimiter
+
+
+def dispatcher(**kwargs) -> MessageDispatcher:
+    return MessageDispatcher(
+        rate_limiter=RateLimiter(messages_per_second=1000, per_chat_interval_seconds=0),
+        backoff_seconds=0.01,
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def bot():
+    bot = Mock()
+    bot.send_message = AsyncMock()
+    return bot
+
+
+@pytest.mark.asyncio
+async def test_messages_are_sent(bot):
+    message_dispatcher = dispatcher()
+
+    await asyncio.gather(
+        *(message_dispatcher.send(bot, chat_id, "Hello") for chat_id in range(100))
+    )
+
+    assert bot.send_message.call_count == 100
+    statistics = message_dispatcher.statistics()
+    assert statistics["sent"] == 100
+    assert statistics["queue_depth"] == 0
+    assert statistics["messages_per_second"] == 100 / 10
+    # workers exit once the queue is empty
+    await asyncio.sleep(0)
+    assert not message_dispatcher.interactive.tasks
+
+
+@pytest.mark.asyncio
+async def test_messages_are_edited(bot):
+    message_dispatcher = dispatcher()
+    bot.edit_message_text = AsyncMock()
+    keyboard = Mock()
+
+    await message_dispatcher.edit(bot, 1, 42, "Edited", reply_markup=keyboard)
+
+    bot.edit_message_text.assert_awaited_once_with(
+        chat_id=1, text="Edited", message_id=42, reply_markup=keyboard
+    )
+    bot.send_message.assert_not_called()
+    assert message_dispatcher.statistics()["sent"] == 1
+
+
+@pytest.mark.asyncio
+async def test_number_of_concurrent_sends_is_bounded(bot):
+    message_dispatcher = dispatcher(workers=4)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def send_message(**kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    bot.send_message.side_effect = send_message
+
+    sends = [message_dispatcher.send(bot, chat_id, "Hello") for chat_id in range(20)]
+    await asyncio.sleep(0)
+    assert message_dispatcher.statistics()["queue_depth"] == 0
+    await asyncio.gather(*sends)
+
+    assert max_in_flight == 4
+
+
+@pytest.mark.asyncio
+async def test_timeouts_are_retried_with_backoff(bot):
+    message_dispatcher = dispatcher()
+    bot.send_message.side_effect = [TimedOut(), TimeoutError(), None]
+
+    await message_dispatcher.send(bot, 1, "Hello")
+
+    assert bot.send_message.call_count == 3
+    assert message_dispatcher.statistics()["retries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_message_fails_after_max_attempts(bot):
+    message_dispatcher = dispatcher(max_attempts=3)
+    bot.send_message.side_effect = TimedOut()
+
+    with pytest.raises(RetryError):
+        await message_dispatcher.send(bot, 1, "Hello")
+
+    assert bot.send_message.call_count == 3
+    assert message_dispatcher.statistics()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_other_errors_are_not_retried(bot):
+    message_dispatcher = dispatcher()
+    bot.send_message.side_effect = ValueError("chat not found")
+
+    with pytest.raises(ValueError):
+        await message_dispatcher.send(bot, 1, "Hello")
+
+    assert bot.send_message.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_all_sends(bot):
+    message_dispatcher = dispatcher()
+    # Given that Telegram asks to retry after one second on the first message
+    bot.send_message.side_effect = [RetryAfter(1), None, None]
+
+    # When two messages are sent
+    start = time.monotonic()
+    await message_dispatcher.send(bot, 1, "Hello")
+    await message_dispatcher.send(bot, 2, "Hello")
+
+    # Then both are delivered after the requested pause
+    assert time.monotonic() - start >= 1
+    assert bot.send_message.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_interactive_messages_are_not_queued_behind_bulk_messages(bot):
+    message_dispatcher = MessageDispatcher(
+        rate_limiter=RateLimiter(messages_per_second=10, per_chat_interval_seconds=0),
+        bulk_workers=2,
+    )
+    # Given a backlog of reminders that takes seconds to send
+    reminders = asyncio.gather(
+        *(
+            message_dispatcher.send_bulk(bot, chat_id, "Reminder")
+            for chat_id in range(50)
+        )
+    )
+    await asyncio.sleep(0.1)
+
+    # When a reply is sent
+    start = time.monotonic()
+    await message_dispatcher.send(bot, 1000, "Reply")
+    elapsed = time.monotonic() - start
+
+    # Then it only waits for the reminders that are being sent, not for the whole backlog
+    assert elapsed < 0.5
+    assert message_dispatcher.statistics()["bulk_queue_depth"] > 30
+    tasks = list(message_dispatcher.bulk.tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    reminders.cancel()
+
+
+@pytest.mark.asyncio
+async def test_message_queued_while_last_worker_exits_is_sent(bot):
+    message_dispatcher = dispatcher(workers=1, bulk_workers=1)
+
+    async def send_one_after_another(send):
+        await send(bot, 1, "First")
+        # the caller resumes before the worker that sent the first message is done
+        await send(bot, 1, "Second")
+
+    # When a message is queued as soon as the previous one has been sent, i.e. while the only worker exits
+    await asyncio.wait_for(
+        send_one_after_another(message_dispatcher.send_bulk), timeout=1
+    )
+    await asyncio.wait_for(send_one_after_another(message_dispatcher.send), timeout=1)
+
+    # Then a new worker is started for it
+    assert bot.send_message.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_photos_are_sent(bot):
+    message_dispatcher = dispatcher()
+    bot.send_photo = AsyncMock()
+
+    await message_dispatcher.send_photo(bot, 1, b"graph")
+
+    bot.send_photo.assert_awaited_once_with(chat_id=1, photo=b"graph")
+    assert message_dispatcher.statistics()["sent"] == 1
@@ -0,0 +1,58 @@
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from src.handlers.metrics_handlers import (
+    build_metric_keyboard,
+    metric_keyboard,
+    precompute_keyboards,
+    prompt_user_for_metric,
+)
+from src.message_dispatcher import MessageDispatcher
+from src.model.metric import Metric
+
+
+def metric(values: dict[str, int]) -> Metric:
+    return Metric(name="mood", user_prompt="How do you feel?", values=values)
+
+
+def test_keyboard_buttons():
+    keyboard = metric_keyboard(metric({"very_good": 2, "okay": 0}))
+    buttons = [row[0] for row in keyboard.inline_keyboard]
+    assert [button.text for button in buttons] == ["Very good", "Okay"]
+    assert [button.callback_data for button in buttons] == ["mood:2", "mood:0"]
+
+
+def test_keyboard_is_shared_by_metrics_with_same_definition():
+    # metrics of different users are distinct objects, but have the same definition
+    keyboard = metric_keyboard(metric({"good": 1, "bad": -1}))
+    assert metric_keyboard(metric({"good": 1, "bad": -1})) is keyboard
+
+    # a user-specific override of the metric has its own keyboard
+    assert metric_keyboard(metric({"good": 2, "bad": -2})) is not keyboard
+
+
+def test_keyboards_are_precomputed():
+    build_metric_keyboard.cache_clear()
+    precompute_keyboards([metric({"good": 1}), metric({"bad": -1})])
+    assert build_metric_keyboard.cache_info().currsize == 2
+
+    metric_keyboard(metric({"good": 1}))
+    assert build_metric_keyboard.cache_info().misses == 2
+
+
+@pytest.mark.asyncio
+async def test_prompt_uses_cached_keyboard():
+    message_dispatcher = MessageDispatcher().register()
+    update = Mock()
+    update.effective_user.id = 1
+    update.effective_user.get_bot().send_message = AsyncMock()
+    prompted_metric = metric({"good": 1})
+
+    await prompt_user_for_metric(update, prompted_metric)
+
+    kwargs = update.effective_user.get_bot().send_message.call_args.kwargs
+    assert kwargs["reply_markup"] is metric_keyboard(prompted_metric)
+    assert kwargs["text"] == "How do you feel?"
+    # the prompt is rate-limited and retried like any other reply
+    assert message_dispatcher.sent == 1
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+from src.rate_limiter import RateLimiter
+
+
+@pytest.mark.asyncio
+async def test_burst_is_limited_to_rate():
+    rate_limiter = RateLimiter(messages_per_second=20, per_chat_interval_seconds=0)
+
+    # When twice as many messages as the rate allows are sent to distinct chats
+    start = time.monotonic()
+    await asyncio.gather(*(rate_limiter.acquire(chat_id) for chat_id in range(40)))
+    elapsed = time.monotonic() - start
+
+    # Then the first second worth of messages is sent immediately, and the rest at the configured rate
+    assert 0.9 <= elapsed < 2
+
+
+@pytest.mark.asyncio
+async def test_messages_to_same_chat_are_spaced():
+    rate_limiter = RateLimiter(
+        messages_per_second=100, per_chat_interval_seconds=0.2, per_chat_burst=1
+    )
+
+    # When three messages are sent to the same chat, and one to another chat
+    start = time.monotonic()
+    await asyncio.gather(*(rate_limiter.acquire(1) for _ in range(3)))
+    elapsed = time.monotonic() - start
+    other_chat_start = time.monotonic()
+    await rate_limiter.acquire(2)
+
+    # Then messages to the same chat wait for the interval, while other chats are not affected
+    assert 0.35 <= elapsed < 1
+    assert time.monotonic() - other_chat_start < 0.1
+
+
+@pytest.mark.asyncio
+async def test_chats_without_pending_messages_are_pruned():
+    rate_limiter = RateLimiter(messages_per_second=1000, per_chat_interval_seconds=0)
+    rate_limiter.PRUNE_THRESHOLD = 10
+
+    for chat_id in range(20):
+        await rate_limiter.acquire(chat_id)
+
+    assert len(rate_limiter.next_allowed) <= 10
+
+
+@pytest.mark.asyncio
+async def test_burst_to_same_chat_is_not_spaced():
+    rate_limiter = RateLimiter(
+        messages_per_second=100, per_chat_interval_seconds=0.2, per_chat_burst=3
+    )
+
+    # When five messages are sent to the same chat
+    start = time.monotonic()
+    await asyncio.gather(*(rate_limiter.acquire(1) for _ in range(3)))
+    burst_elapsed = time.monotonic() - start
+    await asyncio.gather(*(rate_limiter.acquire(1) for _ in range(2)))
+    elapsed = time.monotonic() - start
+
+    # Then the first three are sent at once, and the others wait for the interval
+    assert burst_elapsed < 0.1
+    assert 0.35 <= elapsed < 1
@@ -0,0 +1,169 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.config.state_config import StateConfig
+from src.model.metric import Metric
+from src.model.record import TempRecord
+from src.state import (
+    AsyncStateStore,
+    InMemoryStateStore,
+    SQLiteStateStore,
+    State,
+    create_state_store,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, clock, tmp_path):
+    if request.param == "memory":
+        return InMemoryStateStore(max_size=100, ttl_seconds=300, clock=clock)
+    return SQLiteStateStore(
+        str(tmp_path / "state.db"), "test", ttl_seconds=300, clock=clock
+    )
+
+
+def test_values_are_stored_until_they_expire(store, clock):
+    store[1] = State.RECORDING
+    assert store.get(1) is State.RECORDING
+    assert 1 in store
+
+    clock.now += 299
+    assert store[1] is State.RECORDING
+
+    clock.now += 1
+    assert store.get(1) is None
+    assert store.get(1, State.GRAPHING) is State.GRAPHING
+    with pytest.raises(KeyError):
+        store[1]
+
+
+def test_setting_a_value_resets_its_expiry(store, clock):
+    store[1] = State.RECORDING
+    clock.now += 200
+    store[1] = State.GRAPHING
+    clock.now += 200
+    assert store.get(1) is State.GRAPHING
+
+
+def test_values_are_deleted(store):
+    store[1] = State.RECORDING
+    del store[1]
+    assert store.get(1) is None
+    with pytest.raises(KeyError):
+        del store[1]
+
+
+def test_temporary_records_are_stored(store):
+    record = TempRecord(
+        [Metric(name="mood", user_prompt="How do you feel?", values={"good": 1})]
+    )
+    record.update_data("mood", 1)
+    store[1] = record
+    assert store[1].data == {"mood": 1}
+    assert store[1].metrics == record.metrics
+
+
+def test_expired_values_are_removed(store, clock):
+    for user_id in range(10):
+        store[user_id] = State.RECORDING
+        clock.now += 60
+    # entries set 300 seconds ago or earlier have expired
+    assert len(store) == 4
+
+
+def test_in_memory_store_evicts_entry_that_expires_next_when_full(clock):
+    store = InMemoryStateStore(max_size=2, ttl_seconds=300, clock=clock)
+    store[1] = State.RECORDING
+    store[2] = State.RECORDING
+    # user 1 is still active, so user 2 expires next
+    store[1] = State.GRAPHING
+    store[3] = State.RECORDING
+    assert store.get(1) is State.GRAPHING
+    assert store.get(2) is None
+    assert store.get(3) is State.RECORDING
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path, clock):
+    path = str(tmp_path / "state.db")
+    # Given two replicas using the same database
+    first = SQLiteStateStore(path, "temp_records", clock=clock)
+    second = SQLiteStateStore(path, "temp_records", clock=clock)
+    other_namespace = SQLiteStateStore(path, "application_state", clock=clock)
+
+    # When one replica stores a value, the other one can read and delete it
+    first[1] = State.RECORDING
+    assert second[1] is State.RECORDING
+    assert other_namespace.get(1) is None
+    del second[1]
+    assert first.get(1) is None
+
+
+def test_state_store_is_created_from_configuration(tmp_path):
+    assert isinstance(
+        create_state_store(StateConfig(max_size=5), "temp_records"),
+        InMemoryStateStore,
+    )
+    store = create_state_store(
+        StateConfig(backend="sqlite", sqlite_path=str(tmp_path / "state.db")),
+        "temp_records",
+    )
+    assert isinstance(store, SQLiteStateStore)
+    assert store.namespace == "temp_records"
+
+
+class ThreadRecordingStore(InMemoryStateStore):
+    """
+    Records the threads on which the store is called.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def get(self, key, default=None):
+        self.threads.add(threading.current_thread())
+        return super().get(key, default)
+
+    def set(self, key, value):
+        self.threads.add(threading.current_thread())
+        super().set(key, value)
+
+
+@pytest.mark.asyncio
+async def test_async_store_runs_blocking_calls_on_executor():
+    store = ThreadRecordingStore()
+    async_store = AsyncStateStore(store, ThreadPoolExecutor(max_workers=1))
+
+    # When a value is stored and read through the asynchronous facade
+    await async_store.set(1, State.RECORDING)
+    assert await async_store.get(1) is State.RECORDING
+    assert await async_store.delete(1)
+    assert await async_store.get(1, State.GRAPHING) is State.GRAPHING
+
+    # Then the store is not called on the thread of the event loop
+    assert threading.current_thread() not in store.threads
+
+
+@pytest.mark.asyncio
+async def test_async_store_without_executor_calls_store_directly():
+    store = ThreadRecordingStore()
+    async_store = AsyncStateStore(store)
+
+    await async_store.set(1, State.RECORDING)
+
+    assert store.threads == {threading.current_thread()}
@@ -0,0 +1,109 @@
+import asyncio
+import random
+from unittest.mock import Mock
+
+import pytest
+from telegram import Update
+
+from src.update_processor import PerUserUpdateProcessor
+
+
+def update_from(user_id: int) -> Update:
+    update = Mock(spec=Update)
+    update.effective_user.id = user_id
+    return update
+
+
+async def process(processor: PerUserUpdateProcessor, updates: list[tuple[Update, ...]]):
+    # the application starts one task per update in the order in which they were received
+    await asyncio.gather(
+        *(
+            asyncio.create_task(processor.process_update(update, coroutine))
+            for update, coroutine in updates
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_updates_of_a_user_are_processed_in_order():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+    processed: dict[int, list[int]] = {user_id: [] for user_id in range(4)}
+
+    async def handle(user_id: int, sequence_number: int):
+        await asyncio.sleep(random.uniform(0, 0.005))
+        processed[user_id].append(sequence_number)
+
+    await process(
+        processor,
+        [
+            (update_from(user_id), handle(user_id, sequence_number))
+            for sequence_number in range(20)
+            for user_id in range(4)
+        ],
+    )
+
+    assert all(sequence == list(range(20)) for sequence in processed.values())
+    # locks are released once a user has no more updates in flight
+    assert processor.locks == {}
+    assert processor.pending == {}
+
+
+@pytest.mark.asyncio
+async def test_updates_of_different_users_are_processed_concurrently():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=4)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def handle():
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    await process(
+        processor, [(update_from(user_id), handle()) for user_id in range(20)]
+    )
+
+    # concurrency is capped globally
+    assert max_in_flight == 4
+
+
+@pytest.mark.asyncio
+async def test_busy_user_does_not_occupy_capacity_of_others():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+    other_user_processed = asyncio.Event()
+    busy_user_processed = 0
+
+    async def handle_busy_user():
+        nonlocal busy_user_processed
+        await asyncio.sleep(0.01)
+        busy_user_processed += 1
+
+    async def handle_other_user():
+        other_user_processed.set()
+
+    updates = [(update_from(1), handle_busy_user()) for _ in range(10)]
+    updates.append((update_from(2), handle_other_user()))
+    task = asyncio.create_task(process(processor, updates))
+
+    # the other user is processed while the busy user's updates are still queued
+    await asyncio.wait_for(other_user_processed.wait(), timeout=0.05)
+    assert busy_user_processed < 10
+    await task
+
+
+@pytest.mark.asyncio
+async def test_updates_without_user_are_processed():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=1)
+    processed = []
+
+    async def handle():
+        processed.append(True)
+
+    await process(
+        processor,
+        [(object(), handle()), (Mock(spec=Update, effective_user=None), handle())],
+    )
+
+    assert len(processed) == 2
@@ -0,0 +1,250 @@
+import asyncio
+from unittest.mock import PropertyMock, patch
+
+import httpx
+import pytest
+import pytest_asyncio
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder
+
+from src.config.instrumentation_config import InstrumentationConfig
+from src.config.webhook_config import WebhookConfig
+from src.instrumentation import MetricsRegistry
+from src.webhook_server import (
+    MAX_HEADERS,
+    MAX_LINE_BYTES,
+    MetricsServer,
+    WebhookServer,
+)
+
+SECRET = "secret"
+
+
+def synthetic_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": 1,
+            "date": 1700000000,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "User"},
+            "text": "/record",
+        },
+    }
+
+
+@pytest.fixture
+def application() -> Application:
+    return ApplicationBuilder().token("some-token").build()
+
+
+@pytest_asyncio.fixture
+async def server(application):
+    server = WebhookServer(
+        application,
+        WebhookConfig(listen="127.0.0.1", port=0, secret_token=SECRET),
+    )
+    await server.start()
+    yield server
+    await server.stop()
+
+
+@pytest_asyncio.fixture
+async def client(server):
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{server.port}") as client:
+        yield client
+
+
+@pytest.mark.asyncio
+async def test_posted_updates_are_queued(application, client):
+    for update_id in range(3):
+        response = await client.post(
+            "/webhook",
+            json=synthetic_update(update_id),
+            headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+        )
+        assert response.status_code == 200
+
+    updates = [application.update_queue.get_nowait() for _ in range(3)]
+    assert all(isinstance(update, Update) for update in updates)
+    assert [update.update_id for update in updates] == [0, 1, 2]
+    assert updates[0].message.text == "/record"
+    assert updates[0].effective_user.id == 1
+
+
+@pytest.mark.asyncio
+async def test_updates_with_invalid_secret_are_rejected(application, client):
+    response = await client.post(
+        "/webhook",
+        json=synthetic_update(1),
+        headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"},
+    )
+    assert response.status_code == 403
+    response = await client.post("/webhook", json=synthetic_update(1))
+    assert response.status_code == 403
+    assert application.update_queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_invalid_updates_are_rejected(application, client):
+    response = await client.post(
+        "/webhook",
+        content=b"not json",
+        headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+    )
+    assert response.status_code == 400
+    for content in [b"null", b"[]", b'{"update_id": 1, "message": "text"}']:
+        response = await client.post(
+            "/webhook",
+            content=content,
+            headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+        )
+        assert response.status_code == 400
+    assert application.update_queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_unknown_routes(client):
+    assert (await client.get("/unknown")).status_code == 404
+    assert (await client.get("/webhook")).status_code == 405
+
+
+@pytest.mark.asyncio
+async def test_health(application, client):
+    response = await client.get("/health")
+    assert response.status_code == 503
+
+    with patch.object(
+        Application, "running", new_callable=PropertyMock, return_value=True
+    ):
+        response = await client.get("/health")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok", "update_queue": 0}
+
+
+def test_webhook_url_is_required_when_enabled():
+    with pytest.raises(ValueError):
+        WebhookConfig(enabled=True)
+    assert WebhookConfig(enabled=True, webhook_url="https://example.com/webhook")
+
+
+@pytest.mark.asyncio
+async def test_metrics_are_served():
+    registry = MetricsRegistry()
+    registry.gauge_callback("queue_depth", "Queue depth.", lambda: 3)
+    server = MetricsServer(InstrumentationConfig(listen="127.0.0.1", port=0), registry)
+    await server.start()
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{server.port}"
+        ) as client:
+            response = await client.get("/metrics")
+    finally:
+        await server.stop()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "queue_depth 3.0\n" in response.text
+
+
+@pytest_asyncio.fixture
+async def connect(server):
+    """
+    Opens raw connections to the server, e.g. to send incomplete requests.
+    """
+    writers = []
+
+    async def connect():
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        writers.append(writer)
+        return reader, writer
+
+    yield connect
+    for writer in writers:
+        writer.close()
+
+
+async def wait_for_close(reader: asyncio.StreamReader) -> bytes:
+    """
+    :return: everything the server sent until it closed the connection.
+    """
+    return await asyncio.wait_for(reader.read(), timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_connections_that_send_requests_slowly_are_closed(server, connect):
+    server.read_timeout_seconds = 0.2
+    reader, writer = await connect()
+
+    async def trickle():
+        writer.write(b"GET /health HTTP/1.1\r\n")
+        while True:
+            writer.write(b"X-Header: value\r\n")
+            await writer.drain()
+            await asyncio.sleep(0.05)
+
+    # When a client sends a request line, but trickles its headers without ever finishing them,
+    # then the server closes the connection
+    with pytest.raises(ConnectionError):
+        await asyncio.wait_for(trickle(), timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_idle_connections_are_closed(server, connect):
+    server.idle_timeout_seconds = 0.2
+    reader, _ = await connect()
+
+    # When a client connects, but never sends a request, the server closes the connection
+    assert await wait_for_close(reader) == b""
+
+
+@pytest.mark.asyncio
+async def test_requests_with_too_many_headers_are_rejected(connect):
+    reader, writer = await connect()
+
+    headers = "X-Header: value\r\n" * (MAX_HEADERS + 1)
+    writer.write(f"GET /health HTTP/1.1\r\n{headers}\r\n".encode())
+
+    assert (await wait_for_close(reader)).startswith(b"HTTP/1.1 400")
+
+
+@pytest.mark.asyncio
+async def test_requests_with_too_long_lines_are_rejected(connect):
+    reader, writer = await connect()
+
+    writer.write(
+        b"GET /health HTTP/1.1\r\nX-Header: " + b"a" * MAX_LINE_BYTES + b"\r\n\r\n"
+    )
+
+    assert (await wait_for_close(reader)).startswith(b"HTTP/1.1 400")
+
+
+@pytest.mark.asyncio
+async def test_chunked_requests_are_rejected(application, connect):
+    reader, writer = await connect()
+
+    # When a client posts an update with a chunked body
+    body = b'{"update_id": 1}'
+    writer.write(
+        b"POST /webhook HTTP/1.1\r\n"
+        b"X-Telegram-Bot-Api-Secret-Token: " + SECRET.encode() + b"\r\n"
+        b"Transfer-Encoding: chunked\r\n\r\n"
+        + f"{len(body):x}\r\n".encode()
+        + body
+        + b"\r\n0\r\n\r\n"
+    )
+
+    # Then it is rejected and the connection is closed instead of reading the chunks as the next request
+    response = await wait_for_close(reader)
+    assert response.startswith(b"HTTP/1.1 411")
+    assert response.count(b"HTTP/1.1") == 1
+    assert application.update_queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_unsupported_transfer_codings_are_rejected(connect):
+    reader, writer = await connect()
+
+    writer.write(b"POST /webhook HTTP/1.1\r\nTransfer-Encoding: gzip\r\n\r\n")
+
+    assert (await wait_for_close(reader)).startswith(b"HTTP/1.1 501")